@@ -152,14 +152,21 @@ test_ids = [
 # Test ACL permissions with 2 authenticated clients. This covers both bucket-level
 # and object-level ACLs, verifying that the second client can only perform operations
 # they are explicitly allowed to.
+#
+# The cases of the same ACL share one versioned bucket, reset between them, and run on the
+# same xdist worker with `--dist loadgroup`.
+@pytest.mark.reuse_fixtures("acl_name")
 @pytest.mark.parametrize(
     "multiple_s3_clients, acl_name, method_name, expected_status_code",
-    [({"number_clients": 2}, acl, method, status) for acl, method, status in test_cases],
+    [
+        pytest.param({"number_clients": 2}, acl, method, status, marks=pytest.mark.xdist_group(f"acl-{acl}"))
+        for acl, method, status in test_cases
+    ],
     indirect=['multiple_s3_clients'],  # Indicate 'multiple_s3_clients' is a fixture
     ids=test_ids,  # Provide descriptive IDs for the test cases
 )
-def test_acl_operations(multiple_s3_clients, versioned_bucket_with_one_object, acl_name, method_name, expected_status_code):
-    bucket_name, obj_key, obj_version = versioned_bucket_with_one_object
+def test_acl_operations(multiple_s3_clients, shared_versioned_bucket_with_one_object, acl_name, method_name, expected_status_code):
+    bucket_name, obj_key, obj_version = shared_versioned_bucket_with_one_object
 
     # Set the bucket-level ACL
     s3_owner = multiple_s3_clients[0]
@@ -6,6 +6,7 @@ import yaml
 import logging
 import subprocess
 import shutil
+import tempfile
 
 from s3_helpers import (
     generate_unique_bucket_name,
@@ -21,41 +22,397 @@ from s3_helpers import (
     replace_failed_put_without_version,
     put_object_lock_configuration_with_determination,
     probe_versioning_status,
+    reset_versioned_bucket,
 )
+from utils.crud import delete_objects_in_batches
+from utils.clients import ClientRegistry
+from utils.metrics import RequestRecorder
+from utils.metrics_report import MetricsReport
+from utils.consistency import convergence_results, summarize_convergence, format_convergence_summary
+from utils.bucket_pool import BucketPool, SharedBucketPool, VERSIONED, LOCK
+from utils.teardown import DeferredTeardown, defer_or_run
+from utils.local_s3 import LocalS3Server
+from utils.faults import FaultInjector
+from utils import cassette
+from utils.durations import DurationHistory, DurationScheduling, marker_estimate
+from utils.time_budget import TimeBudget
+from utils.shared_fixtures import ResettableFixture, reuse_key, group_by_reuse_key
+from utils.tenants import TenantCache, DEFAULT_TTL
+from utils.params import TestParams
+from utils import bucket_registry
 from datetime import datetime, timedelta
 from botocore.exceptions import ClientError
 
 
+client_registry_key = pytest.StashKey[ClientRegistry]()
+request_recorder_key = pytest.StashKey[RequestRecorder]()
+bucket_pool_key = pytest.StashKey[BucketPool]()
+deferred_teardown_key = pytest.StashKey[DeferredTeardown]()
+local_s3_key = pytest.StashKey[LocalS3Server]()
+fault_injector_key = pytest.StashKey[FaultInjector]()
+duration_history_key = pytest.StashKey[DurationHistory]()
+time_budget_key = pytest.StashKey[TimeBudget]()
+# summary of the time budget selection of an xdist worker, on the controller
+time_budget_summary_key = pytest.StashKey[str]()
+tenant_cache_key = pytest.StashKey[TenantCache]()
+test_params_key = pytest.StashKey[TestParams]()
+bucket_registry_key = pytest.StashKey[bucket_registry.BucketRegistry]()
+
+# fixtures served by the bucket pool, and the kind of bucket each one takes
+POOLED_FIXTURES = {
+    "versioned_bucket_with_one_object": VERSIONED,
+    "lockeable_bucket_name": VERSIONED,
+    "bucket_with_lock": LOCK,
+}
+
 def pytest_addoption(parser):
     parser.addoption("--config", action="store", help="Path to the YAML config file")
+    parser.addoption("--request-metrics-raw", action="store", help="Path of a CSV file to export every recorded request")
+    parser.addoption("--metrics-dir", action="store", help="Directory where OpenMetrics (.prom) and JSON run metrics are written")
+    parser.addoption("--bucket-pool", action="store", type=int, default=0, help="Prepare versioned and lock-enabled buckets in the background, keeping this many of each kind ahead of the tests, shared by xdist workers (0 disables the pool)")
+    parser.addoption("--deferred-teardown", action="store_true", help="Run bucket and object deletions of the fixtures in background threads, drained at session end")
+    parser.addoption("--fault-profile", action="store", help="Path to a YAML fault profile (see utils/faults.py and params/faults/) injecting errors and latency into every registry client")
+    parser.addoption("--cassette-mode", action="store", choices=cassette.MODES, default=os.environ.get("CASSETTE_MODE", "off"), help="Record the HTTP exchanges of each test to a cassette, or replay them offline (default: $CASSETTE_MODE or off)")
+    parser.addoption("--cassette-dir", action="store", default=os.environ.get("CASSETTE_DIR", os.path.join(os.path.dirname(__file__), "cassettes")), help="Directory of the cassettes, one json file per test (default: $CASSETTE_DIR or docs/cassettes)")
+    parser.addoption("--durations-db", action="store", default=os.path.join(os.path.dirname(__file__), ".durations.sqlite"), help="SQLite file keeping the duration of each test per config file (empty to disable)")
+    parser.addoption("--schedule-by-duration", action="store_true", help="With xdist, run the longest tests first on whichever worker is free, using the durations db (or the rapid/regular/slow markers)")
+    parser.addoption("--time-budget", action="store", type=float, help="Seconds the run may take: run the tests that fit, estimated from the durations db (or the rapid/regular/slow markers), keeping at least one test of each feature marker")
+    parser.addoption("--tenant-cache", action="store", default=os.path.join(os.path.dirname(__file__), ".tenants.sqlite"), help="SQLite file caching the tenant (owner ID) of each account across runs and xdist workers (empty to keep it in memory)")
+    parser.addoption("--tenant-cache-ttl", action="store", type=float, default=DEFAULT_TTL, help="Seconds a tenant cached on disk is trusted")
+    parser.addoption("--bucket-registry", action="store", default=os.path.join(os.path.dirname(__file__), ".buckets.sqlite"), help="SQLite file recording the buckets created by the specs, so cleanups do not list the whole account (empty to disable)")
+    parser.addoption("--bucket-registry-reconcile", action="store", type=float, default=bucket_registry.DEFAULT_RECONCILE_INTERVAL, help="Minimum seconds between two listings of an account to reconcile the bucket registry")
+    parser.addoption("--benchmark-trials", action="store", type=int, default=10, help="Number of trials of each consistency benchmark measurement")
+
+def get_config_path(config):
+    return config.getoption("--config") or os.environ.get("CONFIG_PATH", "../params.example.yaml")
+
+def load_params(config):
+    """
+    Params of the session, parsed and validated once (see utils/params.py).
+    """
+    params = config.stash.get(test_params_key, None)
+    if params is None:
+        path = get_config_path(config)
+        try:
+            params = TestParams.from_yaml(path)
+        except (ValueError, yaml.YAMLError) as e:
+            raise pytest.UsageError(f"Invalid params {path}: {e}")
+        config.stash[test_params_key] = params
+    return params
+
+def config_name(config):
+    return os.path.splitext(os.path.basename(get_config_path(config)))[0]
+
+def is_xdist_controller(config):
+    """
+    True in the process that distributes the tests to pytest-xdist workers, and runs none itself.
+    """
+    return not hasattr(config, "workerinput") and bool(getattr(config.option, "numprocesses", None))
 
-@pytest.fixture
+def run_labels(config):
+    """
+    Profile and region of the default profile, used to label the run metrics.
+    """
+    profile = load_params(config).default_profile
+    region = profile.region_name
+    if not region and profile.profile_name:
+        try:
+            region = boto3.Session(profile_name=profile.profile_name).region_name
+        except Exception as e:
+            logging.warning(f"Could not resolve the region of profile {profile.profile_name}: {e}")
+    return {
+        "profile": profile.name,
+        "region": region or "unknown",
+        "config": config_name(config),
+    }
+
+def pytest_configure(config):
+    if os.path.exists(get_config_path(config)):
+        # malformed params fail the session here, before any test runs
+        params = load_params(config)
+        # params with a local_s3 record point to the local S3 stand-in, served by the controller
+        # process for the whole run (xdist workers reach it through the same endpoint)
+        if params.local_s3 and not hasattr(config, "workerinput"):
+            config.stash[local_s3_key] = LocalS3Server(**params.local_s3).start()
+    if config.getoption("--cassette-mode") != "off" and (
+        config.getoption("--bucket-pool") or config.getoption("--deferred-teardown")
+    ):
+        # their requests run on background threads, outside of the test that owns the cassette
+        raise pytest.UsageError("--cassette-mode cannot be combined with --bucket-pool or --deferred-teardown")
+    registry_db = config.getoption("--bucket-registry")
+    # cassettes hold the listings of the cleanups, replaying them needs the same requests
+    if registry_db and config.getoption("--cassette-mode") == "off":
+        created_buckets = bucket_registry.BucketRegistry(registry_db, config.getoption("--bucket-registry-reconcile"))
+        config.stash[bucket_registry_key] = created_buckets
+        bucket_registry.activate(created_buckets)
+    durations_db = config.getoption("--durations-db")
+    if durations_db:
+        config.stash[duration_history_key] = DurationHistory(durations_db)
+    elif config.getoption("--schedule-by-duration"):
+        raise pytest.UsageError("--schedule-by-duration needs a --durations-db")
+    if (config.getoption("--time-budget") and is_xdist_controller(config)
+            and not config.getoption("--schedule-by-duration")
+            and config.getoption("dist", "load") not in ("loadscope", "loadgroup", "loadfile")):
+        config.issue_config_time_warning(pytest.PytestConfigWarning(
+            "--time-budget orders the tests so module fixtures are shared, "
+            "run with --dist loadscope or loadgroup for xdist to keep that order"
+        ), stacklevel=2)
+    fault_profile = config.getoption("--fault-profile")
+    if fault_profile:
+        try:
+            config.stash[fault_injector_key] = FaultInjector.from_yaml(fault_profile)
+        except (OSError, ValueError, KeyError) as e:
+            raise pytest.UsageError(f"Invalid --fault-profile {fault_profile}: {e}")
+    metrics_dir = config.getoption("--metrics-dir")
+    # the requests are made by the xdist workers, each one writes its own files and the controller none
+    if metrics_dir and not is_xdist_controller(config):
+        report = MetricsReport(metrics_dir, run_labels(config), lambda: config.stash.get(request_recorder_key, None))
+        config.pluginmanager.register(report, "s3-specs-metrics-report")
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_xdist_make_scheduler(config, log):
+    if config.getoption("--schedule-by-duration"):
+        return DurationScheduling(config, log, config.stash[duration_history_key], config_name(config))
+    return None
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(config, items):
+    # tests sharing resettable fixtures run back to back
+    items[:] = group_by_reuse_key(items)
+    history = config.stash.get(duration_history_key, None)
+    budget = config.getoption("--time-budget")
+    if budget:
+        # every xdist worker makes the same choice, the history only changes at the end of the run
+        time_budget = TimeBudget(budget, int(os.environ.get("PYTEST_XDIST_WORKER_COUNT", 1)))
+        selected, deselected = time_budget.select(items, history.durations(config_name(config)) if history else None)
+        if deselected:
+            config.hook.pytest_deselected(items=deselected)
+        items[:] = selected
+        config.stash[time_budget_key] = time_budget
+        logging.info(f"[time_budget] {time_budget.summary()}")
+    # the xdist controller does not collect, one worker stores the marker estimates for its scheduler
+    workerinput = getattr(config, "workerinput", None)
+    if history and config.getoption("--schedule-by-duration") and workerinput and workerinput["workerid"] == "gw0":
+        history.store_marker_estimates(config_name(config), {item.nodeid: marker_estimate(item) for item in items})
+
+def pytest_runtest_logreport(report):
+    durations = _test_durations.get(report.nodeid)
+    if durations is None:
+        durations = _test_durations[report.nodeid] = {"seconds": 0.0, "ran": False}
+    durations["seconds"] += report.duration
+    if report.when == "call" and not report.skipped:
+        durations["ran"] = True
+
+# durations of the tests of this process, by node id
+_test_durations = {}
+
+def pytest_sessionfinish(session):
+    config = session.config
+    time_budget = config.stash.get(time_budget_key, None)
+    if time_budget and hasattr(config, "workeroutput"):
+        # the workers select the tests, the controller reports the selection
+        config.workeroutput["time_budget"] = time_budget.summary()
+    history = config.stash.get(duration_history_key, None)
+    # the controller (or the only process) receives the reports of every test and writes them once,
+    # replayed cassettes do not measure the backend
+    if not history or hasattr(config, "workerinput") or config.getoption("--cassette-mode") == "replay":
+        return
+    ran = {nodeid: durations["seconds"] for nodeid, durations in _test_durations.items() if durations["ran"]}
+    if ran:
+        history.record(config_name(config), ran)
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    summary = getattr(node, "workeroutput", {}).get("time_budget")
+    if summary:
+        node.config.stash[time_budget_summary_key] = summary
+
+def pytest_unconfigure(config):
+    if config.stash.get(bucket_registry_key, None):
+        bucket_registry.activate(None)
+    server = config.stash.get(local_s3_key, None)
+    if server:
+        server.stop()
+
+def pytest_terminal_summary(terminalreporter, config):
+    registry = config.stash.get(client_registry_key, None)
+    if registry:
+        terminalreporter.write_line(registry.summary())
+    time_budget = config.stash.get(time_budget_key, None)
+    time_budget_summary = time_budget.summary() if time_budget else config.stash.get(time_budget_summary_key, None)
+    if time_budget_summary:
+        terminalreporter.write_line(time_budget_summary)
+    created_buckets = config.stash.get(bucket_registry_key, None)
+    if created_buckets and (created_buckets.registered or created_buckets.cleanups):
+        terminalreporter.write_line(created_buckets.summary())
+    tenant_cache = config.stash.get(tenant_cache_key, None)
+    if tenant_cache:
+        terminalreporter.write_line(tenant_cache.summary())
+    fault_injector = config.stash.get(fault_injector_key, None)
+    if fault_injector:
+        terminalreporter.write_line(fault_injector.summary())
+    pool = config.stash.get(bucket_pool_key, None)
+    if pool:
+        terminalreporter.write_line(pool.summary())
+    deferred_teardown = config.stash.get(deferred_teardown_key, None)
+    if deferred_teardown:
+        terminalreporter.write_line(deferred_teardown.summary())
+        for description, error in deferred_teardown.failures:
+            terminalreporter.write_line(f"teardown failed: {description}: {error}", red=True)
+    recorder = config.stash.get(request_recorder_key, None)
+    if recorder and recorder.operations:
+        terminalreporter.write_sep("-", "request metrics")
+        terminalreporter.write_line(recorder.format_summary())
+        raw_path = config.getoption("--request-metrics-raw")
+        if raw_path:
+            recorder.export_csv(raw_path)
+    convergence = convergence_results()
+    if convergence:
+        terminalreporter.write_sep("-", "consistency waits")
+        terminalreporter.write_line(format_convergence_summary(summarize_convergence(convergence)))
+
+@pytest.fixture(scope="session")
+def request_recorder(request):
+    """
+    Session-wide recorder of every request made by the registry clients.
+    """
+    recorder = RequestRecorder()
+    request.config.stash[request_recorder_key] = recorder
+    return recorder
+
+@pytest.fixture(autouse=True)
+def request_metrics(request, request_recorder):
+    """
+    Logs a per-operation latency summary of the requests made during each test.
+    """
+    mark = request_recorder.mark()
+    yield
+    summary = request_recorder.summary(since=mark)
+    if summary:
+        request.node.user_properties.append(("request_metrics", summary))
+        logging.info(f"[request_metrics] {request.node.name}\n{request_recorder.format_summary(since=mark)}")
+
+@pytest.fixture(autouse=True)
+def http_cassette(request):
+    """
+    Records or replays the HTTP exchanges of each test (--cassette-mode), see utils/cassette.py.
+    """
+    mode = request.config.getoption("--cassette-mode")
+    if mode == "off":
+        yield None
+        return
+    path = cassette.cassette_path(request.config.getoption("--cassette-dir"), request.node.nodeid)
+    if mode == "replay" and not os.path.exists(path):
+        pytest.fail(f"No cassette {path} for {request.node.nodeid}, record it with --cassette-mode record")
+    with cassette.use_cassette(path, mode) as test_cassette:
+        yield test_cassette
+
+@pytest.fixture(scope="session")
+def s3_client_registry(request, request_recorder):
+    """
+    Session-wide cache of boto3 clients, one per profile (and pool size).
+    """
+    client_hooks = [lambda client, profile: request_recorder.attach(client)]
+    fault_injector = request.config.stash.get(fault_injector_key, None)
+    if fault_injector:
+        # attached first, so the recorder times the injected delays
+        client_hooks.insert(0, lambda client, profile: fault_injector.attach(client))
+    if request.config.getoption("--cassette-mode") != "off":
+        client_hooks.insert(0, lambda client, profile: cassette.attach(client))
+    created_buckets = request.config.stash.get(bucket_registry_key, None)
+    if created_buckets:
+        client_hooks.append(lambda client, profile: created_buckets.attach(client, profile.effective_lock_mode))
+    registry = ClientRegistry(client_hooks=client_hooks)
+    request.config.stash[client_registry_key] = registry
+    yield registry
+    registry.close()
+
+@pytest.fixture(scope="session", autouse=True)
+def bucket_pool(request, s3_client_registry):
+    """
+    Session-wide pool of versioned and lock-enabled buckets prepared in the background (--bucket-pool),
+    None when the pool is disabled. Autouse so the preparation starts with the session.
+    """
+    spares = request.config.getoption("--bucket-pool")
+    if not spares:
+        yield None
+        return
+
+    # how many buckets of each kind the collected tests will take
+    demand = {}
+    for item in request.session.items:
+        for fixture_name, kind in POOLED_FIXTURES.items():
+            if fixture_name in getattr(item, "fixturenames", ()):
+                demand[kind] = demand.get(kind, 0) + 1
+
+    profile = load_params(request.config).default_profile
+    pool_args = (s3_client_registry.client_for(profile), profile.effective_lock_mode, demand)
+
+    # pytest-xdist workers share one pool through a SQLite file of the run
+    testrun_uid = os.environ.get("PYTEST_XDIST_TESTRUNUID")
+    if testrun_uid:
+        run_dir = os.path.join(tempfile.gettempdir(), f"s3-specs-{testrun_uid}")
+        os.makedirs(run_dir, exist_ok=True)
+        pool = SharedBucketPool(
+            *pool_args,
+            db_path=os.path.join(run_dir, "bucket_pool.sqlite"),
+            worker=os.environ.get("PYTEST_XDIST_WORKER", "main"),
+            run_workers=[f"gw{index}" for index in range(int(os.environ.get("PYTEST_XDIST_WORKER_COUNT", 1)))],
+            spares=spares,
+        )
+    else:
+        pool = BucketPool(*pool_args, spares=spares)
+    request.config.stash[bucket_pool_key] = pool
+    yield pool
+    pool.close()
+
+@pytest.fixture(scope="session")
+def tenant_cache(request):
+    """
+    Session-wide cache of the tenant of each account, None with --cassette-mode
+    (a cassette must hold the listing of the test that needs the tenant).
+    """
+    if request.config.getoption("--cassette-mode") != "off":
+        return None
+    cache = TenantCache(request.config.getoption("--tenant-cache") or None, request.config.getoption("--tenant-cache-ttl"))
+    request.config.stash[tenant_cache_key] = cache
+    return cache
+
+@pytest.fixture(scope="session")
+def deferred_teardown(request, s3_client_registry):
+    """
+    Session-wide queue of background teardowns (--deferred-teardown), None when disabled.
+    Drained before the registry clients are closed.
+    """
+    if not request.config.getoption("--deferred-teardown"):
+        yield None
+        return
+    teardown = DeferredTeardown()
+    request.config.stash[deferred_teardown_key] = teardown
+    yield teardown
+    teardown.drain()
+
+@pytest.fixture(scope="session")
 def test_params(request):
     """
-    Loads test parameters from a config file or environment variable.
+    Test parameters from a config file or environment variable, parsed once per session (utils/params.py).
     """
-    config_path = request.config.getoption("--config") or os.environ.get("CONFIG_PATH", "../params.example.yaml")
-    with open(config_path, "r") as f:
-        return yaml.safe_load(f)
+    return load_params(request.config)
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def default_profile(test_params):
     """
     Returns the default profile from test parameters.
     """
-    return test_params["profiles"][test_params.get("default_profile_index", 0)]
+    return test_params.default_profile
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def lock_mode(default_profile):
-    return default_profile.get("lock_mode", "COMPLIANCE")
+    return default_profile.effective_lock_mode
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def profile_name(default_profile):
-    return (
-        default_profile.get("profile_name")
-        if default_profile.get("profile_name")
-        else pytest.skip("This test requires a profile name")
-    )
+    return default_profile.profile_name or pytest.skip("This test requires a profile name")
 
 @pytest.fixture
 def mgc_path(default_profile):
@@ -84,22 +441,14 @@ def active_mgc_workspace(profile_name, mgc_path):
     return profile_name
 
 @pytest.fixture
-def s3_client(default_profile):
+def s3_client(default_profile, s3_client_registry):
     """
-    Creates a boto3 S3 client using profile credentials or explicit config.
+    Returns the session-cached boto3 S3 client of the default profile (profile credentials or explicit config).
     """
-    if "profile_name" in default_profile:
-        session = boto3.Session(profile_name=default_profile["profile_name"])
-    else:
-        session = boto3.Session(
-            region_name=default_profile["region_name"],
-            aws_access_key_id=default_profile["aws_access_key_id"],
-            aws_secret_access_key=default_profile["aws_secret_access_key"],
-        )
-    return session.client("s3", endpoint_url=default_profile.get("endpoint_url"))
+    return s3_client_registry.client_for(default_profile)
 
 @pytest.fixture
-def bucket_name(request, s3_client):
+def bucket_name(request, s3_client, deferred_teardown):
     test_name = request.node.name.replace("_", "-")
     unique_name = generate_unique_bucket_name(base_name=f"{test_name}")
 
@@ -107,10 +456,10 @@ def bucket_name(request, s3_client):
     yield unique_name
 
     # Teardown: delete the bucket after the test
-    delete_bucket_and_wait(s3_client, unique_name)
+    defer_or_run(deferred_teardown, f"bucket {unique_name}", lambda: delete_bucket_and_wait(s3_client, unique_name))
 
 @pytest.fixture
-def existing_bucket_name(s3_client):
+def existing_bucket_name(s3_client, deferred_teardown):
     # Generate a unique name for the bucket to simulate an existing bucket
     bucket_name = generate_unique_bucket_name(base_name="existing-bucket")
 
@@ -119,15 +468,14 @@ def existing_bucket_name(s3_client):
 
     # Yield the existing bucket name to the test
     yield bucket_name
-    
-    objects = s3_client.list_objects(Bucket=bucket_name).get("Contents", [])
 
-    if objects:
-        for obj in objects:
-            s3_client.delete_object(Bucket=bucket_name, Key=obj["Key"])
-    
-    # Teardown: delete the bucket after the test
-    delete_bucket_and_wait(s3_client, bucket_name)
+    # Teardown: empty the bucket with DeleteObjects batches, then delete the bucket
+    defer_or_run(
+        deferred_teardown,
+        f"bucket {bucket_name}",
+        lambda: delete_objects_in_batches(s3_client, bucket_name),
+        lambda: delete_bucket_and_wait(s3_client, bucket_name),
+    )
     
 @pytest.fixture
 def create_multipart_object_files():
@@ -177,7 +525,7 @@ def create_big_file_with_two_parts():
 
 
 @pytest.fixture
-def bucket_with_one_object_and_cold_storage_class(s3_client):
+def bucket_with_one_object_and_cold_storage_class(s3_client, deferred_teardown):
     # Generate a unique bucket name and ensure it exists
     bucket_name = generate_unique_bucket_name(base_name="fixture-bucket")
     create_bucket_and_wait(s3_client, bucket_name)
@@ -191,10 +539,14 @@ def bucket_with_one_object_and_cold_storage_class(s3_client):
     yield bucket_name, object_key, content
 
     # Teardown: Delete the object and bucket after the test
-    delete_object_and_wait(s3_client, bucket_name, object_key)
-    delete_bucket_and_wait(s3_client, bucket_name)
+    defer_or_run(
+        deferred_teardown,
+        f"bucket {bucket_name}",
+        lambda: delete_object_and_wait(s3_client, bucket_name, object_key),
+        lambda: delete_bucket_and_wait(s3_client, bucket_name),
+    )
 @pytest.fixture
-def bucket_with_one_object(s3_client):
+def bucket_with_one_object(s3_client, deferred_teardown):
     # Generate a unique bucket name and ensure it exists
     bucket_name = generate_unique_bucket_name(base_name="fixture-bucket")
     create_bucket_and_wait(s3_client, bucket_name)
@@ -208,8 +560,12 @@ def bucket_with_one_object(s3_client):
     yield bucket_name, object_key, content
 
     # Teardown: Delete the object and bucket after the test
-    delete_object_and_wait(s3_client, bucket_name, object_key)
-    delete_bucket_and_wait(s3_client, bucket_name)
+    defer_or_run(
+        deferred_teardown,
+        f"bucket {bucket_name}",
+        lambda: delete_object_and_wait(s3_client, bucket_name, object_key),
+        lambda: delete_bucket_and_wait(s3_client, bucket_name),
+    )
 
 @pytest.fixture
 def bucket_with_one_storage_class_cold_object(s3_client, bucket_with_one_object):
@@ -227,35 +583,37 @@ def bucket_with_one_storage_class_cold_object(s3_client, bucket_with_one_object)
     yield bucket_name, object_key, content
 
 
-@pytest.fixture
-def versioned_bucket_with_one_object(s3_client, lock_mode):
+def create_versioned_bucket_with_one_object(s3_client, bucket_pool, base_name):
     """
-    Fixture to create a versioned bucket with one object for testing.
-    
+    Create (or take from the pool) a versioned bucket and put one object on it.
+
     :param s3_client: Boto3 S3 client
-    :param lock_mode: Lock mode for the bucket or objects (e.g., 'GOVERNANCE', 'COMPLIANCE')
+    :param bucket_pool: BucketPool with buckets already versioned, or None to create the bucket here
+    :param base_name: base of the bucket name when created here
     :return: Tuple containing bucket name, object key, and object version ID
     """
     start_time = datetime.now()
-    base_name = "versioned-bucket-with-one-object"
-    bucket_name = generate_unique_bucket_name(base_name=base_name)
+    if bucket_pool:
+        bucket_name = bucket_pool.acquire(VERSIONED)
+    else:
+        bucket_name = generate_unique_bucket_name(base_name=base_name)
 
-    # Create bucket and enable versioning
-    create_bucket_and_wait(s3_client, bucket_name)
+        # Create bucket and enable versioning
+        create_bucket_and_wait(s3_client, bucket_name)
 
-    # Set bucket versioning to Enabled one time
-    response = s3_client.put_bucket_versioning(
-        Bucket=bucket_name,
-        VersioningConfiguration={"Status": "Enabled"}
-    )
-    response_status = response["ResponseMetadata"]["HTTPStatusCode"]
-    logging.info(f"put_bucket_versioning response status: {response_status}")
-    assert response_status == 200, "Expected HTTPStatusCode 200 for successful put_bucket_versioning."
+        # Set bucket versioning to Enabled one time
+        response = s3_client.put_bucket_versioning(
+            Bucket=bucket_name,
+            VersioningConfiguration={"Status": "Enabled"}
+        )
+        response_status = response["ResponseMetadata"]["HTTPStatusCode"]
+        logging.info(f"put_bucket_versioning response status: {response_status}")
+        assert response_status == 200, "Expected HTTPStatusCode 200 for successful put_bucket_versioning."
 
-    # TODO: HACK: #notcool #eventual-consistency
-    # make multiple ge_bucket_versioning requests to assure that the status is known to be Enabled
-    versioning_status = probe_versioning_status(s3_client, bucket_name)
-    assert versioning_status == "Enabled", f"Expected VersionConfiguration for bucket {bucket_name} to be Enabled, got {versioning_status}"
+        # TODO: HACK: #notcool #eventual-consistency
+        # make multiple ge_bucket_versioning requests to assure that the status is known to be Enabled
+        versioning_status = probe_versioning_status(s3_client, bucket_name)
+        assert versioning_status == "Enabled", f"Expected VersionConfiguration for bucket {bucket_name} to be Enabled, got {versioning_status}"
 
     # Upload a single object and get it's version
     object_key = "test-object.txt"
@@ -269,15 +627,69 @@ def versioned_bucket_with_one_object(s3_client, lock_mode):
     logging.warning(f"[versioned_bucket_with_one_object] Total setup time={end_time - start_time}")
     assert object_version, "Setup failed, could not get VersionId from put_object in versioned bucket"
 
+    return bucket_name, object_key, object_version
+
+@pytest.fixture
+def versioned_bucket_with_one_object(s3_client, lock_mode, bucket_pool):
+    """
+    Fixture to create a versioned bucket with one object for testing.
+    
+    :param s3_client: Boto3 S3 client
+    :param lock_mode: Lock mode for the bucket or objects (e.g., 'GOVERNANCE', 'COMPLIANCE')
+    :param bucket_pool: BucketPool with buckets already versioned, or None to create the bucket here
+    :return: Tuple containing bucket name, object key, and object version ID
+    """
+    base_name = "versioned-bucket-with-one-object"
+    bucket_name, object_key, object_version = create_versioned_bucket_with_one_object(s3_client, bucket_pool, base_name)
+
     # Yield details to tests
     yield bucket_name, object_key, object_version
 
     # Cleanup
+    if bucket_pool:
+        bucket_pool.release(bucket_name)
+        return
     try:
         cleanup_old_buckets(s3_client, base_name, lock_mode)
     except Exception as e:
         print(f"Cleanup error {e}")
 
+@pytest.fixture(scope="module")
+def shared_versioned_buckets(default_profile, s3_client_registry, bucket_pool):
+    """
+    Module-wide versioned buckets with one object, one per reuse key of the tests (see utils/shared_fixtures.py).
+    """
+    s3_client = s3_client_registry.client_for(default_profile)
+
+    def teardown(bucket):
+        bucket_name = bucket[0]
+        if bucket_pool:
+            bucket_pool.release(bucket_name)
+            return
+        delete_objects_in_batches(s3_client, bucket_name, versions=True)
+        delete_bucket_and_wait(s3_client, bucket_name)
+
+    shared = ResettableFixture(
+        "shared_versioned_bucket_with_one_object",
+        setup=lambda: create_versioned_bucket_with_one_object(s3_client, bucket_pool, "shared-versioned-bucket"),
+        reset=lambda bucket: reset_versioned_bucket(s3_client, *bucket),
+        teardown=teardown,
+    )
+    yield shared
+    shared.close()
+
+@pytest.fixture
+def shared_versioned_bucket_with_one_object(request, shared_versioned_buckets):
+    """
+    Same as versioned_bucket_with_one_object, but shared by the tests with the same values of the
+    params named by their reuse_fixtures marker, and reset between them.
+    A cassette records the exchanges of one test, so with --cassette-mode every test gets its own bucket.
+    """
+    key = reuse_key(request.node) if request.config.getoption("--cassette-mode") == "off" else None
+    bucket = shared_versioned_buckets.acquire(key)
+    yield bucket
+    shared_versioned_buckets.release(key, bucket)
+
 @pytest.fixture
 def bucket_with_one_object_and_lock_enabled(s3_client, lock_mode, versioned_bucket_with_one_object):
     bucket_name, object_key, object_version = versioned_bucket_with_one_object
@@ -289,14 +701,21 @@ def bucket_with_one_object_and_lock_enabled(s3_client, lock_mode, versioned_buck
     yield bucket_name, object_key, object_version
 
 @pytest.fixture
-def lockeable_bucket_name(s3_client, lock_mode):
+def lockeable_bucket_name(s3_client, lock_mode, bucket_pool):
     """
     Fixture to create a versioned bucket for tests that will set default bucket object-lock configurations.
 
     :param s3_client: Boto3 S3 client
     :param lock_mode: Lock mode ('GOVERNANCE', 'COMPLIANCE', or None)
+    :param bucket_pool: BucketPool with buckets already versioned, or None to create the bucket here
     :return: The name of the created bucket
     """
+    if bucket_pool:
+        bucket_name = bucket_pool.acquire(VERSIONED)
+        yield bucket_name
+        bucket_pool.release(bucket_name)
+        return
+
     base_name = "lockeable-bucket"
 
     # Generate a unique name and create a versioned bucket
@@ -319,16 +738,23 @@ def lockeable_bucket_name(s3_client, lock_mode):
         logging.error(f"Cleanup error for bucket '{bucket_name}': {e}")
 
 @pytest.fixture
-def bucket_with_lock(lockeable_bucket_name, s3_client, lock_mode):
+def bucket_with_lock(request, s3_client, lock_mode, bucket_pool):
     """
     Fixture to create a bucket with Object Lock and a default retention configuration.
 
-    :param lockeable_bucket_name: Name of the lockable bucket.
+    :param request: pytest request, used to create a lockeable bucket when there is no pool
     :param s3_client: Boto3 S3 client.
     :param lock_mode: Lock mode ('GOVERNANCE' or 'COMPLIANCE').
+    :param bucket_pool: BucketPool with buckets already locked, or None to configure the lock here
     :return: The name of the bucket with Object Lock enabled.
     """
-    bucket_name = lockeable_bucket_name
+    if bucket_pool:
+        bucket_name = bucket_pool.acquire(LOCK)
+        yield bucket_name
+        bucket_pool.release(bucket_name)
+        return
+
+    bucket_name = request.getfixturevalue("lockeable_bucket_name")
 
     # Enable Object Lock configuration with a default retention rule
     retention_days = 1
@@ -345,7 +771,7 @@ def bucket_with_lock(lockeable_bucket_name, s3_client, lock_mode):
 
     logging.info(f"Bucket '{bucket_name}' configured with Object Lock and default retention.")
 
-    return bucket_name
+    yield bucket_name
 
 
 @pytest.fixture
@@ -378,13 +804,14 @@ def bucket_with_lock_and_object(s3_client, bucket_with_lock):
     return bucket_name, object_key, object_version
     
 @pytest.fixture
-def bucket_with_one_object_policy(multiple_s3_clients, request):
+def bucket_with_one_object_policy(multiple_s3_clients, request, deferred_teardown, tenant_cache):
     """
     Prepares an S3 bucket with object and defines its object policies.
 
     :param s3_client: boto3 S3 client fixture.
     :param existing_bucket_name: Name of the bucket after its creating on the fixture of same name.
     :param request: dictionary of policy expecting the helper function change_policies_json.
+    :param tenant_cache: TenantCache of the session, or None to list the buckets of each client.
     :return: bucket_name.
     """
         
@@ -398,7 +825,7 @@ def bucket_with_one_object_policy(multiple_s3_clients, request):
     create_bucket_and_wait(client, bucket_name)
     put_object_and_wait(client, bucket_name, object_key, "42")    
     
-    tenants = get_tenants(multiple_s3_clients)
+    tenants = get_tenants(multiple_s3_clients, tenant_cache)
     
     policy = change_policies_json(bucket=bucket_name, policy_args=request.param, tenants=tenants)
     client.put_bucket_policy(Bucket=bucket_name, Policy = policy)
@@ -407,36 +834,26 @@ def bucket_with_one_object_policy(multiple_s3_clients, request):
     yield bucket_name, object_key
     
     # Teardown: delete the bucket after the test
-    delete_policy_and_bucket_and_wait(client, bucket_name, request)
+    defer_or_run(
+        deferred_teardown,
+        f"policy bucket {bucket_name}",
+        lambda: delete_policy_and_bucket_and_wait(client, bucket_name),
+    )
 
 
 
 
 @pytest.fixture
-def multiple_s3_clients(request, test_params):
+def multiple_s3_clients(request, test_params, s3_client_registry):
     """
-    Creates multiple S3 clients based on the profiles provided in the test parameters.
+    Returns session-cached S3 clients based on the profiles provided in the test parameters.
 
     :param test_params: dictionary containing the profiles names.
     :param request: dictionary that have number_clients int.
+    :param s3_client_registry: session-wide cache of boto3 clients.
     :return: A list of boto3 S3 client instances.
     """
     number_clients = request.param["number_clients"]
-    clients = [p for p in test_params["profiles"][:number_clients]]
-    sessions = []
-    
-    
-    for client in clients:
-        if "profile_name" in client:
-            session = boto3.Session(profile_name=client["profile_name"])
-        else:
-            session = boto3.Session(
-                region_name=client["region_name"],
-                aws_access_key_id=client["aws_access_key_id"],
-                aws_secret_access_key=client["aws_secret_access_key"],
-            )
-        sessions.append(session.client("s3", endpoint_url=client.get("endpoint_url")))
-        
-    return sessions
-    
-    
+    profiles = test_params["profiles"][:number_clients]
+
+    return [s3_client_registry.client_for(profile) for profile in profiles]
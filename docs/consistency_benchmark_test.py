@@ -0,0 +1,218 @@
+# ---
+# jupyter:
+#   kernelspec:
+#     name: s3-specs
+#     display_name: S3 Specs
+#   language_info:
+#     name: python
+# ---
+
+# # Consistency Benchmark
+#
+# Algumas operações do S3 não têm efeito imediato em todas as réplicas do backend: depois de
+# habilitar o versionamento, ou de configurar uma regra de retenção, as próximas requisições podem
+# ainda observar o estado anterior por algum tempo. As fixtures e helpers desta suíte lidam com isso
+# repetindo requisições até o estado esperado aparecer (veja os TODOs de `#eventualconsistency`).
+#
+# Esta especificação mede quanto tempo estas esperas realmente levam. Cada medição é repetida
+# várias vezes (`--benchmark-trials`, 10 por padrão) e a distribuição dos tempos (p50, p90, p99 e
+# máximo) é registrada no log, nas propriedades do teste e no resumo de "consistency waits" ao fim
+# da execução. Com `--metrics-dir` as medições também são exportadas no histograma
+# `s3specs_consistency_wait_seconds`, com o perfil e a região da execução como labels.
+#
+# ## Pontos importantes
+#
+# - Cada tentativa mede o tempo desde o fim da requisição de configuração até a primeira
+# requisição que observa o novo estado, com um intervalo de sondagem curto (até 100ms)
+# - As medições de versionamento e de retenção usam um bucket novo por tentativa, pois o atraso
+# ocorre na primeira configuração de cada bucket
+# - Objetos com retenção no modo COMPLIANCE não podem ser removidos antes do fim do período (1 dia),
+# os buckets destas medições são removidos por execuções seguintes
+
+# + tags=["parameters"]
+config = "../params/br-ne1.yaml"
+# -
+
+# + {"jupyter": {"source_hidden": true}}
+import os
+import logging
+import pytest
+from botocore.exceptions import ClientError
+from s3_helpers import (
+    run_example,
+    generate_unique_bucket_name,
+    create_bucket_and_wait,
+    delete_bucket_and_wait,
+    cleanup_old_buckets,
+    probe_versioning_status,
+    put_object_lock_configuration_with_determination,
+)
+from utils.crud import delete_objects_in_batches
+from utils.consistency import converge, summarize_convergence, format_convergence_summary
+
+config = os.getenv("CONFIG", config)
+# -
+pytestmark = [pytest.mark.benchmark, pytest.mark.slow]
+
+BASE_NAME = "consistency-benchmark"
+# polling interval, sleeps between probes are drawn between 0 and this value
+POLL_INTERVAL = 0.1
+# a measurement that takes longer than this is reported as not converged
+TRIAL_TIMEOUT = 300
+
+# +
+@pytest.fixture
+def benchmark_trials(request):
+    return request.config.getoption("--benchmark-trials")
+
+@pytest.fixture
+def benchmark_buckets(s3_client, lock_mode):
+    """
+    Factory of fresh buckets for the benchmark trials, removed at teardown.
+
+    :param s3_client: Boto3 S3 client
+    :param lock_mode: Lock mode of the profile, buckets with locked objects are left to cleanup_old_buckets
+    :return: callable receiving a suffix of the base name and returning the name of a new bucket
+    """
+    created = []
+
+    def create(suffix):
+        bucket_name = generate_unique_bucket_name(base_name=f"{BASE_NAME}-{suffix}")
+        create_bucket_and_wait(s3_client, bucket_name)
+        created.append(bucket_name)
+        return bucket_name
+
+    yield create
+
+    for bucket_name in created:
+        try:
+            delete_objects_in_batches(s3_client, bucket_name, versions=True, bypass_governance=lock_mode == "GOVERNANCE")
+            delete_bucket_and_wait(s3_client, bucket_name)
+        except ClientError as e:
+            logging.info(f"Bucket '{bucket_name}' left for cleanup_old_buckets: {e}")
+    cleanup_old_buckets(s3_client, BASE_NAME, lock_mode)
+
+def measure(name, probe, accept):
+    """
+    Time until probe returns an accepted value, polling every POLL_INTERVAL at most.
+
+    :return: ConvergenceResult, its elapsed attribute is the measured delay
+    """
+    return converge(
+        probe,
+        accept=accept,
+        timeout=TRIAL_TIMEOUT,
+        base_delay=POLL_INTERVAL,
+        max_delay=POLL_INTERVAL,
+        retry_on=(ClientError,),
+        name=name,
+    )
+
+def report(request, s3_client, results):
+    """
+    Log the distribution of the measured delays and attach it to the test report.
+    """
+    summary = summarize_convergence(results)
+    region = s3_client.meta.region_name
+    request.node.user_properties.append(("consistency_benchmark", {"region": region, **summary}))
+    logging.warning(f"[consistency_benchmark] region={region}\n{format_convergence_summary(summary)}")
+    not_converged = [result for result in results if not result.converged]
+    assert not not_converged, f"{len(not_converged)} of {len(results)} trials did not converge in {TRIAL_TIMEOUT}s"
+# -
+
+# ## Medições
+#
+# ### Versionamento: do put_bucket_versioning até um PUT com VersionId
+#
+# Logo após o **put_bucket_versioning**, um **put_object** pode ainda retornar sem `VersionId`,
+# como se o bucket não fosse versionado. A medição repete o PUT do mesmo objeto até a resposta
+# trazer um `VersionId`.
+
+# +
+def test_versioning_until_versioned_put(s3_client, benchmark_buckets, benchmark_trials, request):
+    results = []
+    for trial in range(benchmark_trials):
+        bucket_name = benchmark_buckets("versioning")
+        s3_client.put_bucket_versioning(Bucket=bucket_name, VersioningConfiguration={"Status": "Enabled"})
+        results.append(measure(
+            "benchmark_versioning_put",
+            lambda: s3_client.put_object(Bucket=bucket_name, Key="benchmark-object.txt", Body=b"benchmark"),
+            accept=lambda response: bool(response.get("VersionId")),
+        ))
+        logging.info(f"trial {trial}: {results[-1].elapsed:.3f}s")
+
+    report(request, s3_client, results)
+
+run_example(__name__, "test_versioning_until_versioned_put", config=config)
+# -
+
+# ### Object Lock: do put_object_lock_configuration até a retenção em um objeto novo
+#
+# Uma regra de retenção padrão só vale para objetos criados depois dela, e mesmo estes podem não
+# exibir a retenção logo após a configuração. A medição cria um objeto novo a cada sondagem e
+# consulta sua retenção com **get_object_retention**, até ela aparecer.
+#
+# O versionamento do bucket é confirmado antes da configuração, para que o tempo medido seja
+# apenas o da regra de retenção.
+
+# +
+def test_lock_configuration_until_retention(s3_client, benchmark_buckets, benchmark_trials, lock_mode, request):
+    configuration = {
+        "ObjectLockEnabled": "Enabled",
+        "Rule": {"DefaultRetention": {"Mode": lock_mode, "Days": 1}},
+    }
+    results = []
+    for trial in range(benchmark_trials):
+        bucket_name = benchmark_buckets("lock")
+        s3_client.put_bucket_versioning(Bucket=bucket_name, VersioningConfiguration={"Status": "Enabled"})
+        assert probe_versioning_status(s3_client, bucket_name) == "Enabled", "Setup failed, bucket versioning is not Enabled"
+        put_object_lock_configuration_with_determination(s3_client, bucket_name, configuration)
+
+        probes = {"count": 0}
+
+        def put_and_get_retention():
+            probes["count"] += 1
+            object_key = f"benchmark-object-{probes['count']}.txt"
+            s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=b"benchmark")
+            return s3_client.get_object_retention(Bucket=bucket_name, Key=object_key)
+
+        results.append(measure(
+            "benchmark_lock_retention",
+            put_and_get_retention,
+            accept=lambda response: response.get("Retention", {}).get("Mode") == lock_mode,
+        ))
+        logging.info(f"trial {trial}: {results[-1].elapsed:.3f}s")
+
+    report(request, s3_client, results)
+
+run_example(__name__, "test_lock_configuration_until_retention", config=config)
+# -
+
+# ### List-after-write: do PUT até o objeto aparecer na listagem
+#
+# Um objeto recém criado pode demorar a aparecer no **list_objects_v2**. A medição cria um objeto
+# novo por tentativa e lista o bucket, com o nome do objeto como prefixo, até ele aparecer.
+
+# +
+def test_list_after_write(s3_client, benchmark_buckets, benchmark_trials, request):
+    bucket_name = benchmark_buckets("list")
+    results = []
+    for trial in range(benchmark_trials):
+        object_key = f"list-after-write-{trial}.txt"
+        s3_client.put_object(Bucket=bucket_name, Key=object_key, Body=b"benchmark")
+        results.append(measure(
+            "benchmark_list_after_write",
+            lambda: s3_client.list_objects_v2(Bucket=bucket_name, Prefix=object_key),
+            accept=lambda response: any(item["Key"] == object_key for item in response.get("Contents", [])),
+        ))
+        logging.info(f"trial {trial}: {results[-1].elapsed:.3f}s")
+
+    report(request, s3_client, results)
+
+run_example(__name__, "test_list_after_write", config=config)
+# -
+
+# ## Referências
+# - [Amazon S3 data consistency model](https://docs.aws.amazon.com/AmazonS3/latest/userguide/Welcome.html#ConsistencyModel) - Modelo de consistência do Amazon S3
+# - [put_bucket_versioning](https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3/client/put_bucket_versioning.html) - Habilitar o versionamento de um bucket
+# - [put_object_lock_configuration](https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3/client/put_object_lock_configuration.html) - Configurar Object Lock em um bucket
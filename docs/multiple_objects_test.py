@@ -4,7 +4,7 @@ from utils.crud import (fixture_bucket_with_name,
                         fixture_upload_multiple_objects,
                         upload_multiple_objects,
                         download_objects_multithreaded,
-                        list_all_objects)
+                        count_objects)
 
 ### Fazendo o upload de grandes quantidades de objetos em paralelo
 
@@ -42,7 +42,7 @@ def test_upload_multiple_objects(s3_client, fixture_bucket_with_name, file_path:
    
     successful_uploads = upload_multiple_objects(s3_client, fixture_bucket_with_name, file_path, object_prefix, object_quantity)
     # Checking if all the objects were uploaded
-    objects_in_bucket = len(list_all_objects(s3_client, fixture_bucket_with_name))
+    objects_in_bucket = count_objects(s3_client, fixture_bucket_with_name)
 
     logging.info(f"Uploaded expected: {object_quantity}, made:{successful_uploads}, bucket: {objects_in_bucket}")
     assert successful_uploads == objects_in_bucket , f"Expects uploads {successful_uploads} to be equal to objects in the bucket {objects_in_bucket} "
@@ -78,3 +78,39 @@ def test_download_multiple_objects(s3_client, fixture_bucket_with_name, fixture_
     assert successful_downloads == successful_uploads, f"Expects downloads {successful_downloads} to be equal to uploads {successful_uploads} "
 
 
+
+
+
+# ## Backends de transferência
+#
+# As mesmas funções aceitam um backend: "thread" (boto3 em um pool de threads, o padrão), "async"
+# (um motor asyncio próprio, para muitos milhares de requisições em voo) e "process" (boto3 em
+# processos, quando uma só CPU não dá conta de assinar e processar as requisições). O exemplo abaixo
+# envia e baixa os mesmos objetos com cada um deles.
+
+@pytest.mark.parametrize('backend', ["thread", "async", "process"])
+@pytest.mark.regular # Mark indicating the test expected speed (regular)
+@pytest.mark.multiple_objects
+def test_transfer_backends(s3_client, fixture_bucket_with_name, backend, request):
+    """
+    Test to upload and then download multiple objects with each transfer backend
+    :param s3_client: pytest.fixture of boto3 s3 client
+    :param fixture_bucket_with_name: pytest.fixture to create a bucket with a unique name
+    :param backend: str: transfer backend of the helpers
+    :return: None
+    """
+    if backend != "thread" and request.config.getoption("--cassette-mode") != "off":
+        # the async engine and the worker processes do not use the clients the cassettes attach to
+        pytest.skip(f"the {backend} backend is not recorded in cassettes")
+
+    object_quantity = 100
+    successful_uploads = upload_multiple_objects(
+        s3_client, fixture_bucket_with_name, file_path, f"test-backend-{backend}", object_quantity,
+        concurrency=8, backend=backend, processes=2,
+    )
+    assert successful_uploads == object_quantity, f"Expects {object_quantity} uploads, made {successful_uploads}"
+
+    successful_downloads = download_objects_multithreaded(
+        s3_client, fixture_bucket_with_name, concurrency=8, backend=backend, processes=2,
+    )
+    assert successful_downloads == object_quantity, f"Expects {object_quantity} downloads, made {successful_downloads}"
@@ -11,6 +11,10 @@ import ipynbname
 import json
 import time
 from utils.utils import generate_valid_bucket_name
+from utils.crud import delete_objects_in_batches
+from utils.consistency import converge
+from utils.waiters import wait
+from utils.bucket_registry import active_registry
 
 def get_spec_path():
     spec_path = os.getenv("SPEC_PATH")
@@ -28,12 +32,18 @@ def run_example(dunder_name, test_name, config="../params.example.yaml"):
         # When executing a notebook pass config path as env var instead of pytest custom arg
         os.environ["CONFIG_PATH"] = os.environ.get("CONFIG_PATH", config)
 
+        # record or replay the examples of a notebook run (run-spec.sh) with CASSETTE_MODE
+        cassette_args = []
+        if os.environ.get("CASSETTE_MODE"):
+            cassette_args = ["--cassette-mode", os.environ["CASSETTE_MODE"]]
+
         # Run pytest without the --config argument
         pytest.main([
             "-qq", 
             "--color", "no", 
             # "-s", 
             # "--log-cli-level", "INFO",
+            *cassette_args,
             f"{get_spec_path()}::{test_name}"
         ])
  
@@ -51,8 +61,7 @@ def delete_bucket_and_wait(s3_client, bucket_name):
         logging.info("Bucket already deleted by someone else.")
         return
 
-    waiter = s3_client.get_waiter('bucket_not_exists')
-    waiter.wait(Bucket=bucket_name)
+    wait(s3_client, 'bucket_not_exists', Bucket=bucket_name)
     logging.info(f"Bucket '{bucket_name}' confirmed as deleted.")
 
 def create_bucket(s3_client, bucket_name):
@@ -73,8 +82,7 @@ def create_bucket_and_wait(s3_client, bucket_name):
     except s3_client.exceptions.BucketAlreadyExists:
         raise Exception(f"Bucket '{bucket_name}' already exists and is owned by someone else.")
 
-    waiter = s3_client.get_waiter('bucket_exists')
-    waiter.wait(Bucket=bucket_name)
+    wait(s3_client, 'bucket_exists', Bucket=bucket_name)
     logging.info(f"Bucket '{bucket_name}' confirmed as created.")
 
 def delete_object_and_wait(s3_client, bucket_name, object_key):
@@ -84,22 +92,30 @@ def delete_object_and_wait(s3_client, bucket_name, object_key):
         logging.info(f"Object '{object_key}' already deleted or not found.")
         return
 
-    waiter = s3_client.get_waiter('object_not_exists')
-    waiter.wait(Bucket=bucket_name, Key=object_key)
+    wait(s3_client, 'object_not_exists', Bucket=bucket_name, Key=object_key)
     logging.info(f"Object '{object_key}' in bucket '{bucket_name}' confirmed as deleted.")
 
-def delete_all_objects_and_wait(s3_client, bucket_name):
-    response = s3_client.list_objects_v2(Bucket=bucket_name)
-    if 'Contents' in response:
-        for obj in response['Contents']:
-            delete_object_and_wait(s3_client, bucket_name, obj['Key'])
+def delete_all_objects_and_wait(s3_client, bucket_name, timeout=300):
+    deleted, errors = delete_objects_in_batches(s3_client, bucket_name)
+    logging.info(f"Deleted {deleted} objects from bucket '{bucket_name}', {len(errors)} errors.")
+    if errors:
+        return
+    # listings may still show keys deleted a moment ago, wait until the bucket looks empty
+    result = converge(
+        lambda: s3_client.list_objects_v2(Bucket=bucket_name, MaxKeys=1).get("KeyCount", 0),
+        accept=lambda count: count == 0,
+        timeout=timeout,
+        name="delete_all_objects",
+    )
+    logging.info(f"Bucket '{bucket_name}' confirmed as empty: {result.converged}.")
  
-def delete_policy_and_bucket_and_wait(s3_client, bucket_name, request):
+def delete_policy_and_bucket_and_wait(s3_client, bucket_name):
+    # the policy template of the specs is shared by their cases and must not be touched here, as
+    # this may run on the deferred teardown thread while the next case fills it in
     retries = 3
     sleeptime = 1
     for _ in range(retries):   
         try:
-            change_policies_json(bucket_name, {"policy_dict": request.param['policy_dict'], "actions": ["s3:GetObjects", "*"], "effect": "Allow"}, tenants=["*"])
             s3_client.delete_bucket_policy(Bucket=bucket_name)
         except s3_client.exceptions.ClientError as e:
             if e.response['Error']['Code'] == 'NoSuchBucketPolicy':
@@ -129,8 +145,7 @@ def put_object_and_wait(s3_client, bucket_name, object_key, content):
     version_id = put_response.get("VersionId", None)
 
     # Wait for the object to exist
-    waiter = s3_client.get_waiter('object_exists')
-    waiter.wait(Bucket=bucket_name, Key=object_key)
+    wait(s3_client, 'object_exists', Bucket=bucket_name, Key=object_key)
 
     # Log confirmation
     logging.info(
@@ -143,6 +158,8 @@ def cleanup_old_buckets(s3_client, base_name, lock_mode=None, retention_days=1):
     """
     Delete buckets with the specified base name that are older than the retention period.
     Attempt to delete versions and delete markers, retry with governance bypass if needed.
+    With an active bucket registry (utils/bucket_registry.py) only its buckets are considered,
+    instead of listing every bucket of the account.
 
     :param s3_client: Boto3 S3 client
     :param base_name: Prefix of the bucket names to target
@@ -150,72 +167,47 @@ def cleanup_old_buckets(s3_client, base_name, lock_mode=None, retention_days=1):
     :param retention_days: Age threshold for buckets to be cleaned up (ignored for GOVERNANCE)
     """
 
-    response = s3_client.list_buckets()
-    for bucket in response['Buckets']:
-        bucket_name = bucket['Name']
-        if bucket_name.startswith(f"test-{base_name}"):
-            creation_date = bucket['CreationDate']
-            age_threshold = datetime.now(creation_date.tzinfo) - timedelta(days=retention_days)
-
-            if lock_mode == "GOVERNANCE" or creation_date < age_threshold:
-                try:
-                    # Get bucket versioning info
-                    bucket_versioning = s3_client.get_bucket_versioning(Bucket=bucket_name)
-
-                    # If bucket is versioned, delete all object versions and delete markers
-                    if bucket_versioning.get('Status') == 'Enabled':
-                        paginator = s3_client.get_paginator('list_object_versions')
-                        for page in paginator.paginate(Bucket=bucket_name):
-                            # Delete object versions
-                            for version in page.get('Versions', []):
-                                delete_version(
-                                    s3_client, bucket_name, version, lock_mode
-                                )
-                            # Delete markers
-                            for marker in page.get('DeleteMarkers', []):
-                                delete_version(
-                                    s3_client, bucket_name, marker, lock_mode
-                                )
-
-                    # Delete the bucket itself
-                    s3_client.delete_bucket(Bucket=bucket_name)
-                    logging.info(f"Deleted old bucket '{bucket_name}' created on {creation_date}")
-                except ClientError as e:
+    registry = active_registry()
+    if registry:
+        buckets = registry.cleanup_candidates(s3_client, base_name)
+    else:
+        response = s3_client.list_buckets()
+        buckets = [
+            (bucket['Name'], bucket['CreationDate'])
+            for bucket in response['Buckets']
+            if bucket['Name'].startswith(f"test-{base_name}")
+        ]
+    for bucket_name, creation_date in buckets:
+        age_threshold = datetime.now(creation_date.tzinfo) - timedelta(days=retention_days)
+
+        if lock_mode == "GOVERNANCE" or creation_date < age_threshold:
+            try:
+                # Get bucket versioning info
+                bucket_versioning = s3_client.get_bucket_versioning(Bucket=bucket_name)
+
+                # Delete all objects, and when versioned also all versions and delete markers,
+                # in DeleteObjects batches
+                _, errors = delete_objects_in_batches(
+                    s3_client,
+                    bucket_name,
+                    versions=bucket_versioning.get('Status') in ('Enabled', 'Suspended'),
+                    bypass_governance=lock_mode == "GOVERNANCE",
+                )
+                if errors:
+                    logging.warning(f"Could not empty old bucket '{bucket_name}', {len(errors)} entries left")
+                    continue
+
+                # Delete the bucket itself
+                s3_client.delete_bucket(Bucket=bucket_name)
+                logging.info(f"Deleted old bucket '{bucket_name}' created on {creation_date}")
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'NoSuchBucket':
+                    logging.info(f"Old bucket '{bucket_name}' already deleted")
+                else:
                     logging.warning(f"Could not delete bucket '{bucket_name}': {e}")
-
-def delete_version(s3_client, bucket_name, version, lock_mode):
-    """
-    Attempt to delete an object version or delete marker.
-for _ in range(5):
-
-    :param s3_client: Boto3 S3 client.
-    :param bucket_name: Name of the bucket.
-    :param version: The version or delete marker to delete.
-    :param lock_mode: Lock mode ('GOVERNANCE', 'COMPLIANCE', or None).
-    """
-    version_id = version['VersionId']
-    try:
-        # Attempt to delete the version
-        s3_client.delete_object(
-            Bucket=bucket_name,
-            Key=version['Key'],
-            VersionId=version_id
-        )
-        logging.info(f"Deleted version {version_id} of object {version['Key']} in bucket {bucket_name}")
-    except ClientError as e:
-        # Retry deletion with governance bypass if necessary
-        if e.response["Error"]["Code"] == "AccessDenied" and lock_mode == "GOVERNANCE":
-            logging.info(f"Retrying deletion of version {version_id} with governance bypass")
-            s3_client.delete_object(
-                Bucket=bucket_name,
-                Key=version['Key'],
-                VersionId=version_id,
-                BypassGovernanceRetention=True
-            )
-        else:
-            logging.warning(
-                f"Failed to delete version {version_id} of object {version['Key']} in bucket {bucket_name}: {e}"
-            )
+                    continue
+            if registry:
+                registry.mark_deleted(bucket_name)
 
 def change_policies_json(bucket, policy_args: dict, tenants: list) -> json:
     
@@ -243,14 +235,17 @@ def change_policies_json(bucket, policy_args: dict, tenants: list) -> json:
     return json.dumps(policy)
 
 
-def get_tenants(multiple_s3_clients):
+def get_tenants(multiple_s3_clients, tenant_cache=None):
     """
-    Get the tenant from the test_params and return a list of all client's tenants.
+    Get the tenant (owner ID) of each client.
 
-    :param test_params: The test parameters.
-    :param client_number: The client number.
-    :return: The tenant for the client number.
+    :param multiple_s3_clients: The clients.
+    :param tenant_cache: TenantCache resolving each tenant once, or None to list the buckets of every client.
+    :return: The list of tenants, in the order of the clients.
     """
+    if tenant_cache:
+        return [tenant_cache.tenant_of(client) for client in multiple_s3_clients]
+
     bucket_list = []
 
     for i, client in enumerate(multiple_s3_clients):        
@@ -285,149 +280,127 @@ def update_existing_keys(main_dict, sub_dict):
 #
 # This helper function is a workaround that will attempt multiple times to put an object in a bucket
 # and if the response does not include a version ID, will try to put another object, with another
-# key on the same bucket, waiting some seconds between re-attempts. Until the put object response
-# returns a version ID or until the number of maximum retries is reached.
-def replace_failed_put_without_version(s3_client, bucket_name, object_key, object_content):
-
-    retries = 0
-    interval_multiplier = 3 # seconds
-    start_time = datetime.now()
-    object_version = None
-    while not object_version and retries < 10:
-        retries += 1
+# key on the same bucket, with short jittered waits between re-attempts. Until the put object response
+# returns a version ID or until the timeout is reached.
+def replace_failed_put_without_version(s3_client, bucket_name, object_key, object_content, timeout=300):
+    attempt = {"count": 0, "key": object_key}
 
-        # create a new object key
-        new_object_key = f"test_object_{retries}.txt"
-
-        logging.info(f"attempt ({retries}): key:{new_object_key}")
-        wait_time = retries * retries * interval_multiplier
-        logging.info(f"wait {wait_time} seconds")
-        time.sleep(wait_time)
+    def put_new_object():
+        attempt["count"] += 1
 
         # delete object (marker?) on the strange object without version id
-        s3_client.delete_object(Bucket=bucket_name, Key=object_key)
+        s3_client.delete_object(Bucket=bucket_name, Key=attempt["key"])
 
-        # put the object again in the hopes that this time it will have a version id
-        response = s3_client.put_object(Bucket=bucket_name, Key=new_object_key, Body=object_content)
+        # put the object again, with a new key, in the hopes that this time it will have a version id
+        attempt["key"] = f"test_object_{attempt['count']}.txt"
+        logging.info(f"attempt ({attempt['count']}): key:{attempt['key']}")
+        response = s3_client.put_object(Bucket=bucket_name, Key=attempt["key"], Body=object_content)
         logging.info(f"put_object response: {response}")
 
-        # check if it has version id
+        # try to get the object version not returned by the put_object with a head_object
         object_version = response.get("VersionId")
         if not object_version:
-            # try to get the object version not returned by the put_object with a head_object
-            logging.info(f"put response dont have version, wait {wait_time} seconds before head_object")
-            time.sleep(wait_time)
-            logging.info(f"head_object Key={new_object_key}...")
-            head_object_response = s3_client.head_object(Bucket=bucket_name, Key=new_object_key)
-            logging.info(f"Head object {new_object_key}: {head_object_response}")
+            head_object_response = s3_client.head_object(Bucket=bucket_name, Key=attempt["key"])
+            logging.info(f"Head object {attempt['key']}: {head_object_response}")
             object_version = head_object_response.get("VersionId")
+        return object_version
 
-        logging.info(f"Object {new_object_key} in bucket {bucket_name} confirmed as uploaded. Version ID: {object_version}")
-    end_time = datetime.now()
-    logging.warning(f"[replace_failed_put_without_version] Total consistency wait time={end_time - start_time}")
+    result = converge(put_new_object, timeout=timeout, name="replace_failed_put_without_version")
+    logging.info(f"Object {attempt['key']} in bucket {bucket_name} confirmed as uploaded. Version ID: {result.value}")
 
-    return object_version, new_object_key
+    return result.value, attempt["key"]
 
 # TODO: review when #eventualconsistency stops being so bad
-def put_object_lock_configuration_with_determination(s3_client, bucket_name, configuration):
-    retries = 0
-    interval_multiplier = 3 # seconds
-    response = None
-    start_time = datetime.now()
-    while retries < 10:
-        retries += 1
-        try:
-            response = s3_client.put_object_lock_configuration(
-                Bucket=bucket_name,
-                ObjectLockConfiguration=configuration
-            )
-            break
-        except Exception as e:
-            logging.error(f"Error ({retries}): {e}")
-            wait_time = retries * retries * interval_multiplier
-            logging.info(f"wait {wait_time} seconds")
-            time.sleep(wait_time)
-    end_time = datetime.now()
-    logging.warning(f"[put_object_lock_configuration_with_determination] Total consistency wait time={end_time - start_time}")
-    return response
+def put_object_lock_configuration_with_determination(s3_client, bucket_name, configuration, timeout=300):
+    result = converge(
+        lambda: s3_client.put_object_lock_configuration(
+            Bucket=bucket_name,
+            ObjectLockConfiguration=configuration
+        ),
+        timeout=timeout,
+        name="put_object_lock_configuration_with_determination",
+    )
+    return result.value
 
 # TODO: review when #eventualconsistency stops being so bad
-def get_object_retention_with_determination(s3_client, bucket_name, object_key):
-    retries = 0
-    interval_multiplier = 3 # seconds
-    response = None
-    start_time = datetime.now()
-    while retries < 20:
-        retries += 1
-        try:
-            # make 5 GETs in an attempt to get responses from all replicas
-            response = s3_client.get_object_retention( Bucket=bucket_name, Key=object_key,)
-            response2 = s3_client.get_object_retention( Bucket=bucket_name, Key=object_key,)
-            response3 = s3_client.get_object_retention( Bucket=bucket_name, Key=object_key,)
-            response4 = s3_client.get_object_retention( Bucket=bucket_name, Key=object_key,)
-            response5 = s3_client.get_object_retention( Bucket=bucket_name, Key=object_key,)
-            break
-        except Exception as e:
-            logging.error(f"[get_object_retention_with_determination] Error ({retries}): {e}")
-            wait_time = retries * retries * interval_multiplier
-            logging.info(f"wait {wait_time} seconds")
-            time.sleep(wait_time)
-    end_time = datetime.now()
-    logging.warning(f"[get_object_retention_with_determination] Total consistency wait time={end_time - start_time}")
+def get_object_retention_with_determination(s3_client, bucket_name, object_key, fan_out=5, agreement=None, timeout=300):
+    # make multiple concurrent GETs in an attempt to get responses from all replicas
+    result = converge(
+        lambda: s3_client.get_object_retention(Bucket=bucket_name, Key=object_key),
+        accept=lambda response: bool(response.get("Retention")),
+        key=lambda response: response.get("Retention"),
+        fan_out=fan_out,
+        agreement=agreement,
+        timeout=timeout,
+        name="get_object_retention_with_determination",
+    )
+    response = result.value
     assert response and response.get("Retention"), "Setup error, object dont have retention"
     return response
 
 
 # TODO: review when #eventualconsistency stops being so bad
-def get_object_lock_configuration_with_determination(s3_client, bucket_name):
-    retries = 0
-    interval_multiplier = 3 # seconds
-    response = None
-    start_time = datetime.now()
-    while retries < 20:
-        retries += 1
-        try:
-            # make 5 GETs in an attempt to get responses from all replicas
-            response = s3_client.get_object_lock_configuration(Bucket=bucket_name)
-            response2 = s3_client.get_object_lock_configuration(Bucket=bucket_name)
-            response3 = s3_client.get_object_lock_configuration(Bucket=bucket_name)
-            response4 = s3_client.get_object_lock_configuration(Bucket=bucket_name)
-            response5 = s3_client.get_object_lock_configuration(Bucket=bucket_name)
-            break
-        except Exception as e:
-            logging.error(f"[get_object_lock_configuration_with_determination] Error ({retries}): {e}")
-            wait_time = retries * retries * interval_multiplier
-            logging.info(f"wait {wait_time} seconds")
-            time.sleep(wait_time)
-    end_time = datetime.now()
-    logging.warning(f"[get_object_lock_configuration_with_determination] Total consistency wait time={end_time - start_time}")
-    return response
+def get_object_lock_configuration_with_determination(s3_client, bucket_name, fan_out=5, agreement=None, timeout=300):
+    # make multiple concurrent GETs in an attempt to get responses from all replicas
+    result = converge(
+        lambda: s3_client.get_object_lock_configuration(Bucket=bucket_name),
+        accept=lambda response: bool(response.get("ObjectLockConfiguration")),
+        key=lambda response: response.get("ObjectLockConfiguration"),
+        fan_out=fan_out,
+        agreement=agreement,
+        timeout=timeout,
+        name="get_object_lock_configuration_with_determination",
+    )
+    return result.value
+
+def probe_versioning_status(s3_client, bucket_name, fan_out=10, agreement=None, timeout=300):
+    def get_versioning():
+        response = s3_client.get_bucket_versioning(Bucket=bucket_name)
+        response_status = response["ResponseMetadata"]["HTTPStatusCode"]
+        assert response_status == 200, "Expected HTTPStatusCode 200 for successful put_bucket_versioning."
+        logging.info(f"get_bucket_versioning versioning status for bucket {bucket_name} is {response.get('Status')}")
+        return response
+
+    # stopping condition, multiple concurrent requests must return the same value (Enabled)
+    result = converge(
+        get_versioning,
+        accept=lambda response: bool(response.get("Status")),
+        key=lambda response: response.get("Status"),
+        fan_out=fan_out,
+        agreement=agreement,
+        timeout=timeout,
+        retry_on=(),
+        name="probe_versioning_status",
+    )
+    return result.value.get("Status") if result.value else None
 
-def probe_versioning_status(s3_client, bucket_name):
-    start_time = datetime.now()
-    retries = 0
-    interval_multiplier = 1 # seconds
-    multiple_enabled_statuses = False # stopping condition, multiple requests must return the same value (Enabled)
-    while not multiple_enabled_statuses and retries < 20:
-        retries += 1
-        wait_time = retries * retries * interval_multiplier
-        logging.info(f"Attempt {retries}, wait {wait_time} seconds")
-        time.sleep(wait_time)
-        multiple_enabled_statuses = True
-        for request_count in range(10):
-            logging.info(f"get_bucket_versioning request: {request_count}")
-            response = s3_client.get_bucket_versioning(Bucket=bucket_name)
-            response_status = response["ResponseMetadata"]["HTTPStatusCode"]
-            logging.info(f"get_bucket_versioning response status: {response_status}")
-            assert response_status == 200, "Expected HTTPStatusCode 200 for successful put_bucket_versioning."
-            logging.info(f"get_bucket_versioning response: {response}")
-            response_versioning_status = response.get("Status", None)
-            logging.info(f"get_bucket_versioning versioning status for bucket {bucket_name} is {response_versioning_status}")
-            if not response_versioning_status:
-                logging.info(f"consistency not yet reached")
-                multiple_enabled_statuses = False
-                break
+def reset_versioned_bucket(s3_client, bucket_name, object_key, object_version, timeout=300):
+    """
+    Bring a versioned bucket shared by several tests back to the state they expect: only the
+    original version of its object, and private ACLs. Listings may miss a version written just
+    before, so the pass is repeated until the original version is the current one.
 
-    end_time = datetime.now()
-    logging.warning(f"[wait_for_versioning_status] Total wait time={end_time - start_time}")
-    return response_versioning_status
+    :param s3_client: Boto3 S3 client
+    :param bucket_name: Name of the bucket
+    :param object_key: Key (name) of the object
+    :param object_version: Version ID of the object to keep
+    :param timeout: Seconds to wait for the original version to be the current one
+    """
+    def reset_pass():
+        paginator = s3_client.get_paginator("list_object_versions")
+        for page in paginator.paginate(Bucket=bucket_name):
+            for version in page.get("Versions", []) + page.get("DeleteMarkers", []):
+                if version["Key"] == object_key and version["VersionId"] == object_version:
+                    continue
+                s3_client.delete_object(Bucket=bucket_name, Key=version["Key"], VersionId=version["VersionId"])
+        return s3_client.head_object(Bucket=bucket_name, Key=object_key).get("VersionId")
+
+    result = converge(
+        reset_pass,
+        accept=lambda current_version: current_version == object_version,
+        timeout=timeout,
+        name="reset_versioned_bucket",
+    )
+    assert result.converged, f"Could not reset bucket {bucket_name} to version {object_version} of {object_key}"
+    s3_client.put_bucket_acl(Bucket=bucket_name, ACL="private")
+    s3_client.put_object_acl(Bucket=bucket_name, Key=object_key, VersionId=object_version, ACL="private")
@@ -0,0 +1,377 @@
+import asyncio
+import logging
+import ssl
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from urllib.parse import quote, urlencode, urlsplit
+from botocore.auth import S3SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+from utils.clients import frozen_credentials
+
+# ## Asyncio request engine
+#
+# Bulk specs driven by threads are limited by the number of threads and by GIL contention inside
+# botocore. This engine keeps thousands of requests in flight on a single event loop: requests are
+# signed with botocore's SigV4 signer and sent over a pool of keep-alive HTTP/1.1 connections
+# opened with asyncio streams. Credentials, region and endpoint are taken from a client built by
+# the conftest fixtures, so profile resolution is the same as for the boto3 specs.
+#
+# Requests in flight and open connections are bounded separately: requests past the connection
+# limit wait for a free keep-alive connection, so thousands of queued requests do not open
+# thousands of sockets against one endpoint unless the caller raises max_connections.
+
+DEFAULT_MAX_CONNECTIONS = 256
+S3_NAMESPACE = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+RETRYABLE_STATUSES = (500, 502, 503, 504)
+
+
+class AsyncS3Error(Exception):
+    def __init__(self, response):
+        super().__init__(f"{response.status} {response.error_code}")
+        self.response = response
+
+
+@dataclass
+class AsyncResponse:
+    status: int
+    headers: dict
+    body: bytes = b""
+
+    @property
+    def error_code(self):
+        if self.status < 300 or not self.body:
+            return None
+        try:
+            return ET.fromstring(self.body).findtext("Code")
+        except ET.ParseError:
+            return None
+
+
+@dataclass
+class AsyncEngineStats:
+    requests: int = 0
+    retries: int = 0
+    connections_opened: int = 0
+    statuses: dict = field(default_factory=dict)
+
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncS3Engine:
+    """
+    Minimal S3 client for PUT, GET, HEAD, DELETE and LIST running on asyncio
+    """
+
+    def __init__(self, endpoint_url, region_name, credentials, max_connections=DEFAULT_MAX_CONNECTIONS, max_attempts=3):
+        """
+        :param endpoint_url: str: S3 endpoint, buckets are addressed path-style
+        :param region_name: str: region used in the SigV4 signature
+        :param credentials: botocore Credentials
+        :param max_connections: int: maximum number of open connections (and requests in flight)
+        :param max_attempts: int: attempts per request on connection errors and 5xx responses
+        """
+        parts = urlsplit(endpoint_url)
+        self.scheme = parts.scheme
+        self.hostname = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.host_header = parts.netloc if parts.port not in (80, 443) else parts.hostname
+        self.base_path = parts.path.rstrip("/")
+        self.region_name = region_name
+        self.signer = S3SigV4Auth(credentials, "s3", region_name)
+        self.max_attempts = max_attempts
+        self.stats = AsyncEngineStats()
+        self._ssl_context = ssl.create_default_context() if self.scheme == "https" else None
+        self._slots = asyncio.Semaphore(max_connections)
+        self._idle = []
+
+    @classmethod
+    def from_client(cls, s3_client, max_connections=DEFAULT_MAX_CONNECTIONS):
+        """
+        Build an engine with the credentials, region and endpoint resolved by a boto3 client
+        :param s3_client: boto3 s3 client
+        :param max_connections: int: maximum number of open connections (and requests in flight)
+        :return: AsyncS3Engine
+        """
+        region = s3_client.meta.region_name
+        endpoint_url = s3_client.meta.endpoint_url
+        # the global AWS endpoint redirects path-style requests of other regions
+        if urlsplit(endpoint_url).hostname == "s3.amazonaws.com" and region != "us-east-1":
+            endpoint_url = f"https://s3.{region}.amazonaws.com"
+        frozen = frozen_credentials(s3_client)
+        credentials = Credentials(frozen.access_key, frozen.secret_key, frozen.token)
+        return cls(endpoint_url, region, credentials, max_connections=max_connections)
+
+    async def _acquire(self):
+        await self._slots.acquire()
+        if self._idle:
+            return self._idle.pop(), True
+        try:
+            reader, writer = await asyncio.open_connection(
+                self.hostname, self.port, ssl=self._ssl_context, limit=2 ** 20
+            )
+        except BaseException:
+            self._slots.release()
+            raise
+        self.stats.connections_opened += 1
+        return _Connection(reader, writer), False
+
+    def _release(self, connection, reusable):
+        if reusable:
+            self._idle.append(connection)
+        else:
+            connection.close()
+        self._slots.release()
+
+    def _sign(self, method, bucket, key, params, body, headers):
+        path = self.base_path + "/" + quote(bucket, safe="")
+        if key is not None:
+            path += "/" + quote(key, safe="/~")
+        query = urlencode(sorted((params or {}).items()), quote_via=quote, safe="-_.~")
+        url = f"{self.scheme}://{self.host_header}{path}" + (f"?{query}" if query else "")
+        request = AWSRequest(method=method, url=url, data=body, headers={"Host": self.host_header, **(headers or {})})
+        if body or method in ("PUT", "POST"):
+            request.headers["Content-Length"] = str(len(body))
+        self.signer.add_auth(request)
+        target = path + (f"?{query}" if query else "")
+        return target, dict(request.headers.items())
+
+    async def _read_body(self, reader, headers):
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # trailers end with an empty line
+                    while (await reader.readline()) not in (b"\r\n", b""):
+                        pass
+                    return b"".join(chunks)
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+        if "content-length" in headers:
+            return await reader.readexactly(int(headers["content-length"]))
+        return await reader.read()
+
+    async def _exchange(self, connection, method, target, headers, body):
+        lines = [f"{method} {target} HTTP/1.1"] + [f"{name}: {value}" for name, value in headers.items()]
+        connection.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await connection.writer.drain()
+
+        status_line = await connection.reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed by the server")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await connection.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if method == "HEAD" or status in (204, 304):
+            response_body = b""
+        else:
+            response_body = await self._read_body(connection.reader, response_headers)
+        # without a length the body was read until the server closed the connection
+        delimited = (
+            method == "HEAD" or status in (204, 304) or "content-length" in response_headers
+            or response_headers.get("transfer-encoding", "").lower() == "chunked"
+        )
+        reusable = delimited and response_headers.get("connection", "").lower() != "close"
+        return AsyncResponse(status, response_headers, response_body), reusable
+
+    async def request(self, method, bucket, key=None, params=None, body=b"", headers=None):
+        """
+        Sign and send one request, retrying connection errors and 5xx responses
+        :return: AsyncResponse
+        """
+        if isinstance(body, str):
+            body = body.encode()
+        attempt = 0
+        while True:
+            target, signed_headers = self._sign(method, bucket, key, params, body, headers)
+            connection, reused = await self._acquire()
+            try:
+                response, reusable = await self._exchange(connection, method, target, signed_headers, body)
+            except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                self._release(connection, False)
+                self.stats.retries += 1
+                # an idle keep-alive connection may have been closed by the server, it does not count as an attempt
+                if not reused:
+                    attempt += 1
+                    if attempt >= self.max_attempts:
+                        raise
+                continue
+            except BaseException:
+                self._release(connection, False)
+                raise
+            self._release(connection, reusable)
+
+            attempt += 1
+            self.stats.requests += 1
+            self.stats.statuses[response.status] = self.stats.statuses.get(response.status, 0) + 1
+            if response.status in RETRYABLE_STATUSES and attempt < self.max_attempts:
+                self.stats.retries += 1
+                await asyncio.sleep(0.1 * 2 ** attempt)
+                continue
+            return response
+
+    async def put_object(self, bucket, key, body):
+        return await self.request("PUT", bucket, key, body=body)
+
+    async def get_object(self, bucket, key):
+        return await self.request("GET", bucket, key)
+
+    async def head_object(self, bucket, key):
+        return await self.request("HEAD", bucket, key)
+
+    async def delete_object(self, bucket, key):
+        return await self.request("DELETE", bucket, key)
+
+    async def list_objects_v2(self, bucket, prefix="", continuation_token=None, max_keys=1000):
+        """
+        One page of ListObjectsV2
+        :return: dict: "Keys" (list str), "IsTruncated" and "NextContinuationToken"
+        """
+        params = {"list-type": "2", "max-keys": str(max_keys)}
+        if prefix:
+            params["prefix"] = prefix
+        if continuation_token:
+            params["continuation-token"] = continuation_token
+        response = await self.request("GET", bucket, params=params)
+        if response.status != 200:
+            raise AsyncS3Error(response)
+
+        root = ET.fromstring(response.body)
+        ns = S3_NAMESPACE if root.tag.startswith(S3_NAMESPACE) else ""
+        return {
+            "Keys": [node.text for node in root.iter(f"{ns}Key")],
+            "IsTruncated": root.findtext(f"{ns}IsTruncated") == "true",
+            "NextContinuationToken": root.findtext(f"{ns}NextContinuationToken"),
+        }
+
+    async def iter_keys(self, bucket, prefix=""):
+        """
+        Stream the keys of a bucket page by page
+        """
+        token = None
+        while True:
+            page = await self.list_objects_v2(bucket, prefix, token)
+            for key in page["Keys"]:
+                yield key
+            if not page["IsTruncated"]:
+                return
+            token = page["NextContinuationToken"]
+
+    async def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+async def _run_windowed(requests, window):
+    """
+    Await coroutines from an (async) iterable keeping at most window of them in flight
+    :return: list int: response status of every request, failures count as 0
+    """
+    statuses = []
+    pending = set()
+
+    def collect(done):
+        for task in done:
+            try:
+                statuses.append(task.result().status)
+            except Exception as e:
+                logging.error(f"async request failed: {e}")
+                statuses.append(0)
+
+    async def submit(coroutine):
+        nonlocal pending
+        if len(pending) >= window:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            collect(done)
+        pending.add(asyncio.ensure_future(coroutine))
+
+    if hasattr(requests, "__aiter__"):
+        async for coroutine in requests:
+            await submit(coroutine)
+    else:
+        for coroutine in requests:
+            await submit(coroutine)
+    if pending:
+        done, _ = await asyncio.wait(pending)
+        collect(done)
+    return statuses
+
+
+def _run_coroutine(coroutine):
+    """
+    Run a coroutine to completion from synchronous code, on a thread of its own when the caller
+    already runs an event loop (e.g. a notebook kernel), as asyncio.run refuses to nest loops
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="async-engine") as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def upload_objects_async(s3_client, bucket_name, objects_paths, max_in_flight=1000, max_connections=DEFAULT_MAX_CONNECTIONS):
+    """
+    Upload objects to one bucket with the asyncio engine
+    :param s3_client: boto3 s3 client providing credentials, region and endpoint
+    :param bucket_name: str: name of the bucket
+    :param objects_paths: iterable: dicts with "key" and "path" (used as body, like upload_object does)
+    :param max_in_flight: int: maximum number of concurrent requests
+    :param max_connections: int: maximum number of open connections, shared by the requests in flight
+    :return: int: number of successful uploads
+    """
+    async def run():
+        engine = AsyncS3Engine.from_client(s3_client, max_connections=max_connections)
+        try:
+            start = time.monotonic()
+            requests = (engine.put_object(bucket_name, path["key"], path["path"]) for path in objects_paths)
+            statuses = await _run_windowed(requests, max_in_flight)
+            logging.info(f"async uploads: {len(statuses)} in {time.monotonic() - start:.2f}s, {engine.stats}")
+            return statuses
+        finally:
+            await engine.close()
+
+    return sum(1 for status in _run_coroutine(run()) if status == 200)
+
+
+def download_objects_async(s3_client, bucket_name, max_in_flight=1000, max_connections=DEFAULT_MAX_CONNECTIONS):
+    """
+    Download every object of a bucket with the asyncio engine, streaming the listing
+    :param s3_client: boto3 s3 client providing credentials, region and endpoint
+    :param bucket_name: str: name of the bucket
+    :param max_in_flight: int: maximum number of concurrent requests
+    :param max_connections: int: maximum number of open connections, shared by the requests in flight
+    :return: int: number of successful downloads
+    """
+    async def run():
+        engine = AsyncS3Engine.from_client(s3_client, max_connections=max_connections)
+        try:
+            start = time.monotonic()
+
+            async def requests():
+                async for key in engine.iter_keys(bucket_name):
+                    yield engine.get_object(bucket_name, key)
+
+            statuses = await _run_windowed(requests(), max_in_flight)
+            logging.info(f"async downloads: {len(statuses)} in {time.monotonic() - start:.2f}s, {engine.stats}")
+            return statuses
+        finally:
+            await engine.close()
+
+    return sum(1 for status in _run_coroutine(run()) if status == 200)
@@ -0,0 +1,456 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from botocore.exceptions import ClientError
+from s3_helpers import (
+    generate_unique_bucket_name,
+    create_bucket_and_wait,
+    probe_versioning_status,
+    put_object_lock_configuration_with_determination,
+    get_object_lock_configuration_with_determination,
+    cleanup_old_buckets,
+)
+from utils.crud import delete_objects_in_batches
+
+# ## Bucket pool
+#
+# Versioned and lock-enabled buckets are only usable once the backend agrees on their
+# configuration, which can take minutes. The pool prepares these buckets ahead of time in
+# background threads, so the consistency waits overlap with the execution of other tests, and hands
+# one ready bucket to each test that asks for it. A bucket given back is emptied and reset, and
+# handed to the next test if its configuration is still the one it was prepared with, otherwise
+# it is torn down. Tests leave retained objects and lock rules behind, so a bucket is only handed
+# again when the reset deleted every version and its versioning and lock configuration are exactly
+# the prepared ones; one with objects under retention or a changed rule is never reused. Spare
+# buckets are torn down when the pool closes.
+
+# kinds of bucket the pool prepares
+VERSIONED = "versioned"
+LOCK = "lock"
+
+# prefix of the pool bucket names, different from the fixtures' ones so the fixtures' cleanups
+# never remove a bucket the pool is still holding
+POOL_BASE_NAME = "pool"
+
+
+class BucketPool:
+    """
+    Prepares versioned (VERSIONED) and lock-enabled (LOCK) buckets ahead of the tests that need them
+    """
+
+    def __init__(self, s3_client, lock_mode, demand, spares=2, workers=8):
+        """
+        :param s3_client: boto3 s3 client
+        :param lock_mode: str: mode of the default retention of LOCK buckets ('GOVERNANCE' or 'COMPLIANCE')
+        :param demand: dict: kind to number of buckets the session is expected to need
+        :param spares: int: buckets of each kind being prepared or ready ahead of the tests
+        :param workers: int: threads preparing, resetting and tearing down buckets
+        """
+        self.s3_client = s3_client
+        self.lock_mode = lock_mode
+        self.spares = spares
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bucket-pool")
+        self._kinds = {}
+        self._closed = False
+        self.prepared = 0
+        self.failed = 0
+        self.recycled = 0
+        self.ready_hits = 0
+        self.fallbacks = 0
+        self.wait_seconds = 0.0
+        self._start(demand)
+
+    def _start(self, demand):
+        self._queues = {kind: queue.Queue() for kind in demand}
+        # buckets still to be prepared, and buckets in preparation or ready but not yet handed to a test
+        self._planned = dict(demand)
+        self._pending = {kind: 0 for kind in demand}
+        for kind in demand:
+            for _ in range(self.spares):
+                self._refill(kind)
+
+    @property
+    def lock_rule(self):
+        return {"DefaultRetention": {"Mode": self.lock_mode, "Days": 1}}
+
+    def _refill(self, kind):
+        with self._lock:
+            if self._closed or self._planned.get(kind, 0) <= 0 or self._pending[kind] >= self.spares:
+                return
+            self._planned[kind] -= 1
+            self._pending[kind] += 1
+        self._executor.submit(self._produce, kind)
+
+    def _produce(self, kind):
+        bucket_name = None
+        if not self._closed:
+            try:
+                bucket_name = self.prepare(kind)
+            except Exception as e:
+                logging.error(f"[bucket_pool] could not prepare a {kind} bucket: {e}")
+                with self._lock:
+                    self.failed += 1
+        # None tells the waiting test to prepare its own bucket
+        self._queues[kind].put(bucket_name)
+
+    def prepare(self, kind, bucket_name=None):
+        """
+        Create a bucket of a kind and wait until its configuration is consistent
+        :param kind: str: VERSIONED or LOCK
+        :param bucket_name: str: name of the bucket (default: a new unique name)
+        :return: str: name of the bucket
+        """
+        bucket_name = bucket_name or generate_unique_bucket_name(base_name=f"{POOL_BASE_NAME}-{kind}")
+        create_bucket_and_wait(self.s3_client, bucket_name)
+        self.s3_client.put_bucket_versioning(Bucket=bucket_name, VersioningConfiguration={"Status": "Enabled"})
+        versioning_status = probe_versioning_status(self.s3_client, bucket_name)
+        if versioning_status != "Enabled":
+            raise Exception(f"Versioning of bucket {bucket_name} is {versioning_status}, expected Enabled")
+
+        if kind == LOCK:
+            configuration = {"ObjectLockEnabled": "Enabled", "Rule": self.lock_rule}
+            put_object_lock_configuration_with_determination(self.s3_client, bucket_name, configuration)
+            applied = get_object_lock_configuration_with_determination(self.s3_client, bucket_name)
+            if not applied or applied["ObjectLockConfiguration"].get("ObjectLockEnabled") != "Enabled":
+                raise Exception(f"Object lock configuration of bucket {bucket_name} is not Enabled")
+
+        with self._lock:
+            self.prepared += 1
+            self._kinds[bucket_name] = kind
+        logging.info(f"[bucket_pool] {kind} bucket {bucket_name} is ready")
+        return bucket_name
+
+    def reset(self, bucket_name, kind):
+        """
+        Empty a bucket given back by a test and check it is still as prepared
+        :param bucket_name: str: name of the bucket
+        :param kind: str: kind the bucket was prepared as
+        :return: bool: True if the bucket can be handed to another test
+        """
+        try:
+            _, errors = delete_objects_in_batches(
+                self.s3_client, bucket_name, versions=True, bypass_governance=self.lock_mode == "GOVERNANCE"
+            )
+            if errors:
+                return False
+            for reset_call in (
+                lambda: self.s3_client.put_bucket_acl(Bucket=bucket_name, ACL="private"),
+                lambda: self.s3_client.delete_bucket_policy(Bucket=bucket_name),
+            ):
+                try:
+                    reset_call()
+                except ClientError as e:
+                    # nothing to reset: no policy, or ACLs disabled on the bucket
+                    if e.response["Error"]["Code"] not in ("NoSuchBucketPolicy", "AccessControlListNotSupported"):
+                        raise
+            if self.s3_client.get_bucket_versioning(Bucket=bucket_name).get("Status") != "Enabled":
+                return False
+            try:
+                lock = self.s3_client.get_object_lock_configuration(Bucket=bucket_name)["ObjectLockConfiguration"]
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "ObjectLockConfigurationNotFoundError":
+                    raise
+                lock = None
+        except ClientError as e:
+            logging.info(f"[bucket_pool] bucket {bucket_name} cannot be reset: {e}")
+            return False
+        if kind == LOCK:
+            return bool(lock) and lock.get("Rule") == self.lock_rule
+        return lock is None
+
+    def acquire(self, kind):
+        """
+        Take a ready bucket of a kind, waiting for one in preparation or preparing it if none is planned
+        :param kind: str: VERSIONED or LOCK
+        :return: str: name of the bucket, owned by the caller until release
+        """
+        with self._lock:
+            pooled = self._pending.get(kind, 0) > 0
+            if pooled:
+                self._pending[kind] -= 1
+        self._refill(kind)
+
+        if pooled:
+            start = time.monotonic()
+            bucket_name = self._queues[kind].get()
+            self._record_wait(time.monotonic() - start)
+            if bucket_name:
+                logging.info(f"[bucket_pool] handing {kind} bucket {bucket_name}")
+                return bucket_name
+
+        # more buckets requested than planned (e.g. reruns) or the preparation failed
+        with self._lock:
+            self.fallbacks += 1
+        return self.prepare(kind)
+
+    def _record_wait(self, waited):
+        with self._lock:
+            self.wait_seconds += waited
+            if waited < 0.01:
+                self.ready_hits += 1
+
+    def release(self, bucket_name):
+        """
+        Give back a bucket taken with acquire, it is reset or torn down in the background
+        :param bucket_name: str: name of the bucket
+        """
+        self._executor.submit(self._recycle, bucket_name)
+
+    def _recycle(self, bucket_name):
+        with self._lock:
+            kind = self._kinds.get(bucket_name)
+            closed = self._closed
+        if kind in self._queues and not closed and self.reset(bucket_name, kind):
+            with self._lock:
+                self.recycled += 1
+                self._pending[kind] += 1
+            self._queues[kind].put(bucket_name)
+            return
+        self._teardown(bucket_name)
+
+    def _teardown(self, bucket_name):
+        try:
+            delete_objects_in_batches(
+                self.s3_client, bucket_name, versions=True, bypass_governance=self.lock_mode == "GOVERNANCE"
+            )
+            self.s3_client.delete_bucket(Bucket=bucket_name)
+            logging.info(f"[bucket_pool] deleted bucket {bucket_name}")
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "NoSuchBucket":
+                return True
+            # e.g. objects under COMPLIANCE retention, left for cleanup_old_buckets on a later run
+            logging.warning(f"[bucket_pool] could not delete bucket {bucket_name}: {e}")
+            return False
+
+    def _teardown_all(self, bucket_names):
+        with ThreadPoolExecutor(max_workers=8, thread_name_prefix="bucket-pool-teardown") as executor:
+            return list(executor.map(self._teardown, bucket_names))
+
+    def close(self):
+        """
+        Stop preparing buckets, wait for the background work and tear down the spare buckets
+        """
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=True)
+
+        spares = []
+        for bucket_queue in self._queues.values():
+            while not bucket_queue.empty():
+                bucket_name = bucket_queue.get()
+                if bucket_name:
+                    spares.append(bucket_name)
+        self._teardown_all(spares)
+        logging.info(f"[bucket_pool] closed, {len(spares)} spare buckets torn down")
+
+        # buckets left behind by previous runs (locked objects) once their retention expired
+        cleanup_old_buckets(self.s3_client, POOL_BASE_NAME)
+
+    def summary(self):
+        return (
+            f"bucket pool prepared={self.prepared} recycled={self.recycled} ready on request={self.ready_hits} "
+            f"prepared by the test={self.fallbacks} failed={self.failed} "
+            f"total wait={self.wait_seconds:.2f}s"
+        )
+
+
+# ## Bucket pool shared by pytest-xdist workers
+#
+# Each xdist worker is a separate process with its own fixtures, so an in-process pool would
+# prepare buckets per worker. The shared pool keeps the state of every bucket of the run in a
+# SQLite file known by all workers: any worker prepares buckets while the run is short of spares,
+# workers lease ready buckets and give them back to be recycled, and the last worker to finish
+# tears down what is left and cleans up old pool buckets. Every worker of the run is registered as
+# running by the first one to start, so a worker still collecting counts as running too and an
+# early finisher never tears down buckets it will lease. If a worker crashes the pool is left
+# behind, for the cleanup of old pool buckets of a later run.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    name TEXT PRIMARY KEY, kind TEXT NOT NULL, state TEXT NOT NULL, worker TEXT, updated REAL
+);
+CREATE TABLE IF NOT EXISTS plan (kind TEXT PRIMARY KEY, remaining INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS workers (worker TEXT PRIMARY KEY, state TEXT NOT NULL);
+"""
+
+
+class SharedBucketPool(BucketPool):
+    """
+    Bucket pool coordinated across processes through a SQLite file
+
+    Bucket states: preparing, ready, leased, failed, closing, deleted and kept (could not be deleted)
+    """
+
+    def __init__(self, s3_client, lock_mode, demand, db_path, worker, run_workers=(), spares=2, workers=8,
+                 poll_interval=0.2):
+        """
+        :param db_path: str: SQLite file shared by the workers of the run
+        :param worker: str: name of this worker (e.g. the xdist worker id)
+        :param run_workers: list of str: names of every worker of the run, this one included
+        :param poll_interval: float: seconds between checks for ready buckets and missing spares
+        (see BucketPool for the other parameters, spares is shared by all the workers)
+        """
+        self.db_path = db_path
+        self.worker = worker
+        self.run_workers = [worker, *(name for name in run_workers if name != worker)]
+        self.poll_interval = poll_interval
+        self.leased = 0
+        super().__init__(s3_client, lock_mode, demand, spares=spares, workers=workers)
+
+    @contextmanager
+    def _transaction(self):
+        # one connection per transaction, so threads and processes never share one
+        db = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def _start(self, demand):
+        db = sqlite3.connect(self.db_path, timeout=60)
+        try:
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+        with self._transaction() as db:
+            # every worker collects the whole run, the first one to start sets the plan
+            db.executemany("INSERT OR IGNORE INTO plan VALUES (?, ?)", demand.items())
+            # workers that already finished keep their state
+            db.executemany("INSERT OR IGNORE INTO workers VALUES (?, 'running')", [(name,) for name in self.run_workers])
+        self._kinds_planned = list(demand)
+        self._stop = threading.Event()
+        self._maintainer = threading.Thread(target=self._maintain, name="bucket-pool-maintainer", daemon=True)
+        self._maintainer.start()
+
+    def _set_state(self, bucket_name, state, db=None):
+        if db is None:
+            with self._transaction() as db:
+                return self._set_state(bucket_name, state, db)
+        db.execute(
+            "UPDATE buckets SET state = ?, worker = ?, updated = ? WHERE name = ?",
+            (state, self.worker, time.time(), bucket_name),
+        )
+
+    def _maintain(self):
+        while not self._stop.is_set():
+            for kind in self._kinds_planned:
+                bucket_name = self._claim_preparation(kind)
+                if bucket_name:
+                    self._executor.submit(self._produce_shared, kind, bucket_name)
+            self._stop.wait(self.poll_interval)
+
+    def _claim_preparation(self, kind):
+        with self._transaction() as db:
+            remaining = db.execute("SELECT remaining FROM plan WHERE kind = ?", (kind,)).fetchone()
+            active = db.execute(
+                "SELECT COUNT(*) FROM buckets WHERE kind = ? AND state IN ('preparing', 'ready')", (kind,)
+            ).fetchone()[0]
+            if not remaining or remaining[0] <= 0 or active >= self.spares:
+                return None
+            bucket_name = generate_unique_bucket_name(base_name=f"{POOL_BASE_NAME}-{kind}")
+            db.execute("UPDATE plan SET remaining = remaining - 1 WHERE kind = ?", (kind,))
+            db.execute(
+                "INSERT INTO buckets VALUES (?, ?, 'preparing', ?, ?)", (bucket_name, kind, self.worker, time.time())
+            )
+            return bucket_name
+
+    def _produce_shared(self, kind, bucket_name):
+        try:
+            self.prepare(kind, bucket_name)
+            self._set_state(bucket_name, "ready")
+        except Exception as e:
+            logging.error(f"[bucket_pool] could not prepare {kind} bucket {bucket_name}: {e}")
+            with self._lock:
+                self.failed += 1
+            self._set_state(bucket_name, "failed")
+
+    def acquire(self, kind):
+        start = time.monotonic()
+        while True:
+            with self._transaction() as db:
+                row = db.execute(
+                    "SELECT name FROM buckets WHERE kind = ? AND state = 'ready' ORDER BY updated LIMIT 1", (kind,)
+                ).fetchone()
+                if row:
+                    self._set_state(row[0], "leased", db)
+                else:
+                    remaining = db.execute("SELECT remaining FROM plan WHERE kind = ?", (kind,)).fetchone()
+                    preparing = db.execute(
+                        "SELECT COUNT(*) FROM buckets WHERE kind = ? AND state = 'preparing'", (kind,)
+                    ).fetchone()[0]
+            if row:
+                self._record_wait(time.monotonic() - start)
+                with self._lock:
+                    self.leased += 1
+                    self._kinds[row[0]] = kind
+                logging.info(f"[bucket_pool] {self.worker} leased {kind} bucket {row[0]}")
+                return row[0]
+            if not preparing and (not remaining or remaining[0] <= 0):
+                break
+            time.sleep(self.poll_interval)
+
+        # more buckets requested than planned (e.g. reruns), prepare one for this test
+        with self._lock:
+            self.fallbacks += 1
+        bucket_name = self.prepare(kind)
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO buckets VALUES (?, ?, 'leased', ?, ?)", (bucket_name, kind, self.worker, time.time())
+            )
+        return bucket_name
+
+    def _recycle(self, bucket_name):
+        with self._lock:
+            kind = self._kinds.get(bucket_name)
+            closed = self._closed
+        if kind and not closed and self.reset(bucket_name, kind):
+            with self._lock:
+                self.recycled += 1
+            self._set_state(bucket_name, "ready")
+            return
+        self._set_state(bucket_name, "deleted" if self._teardown(bucket_name) else "kept")
+
+    def close(self):
+        """
+        Stop preparing buckets and, on the last worker to finish, tear down every bucket left in the pool
+        """
+        self._stop.set()
+        self._maintainer.join()
+        with self._lock:
+            self._closed = True
+        self._executor.shutdown(wait=True)
+
+        with self._transaction() as db:
+            db.execute("UPDATE workers SET state = 'finished' WHERE worker = ?", (self.worker,))
+            running = db.execute("SELECT COUNT(*) FROM workers WHERE state = 'running'").fetchone()[0]
+            leftovers = []
+            if not running:
+                leftovers = [row[0] for row in db.execute(
+                    "SELECT name FROM buckets WHERE state IN ('ready', 'failed', 'preparing')"
+                )]
+                db.executemany("UPDATE buckets SET state = 'closing' WHERE name = ?", [(name,) for name in leftovers])
+        if running:
+            logging.info(f"[bucket_pool] {self.worker} finished, {running} workers still using the pool")
+            return
+
+        results = self._teardown_all(leftovers)
+        with self._transaction() as db:
+            for bucket_name, deleted in zip(leftovers, results):
+                self._set_state(bucket_name, "deleted" if deleted else "kept", db)
+        logging.info(f"[bucket_pool] {self.worker} was the last worker, {len(leftovers)} spare buckets torn down")
+        cleanup_old_buckets(self.s3_client, POOL_BASE_NAME)
+
+    def summary(self):
+        return f"{super().summary()} leased={self.leased} (worker {self.worker})"
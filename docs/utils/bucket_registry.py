@@ -0,0 +1,233 @@
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import weakref
+from contextlib import closing
+from datetime import datetime, timezone
+from utils.tenants import credentials_key
+
+# ## Bucket registry
+#
+# cleanup_old_buckets runs in the teardown of the bucket fixtures and used to list every bucket
+# of the account to find the ones of the specs, a cost that grows with the tests times the buckets
+# of the account, and that dominates the teardowns on shared accounts with thousands of buckets.
+# The registry records in a SQLite file every bucket created by the registry clients of the run
+# (through their CreateBucket and DeleteBucket events), with its account, creation time, the lock
+# mode of its profile, its state (active, deleted, or unregistered when found by a reconcile) and
+# the process that owns it. Cleanups then only look at the registry entries of the account.
+#
+# Before a cleanup, a reconcile lists the account if no session or xdist worker sharing the file
+# did so within the reconcile interval: it adds the spec buckets the registry missed (created by
+# older runs, other machines or clients outside the registry) and marks the registered buckets
+# that no longer exist as deleted.
+#
+# Buckets still owned by another live process (e.g. another xdist worker) are never cleaned up,
+# so a GOVERNANCE cleanup no longer removes the bucket another worker is testing with.
+
+ACTIVE = "active"
+DELETED = "deleted"
+UNREGISTERED = "unregistered"
+
+DEFAULT_RECONCILE_INTERVAL = 60 * 60
+# buckets created this recently may be missing from a listing without having been deleted
+LISTING_MARGIN = 60
+
+_active = None
+
+
+def activate(registry):
+    """
+    Make a registry the one used by cleanup_old_buckets, None to go back to listing the account
+    """
+    global _active
+    _active = registry
+
+
+def active_registry():
+    return _active
+
+
+def _process_is_live(owner):
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        # found by a reconcile, or owned by another machine sharing the file: cleaned up by age or lock mode
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class BucketRegistry:
+    """
+    Buckets created by the specs, per account, kept in a SQLite file shared by runs and xdist workers
+    """
+
+    def __init__(self, db_path, reconcile_interval=DEFAULT_RECONCILE_INTERVAL, prefix="test-"):
+        """
+        :param db_path: str: SQLite file of the registry
+        :param reconcile_interval: float: minimum seconds between two listings of an account
+        :param prefix: str: prefix of the bucket names of the specs
+        """
+        self.db_path = db_path
+        self.reconcile_interval = reconcile_interval
+        self.prefix = prefix
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._accounts = weakref.WeakKeyDictionary()
+        self.registered = 0
+        self.cleanups = 0
+        self.skipped_live = 0
+        self.reconciled = 0
+        self.found_unregistered = 0
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, account TEXT, lock_mode TEXT, created REAL, state TEXT, owner TEXT, updated REAL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS buckets_account ON buckets (account, state)")
+            connection.execute("CREATE TABLE IF NOT EXISTS reconciles (account TEXT PRIMARY KEY, listed REAL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _account(self, s3_client):
+        # resolving the credentials of a profile is not free, remember them per client
+        with self._lock:
+            account = self._accounts.get(s3_client)
+        if account is None:
+            account = credentials_key(s3_client)
+            with self._lock:
+                self._accounts[s3_client] = account
+        return account
+
+    # ### Recording
+
+    def attach(self, s3_client, lock_mode=None):
+        """
+        Record the buckets a client creates and deletes
+        :param s3_client: boto3 s3 client
+        :param lock_mode: str: lock mode of the client's profile
+        """
+        def remember_bucket(params, context, **kwargs):
+            context["bucket_registry_name"] = params.get("Bucket")
+
+        def created(http_response, context, **kwargs):
+            if http_response.status_code < 300 and context.get("bucket_registry_name"):
+                self.register(s3_client, context["bucket_registry_name"], lock_mode)
+
+        def deleted(http_response, parsed, context, **kwargs):
+            if http_response.status_code < 300 or parsed.get("Error", {}).get("Code") == "NoSuchBucket":
+                self.mark_deleted(context.get("bucket_registry_name"))
+
+        for operation, handler in (("CreateBucket", created), ("DeleteBucket", deleted)):
+            s3_client.meta.events.register(f"before-parameter-build.s3.{operation}", remember_bucket)
+            s3_client.meta.events.register(f"after-call.s3.{operation}", handler)
+
+    def register(self, s3_client, bucket_name, lock_mode=None):
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets (name, account, lock_mode, created, state, owner, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (bucket_name, self._account(s3_client), lock_mode, now, ACTIVE, self.owner, now),
+            )
+        with self._lock:
+            self.registered += 1
+
+    def mark_deleted(self, bucket_name):
+        if not bucket_name:
+            return
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "UPDATE buckets SET state = ?, updated = ? WHERE name = ?", (DELETED, time.time(), bucket_name)
+            )
+
+    # ### Cleanup
+
+    def cleanup_candidates(self, s3_client, base_name):
+        """
+        Buckets of the account named after a base name that a cleanup may delete
+        :param s3_client: boto3 s3 client
+        :param base_name: str: base name of the buckets, as given to generate_unique_bucket_name
+        :return: list of (bucket name, creation datetime), without the buckets of other live processes
+        """
+        self.reconcile(s3_client)
+        with closing(self._connect()) as connection:
+            rows = connection.execute(
+                "SELECT name, created, owner FROM buckets WHERE account = ? AND state != ?",
+                (self._account(s3_client), DELETED),
+            ).fetchall()
+        candidates = []
+        for name, created, owner in rows:
+            if not name.startswith(f"{self.prefix}{base_name}"):
+                continue
+            if owner and owner != self.owner and _process_is_live(owner):
+                with self._lock:
+                    self.skipped_live += 1
+                continue
+            candidates.append((name, datetime.fromtimestamp(created, timezone.utc)))
+        with self._lock:
+            self.cleanups += 1
+        return candidates
+
+    def reconcile(self, s3_client, force=False):
+        """
+        List the account to add the spec buckets the registry missed and drop the ones gone
+        :param s3_client: boto3 s3 client
+        :param force: bool: list even if the account was listed within the reconcile interval
+        :return: bool: True if the account was listed
+        """
+        account = self._account(s3_client)
+        started = time.time()
+        with closing(self._connect()) as connection, connection:
+            # claim the listing, so concurrent workers do not list the account too
+            row = connection.execute("SELECT listed FROM reconciles WHERE account = ?", (account,)).fetchone()
+            if row and not force and started - row[0] < self.reconcile_interval:
+                return False
+            connection.execute("INSERT OR REPLACE INTO reconciles (account, listed) VALUES (?, ?)", (account, started))
+
+        listed = {
+            bucket["Name"]: bucket["CreationDate"].timestamp()
+            for bucket in s3_client.list_buckets()["Buckets"]
+            if bucket["Name"].startswith(self.prefix)
+        }
+        with closing(self._connect()) as connection, connection:
+            known = {
+                name: (state, created)
+                for name, state, created in connection.execute(
+                    "SELECT name, state, created FROM buckets WHERE account = ?", (account,)
+                )
+            }
+            missed = [(name, account, None, created, UNREGISTERED, None, started)
+                      for name, created in listed.items() if known.get(name, (DELETED,))[0] == DELETED]
+            connection.executemany(
+                "INSERT OR REPLACE INTO buckets (name, account, lock_mode, created, state, owner, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                missed,
+            )
+            # compared here rather than with NOT IN (...), as SQLite limits the variables of a query
+            # and an account may hold thousands of spec buckets; buckets created around the listing
+            # may be missing from it and are kept
+            gone = [(DELETED, started, name)
+                    for name, (state, created) in known.items()
+                    if state != DELETED and name not in listed and created < started - LISTING_MARGIN]
+            connection.executemany("UPDATE buckets SET state = ?, updated = ? WHERE name = ?", gone)
+        with self._lock:
+            self.reconciled += 1
+            self.found_unregistered += len(missed)
+        logging.info(f"[bucket_registry] reconciled {len(listed)} listed buckets, {len(missed)} were not registered")
+        return True
+
+    def summary(self):
+        return (
+            f"bucket registry registered={self.registered} cleanups={self.cleanups} "
+            f"reconciles={self.reconciled} found unregistered={self.found_unregistered} "
+            f"skipped live buckets of other processes={self.skipped_live}"
+        )
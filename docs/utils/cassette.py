@@ -0,0 +1,323 @@
+import base64
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from contextlib import contextmanager
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import pytest
+import requests
+from botocore.awsrequest import AWSResponse
+from utils.consistency import skip_delays
+
+# ## Cassettes
+#
+# Re-running a spec to check its rendered docs or an assertion repeats whole bucket lifecycles
+# against a live region, including the waits for eventual consistency. In record mode every HTTP
+# exchange of the tests (boto3 clients of the registry and the requests library, e.g. presigned
+# URLs) is saved to a cassette, one json file per test. In replay mode the responses are served
+# back from the cassette without touching the network, and the polling delays of converge and of the
+# waiters are skipped, so the same run takes seconds.
+#
+# Bucket names made by generate_valid_bucket_name ("test-" + base name + 6 random hex) differ on
+# every run, so they are replaced by placeholders numbered per base name in the order the test
+# first sends them. A request matches the first unused recorded one with the same method and
+# normalized URL (signatures and dates removed), or else the first unused one of the same S3
+# operation, for tests that pick names at random.
+
+MODES = ("off", "record", "replay")
+CASSETTE_VERSION = 1
+BUCKET_NAME = re.compile(r"test-[a-z0-9-]*?[0-9a-f]{6}(?![a-z0-9-])")
+PLACEHOLDER = re.compile(r"\{bucket:([a-z0-9-]*):(\d+)\}")
+VOLATILE_PARAMS = {
+    "x-amz-credential", "x-amz-date", "x-amz-expires", "x-amz-signature", "x-amz-security-token",
+    "awsaccesskeyid", "signature", "expires",
+}
+
+_active = None
+_active_lock = threading.Lock()
+
+
+class CassetteMiss(Exception):
+    """
+    A request without a recorded response in replay mode
+    """
+
+
+class _RecordedBody(io.BytesIO):
+    """
+    Response body served from memory, readable by botocore as an urllib3 response
+    """
+
+    def stream(self, amt=1024 * 1024, decode_content=None):
+        while True:
+            chunk = self.read(amt)
+            if not chunk:
+                return
+            yield chunk
+
+
+def cassette_path(cassette_dir, nodeid):
+    """
+    File of the cassette of a test
+    :param cassette_dir: str: root directory of the cassettes
+    :param nodeid: str: pytest node id, e.g. "acl_test.py::test_put_object_acl[private]"
+    :return: str: path of a json file, one directory per spec
+    """
+    module, _, name = nodeid.partition("::")
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_")
+    if len(name) > 120:
+        name = f"{name[:100]}-{hashlib.sha1(name.encode()).hexdigest()[:12]}"
+    spec = os.path.splitext(os.path.basename(module))[0]
+    return os.path.join(cassette_dir, spec, f"{name}.json")
+
+
+def _encode_body(body):
+    try:
+        return {"text": body.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(body).decode()}
+
+
+def _decode_body(record):
+    if "base64" in record:
+        return base64.b64decode(record["base64"])
+    return record.get("text", "").encode("utf-8")
+
+
+class Cassette:
+    """
+    Recorded HTTP exchanges of one test
+    """
+
+    def __init__(self, path, mode):
+        """
+        :param path: str: json file of the cassette
+        :param mode: str: record or replay
+        """
+        self.path = path
+        self.mode = mode
+        self.interactions = []
+        self._lock = threading.Lock()
+        # current bucket name <-> placeholder
+        self._placeholders = {}
+        self._names = {}
+        # placeholders to the names seen when recording
+        self._recorded_names = {}
+        self._used = set()
+        self.replayed = 0
+        if mode == "replay":
+            with open(path, "r") as f:
+                data = json.load(f)
+            self.interactions = data["interactions"]
+            self._recorded_names = data.get("buckets", {})
+        # recorded interactions not replayed yet, by (method, url) and by (method, operation)
+        self._by_url = {}
+        self._by_operation = {}
+        for index, recorded in enumerate(self.interactions):
+            self._by_url.setdefault((recorded["method"], recorded["url"]), deque()).append(index)
+            self._by_operation.setdefault((recorded["method"], recorded["operation"]), deque()).append(index)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({
+                "version": CASSETTE_VERSION,
+                "buckets": self._recorded_names,
+                "interactions": self.interactions,
+            }, f, indent=1)
+
+    # ### Bucket name placeholders
+
+    def _placeholder(self, name, allocate):
+        placeholder = self._placeholders.get(name)
+        if placeholder is None and allocate:
+            base = name[:-6]
+            index = sum(1 for other in self._placeholders if other[:-6] == base)
+            placeholder = f"{{bucket:{base}:{index}}}"
+            self._placeholders[name] = placeholder
+            self._names[placeholder] = name
+            if self.mode == "record":
+                self._recorded_names[placeholder] = name
+        return placeholder
+
+    def normalize(self, text, allocate=False):
+        """
+        Replace known random bucket names by placeholders
+        :param allocate: bool: give placeholders to unknown names too (for outgoing requests)
+        """
+        return BUCKET_NAME.sub(lambda match: self._placeholder(match.group(0), allocate) or match.group(0), text)
+
+    def denormalize(self, text):
+        """
+        Replace placeholders by the bucket names of this run (or the recorded ones when unknown)
+        """
+        def name(match):
+            placeholder = match.group(0)
+            return self._names.get(placeholder) or self._recorded_names.get(placeholder, placeholder)
+        return PLACEHOLDER.sub(name, text)
+
+    def request_key(self, method, url, copy_source=None):
+        """
+        :return: (method, normalized url, operation) where operation is the sorted query names
+        """
+        parts = urlsplit(url)
+        query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                       if name.lower() not in VOLATILE_PARAMS)
+        normalized = self.normalize(f"{parts.netloc}{parts.path}?{urlencode(query)}", allocate=True)
+        if isinstance(copy_source, bytes):
+            copy_source = copy_source.decode()
+        if copy_source:
+            normalized += f" copy-source={self.normalize(copy_source, allocate=True)}"
+        return method, normalized, ",".join(name for name, _ in query)
+
+    # ### Recording and replaying
+
+    def record(self, key, status, headers, body):
+        method, url, operation = key
+        with self._lock:
+            self.interactions.append({
+                "method": method,
+                "url": url,
+                "operation": operation,
+                "status": status,
+                "headers": {name: self.normalize(str(value)) for name, value in headers.items()},
+                "body": _encode_body(self.normalize(body.decode("utf-8")).encode("utf-8"))
+                if _is_text(body) else _encode_body(body),
+            })
+
+    def _next_unused(self, indexes):
+        while indexes:
+            index = indexes.popleft()
+            if index not in self._used:
+                return index
+        return None
+
+    def replay(self, key):
+        """
+        :return: (status, headers, body) of the recorded response
+        :raises CassetteMiss: when no recorded request matches
+        """
+        method, url, operation = key
+        with self._lock:
+            index = self._next_unused(self._by_url.get((method, url)))
+            if index is None:
+                index = self._next_unused(self._by_operation.get((method, operation)))
+            if index is None:
+                raise CassetteMiss(f"No recorded response for {method} {url} in {self.path}, record it again with --cassette-mode record")
+            self._used.add(index)
+            self.replayed += 1
+            recorded = self.interactions[index]
+            body = _decode_body(recorded["body"])
+            if "text" in recorded["body"]:
+                body = self.denormalize(body.decode("utf-8")).encode("utf-8")
+            headers = {name: self.denormalize(value) for name, value in recorded["headers"].items()}
+            return recorded["status"], headers, body
+
+
+def _is_text(body):
+    try:
+        body.decode("utf-8")
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def active_cassette():
+    return _active
+
+
+def attach(s3_client):
+    """
+    Route a client's requests through the active cassette, recording or replaying them
+    Attach it before other instrumentation: its send wrapper is then the innermost one, and its
+    replay handler is registered last, so injected faults and metrics still see every request
+    (a fault answer is served instead of the cassette and never recorded; injected latency is
+    still slept in replay)
+    :param s3_client: boto3 s3 client
+    """
+    # the first before-send handler returning a response ends the event, replay after the others
+    s3_client.meta.events.register_last("before-send.s3", _before_send)
+
+    http_session = s3_client._endpoint.http_session
+    send = http_session.send
+
+    def recorded_send(request):
+        response = send(request)
+        cassette = _active
+        if cassette and cassette.mode == "record":
+            body = response.content
+            key = cassette.request_key(request.method, request.url, request.headers.get("x-amz-copy-source"))
+            cassette.record(key, response.status_code, dict(response.headers), body)
+            # the body is served from memory from now on, give the connection back to the pool
+            response.raw.release_conn()
+            response.raw = _RecordedBody(body)
+        return response
+
+    http_session.send = recorded_send
+
+
+def _before_send(request, **kwargs):
+    cassette = _active
+    if not cassette or cassette.mode != "replay":
+        return None
+    key = cassette.request_key(request.method, request.url, request.headers.get("x-amz-copy-source"))
+    status, headers, body = cassette.replay(key)
+    return AWSResponse(request.url, status, headers, _RecordedBody(body))
+
+
+def _requests_send(original):
+    def send(session, request, **kwargs):
+        cassette = _active
+        if not cassette:
+            return original(session, request, **kwargs)
+        key = cassette.request_key(request.method, request.url)
+        if cassette.mode == "record":
+            response = original(session, request, **kwargs)
+            cassette.record(key, response.status_code, dict(response.headers), response.content)
+            return response
+        status, headers, body = cassette.replay(key)
+        response = requests.models.Response()
+        response.status_code = status
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response._content = body
+        response.url = request.url
+        response.request = request
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+    return send
+
+
+@contextmanager
+def use_cassette(path, mode):
+    """
+    Record or replay the HTTP exchanges made while the context is active
+    :param path: str: json file of the cassette
+    :param mode: str: record or replay
+    :return: Cassette
+    """
+    global _active
+    cassette = Cassette(path, mode)
+    monkeypatch = pytest.MonkeyPatch()
+    monkeypatch.setattr(requests.Session, "send", _requests_send(requests.Session.send))
+    if mode == "replay":
+        # recorded responses already reflect the consistency waits, replaying them needs none
+        skip_delays(True)
+    with _active_lock:
+        _active = cassette
+    try:
+        yield cassette
+    finally:
+        with _active_lock:
+            _active = None
+        monkeypatch.undo()
+        skip_delays(False)
+        if mode == "record":
+            cassette.save()
+            logging.info(f"[cassette] recorded {len(cassette.interactions)} exchanges to {path}")
+        else:
+            logging.info(f"[cassette] replayed {cassette.replayed} of {len(cassette.interactions)} exchanges from {path}")
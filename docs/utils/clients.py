@@ -0,0 +1,210 @@
+import logging
+import threading
+import time
+import weakref
+import boto3
+from botocore.config import Config
+
+# ## Client registry
+#
+# Building a boto3 Session and client loads the botocore service model and starts an empty
+# connection pool, doing it for every test adds up on runs with hundreds of parametrized cases.
+# The registry below builds each session and client once per pytest session and hands the same
+# (thread-safe) client to every test that asks for the same profile.
+
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+
+# clients built by a registry remember where they came from, so an equivalent client with a
+# bigger connection pool can be borrowed from the same registry
+_client_origins = weakref.WeakKeyDictionary()
+
+
+def profile_key(profile):
+    """
+    Identify a profile from the test params
+    :param profile: dict: profile record from the params yaml
+    :return: tuple: profile name, or region, endpoint and access key for explicit credentials
+    """
+    if "profile_name" in profile:
+        return ("profile", profile["profile_name"], profile.get("endpoint_url"))
+    return ("keys", profile["region_name"], profile.get("endpoint_url"), profile["aws_access_key_id"])
+
+
+class ClientRegistry:
+    """
+    Session-wide cache of boto3 sessions and S3 clients keyed by profile
+    """
+
+    def __init__(self, client_hooks=None):
+        """
+        :param client_hooks: list of callables receiving (client, profile) right after a client is built,
+                             used to attach instrumentation to every client
+        """
+        self.client_hooks = list(client_hooks or [])
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._clients = {}
+        self.built = 0
+        self.reused = 0
+        self.build_seconds = 0.0
+
+    def session_for(self, profile):
+        """
+        Get or create the boto3 Session of a profile
+        :param profile: dict: profile record from the params yaml
+        :return: boto3.Session
+        """
+        key = profile_key(profile)
+        with self._lock:
+            if key not in self._sessions:
+                if "profile_name" in profile:
+                    session = boto3.Session(profile_name=profile["profile_name"])
+                else:
+                    session = boto3.Session(
+                        region_name=profile["region_name"],
+                        aws_access_key_id=profile["aws_access_key_id"],
+                        aws_secret_access_key=profile["aws_secret_access_key"],
+                    )
+                self._sessions[key] = session
+            return self._sessions[key]
+
+    def client_for(self, profile, max_pool_connections=None):
+        """
+        Get or create the S3 client of a profile
+        :param profile: dict: profile record from the params yaml, may set max_pool_connections,
+                        retry_mode and max_attempts
+        :param max_pool_connections: int: overrides the pool size set on the profile
+        :return: boto3 s3 client
+        """
+        pool_size = max_pool_connections or profile.get("max_pool_connections", DEFAULT_MAX_POOL_CONNECTIONS)
+        key = (profile_key(profile), pool_size)
+        session = self.session_for(profile)
+        with self._lock:
+            if key in self._clients:
+                self.reused += 1
+                return self._clients[key]
+
+            start = time.monotonic()
+            # botocore's own retry behavior unless the profile asks for another one
+            retries = {
+                setting: profile[name]
+                for name, setting in (("retry_mode", "mode"), ("max_attempts", "max_attempts"))
+                if name in profile
+            }
+            client = session.client(
+                "s3",
+                endpoint_url=profile.get("endpoint_url"),
+                config=Config(max_pool_connections=pool_size, retries=retries or None),
+            )
+            self.build_seconds += time.monotonic() - start
+            self.built += 1
+            for hook in self.client_hooks:
+                hook(client, profile)
+            self._clients[key] = client
+            _client_origins[client] = (self, profile)
+            return client
+
+    @property
+    def saved_seconds(self):
+        """
+        Estimated construction time avoided by reusing clients (reuses times the mean build time)
+        """
+        if not self.built:
+            return 0.0
+        return self.reused * self.build_seconds / self.built
+
+    def summary(self):
+        return (
+            f"s3 clients built={self.built} reused={self.reused} "
+            f"build time={self.build_seconds:.2f}s estimated saved={self.saved_seconds:.2f}s"
+        )
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+            self._sessions.clear()
+        logging.info("Closed all registry s3 clients")
+
+
+def client_profile(s3_client):
+    """
+    Profile record a client was built from
+    :param s3_client: boto3 s3 client
+    :return: dict: profile from the params yaml, None if the client was not built by a registry
+    """
+    origin = _client_origins.get(s3_client)
+    return origin[1] if origin else None
+
+
+def frozen_credentials(s3_client):
+    """
+    Credentials resolved by the session of a client (from its profile or explicit keys)
+    :param s3_client: boto3 s3 client built by a ClientRegistry
+    :return: botocore ReadOnlyCredentials: access_key, secret_key and token
+    :raises ValueError: if the client was not built by a registry, boto3 does not expose its credentials
+    """
+    origin = _client_origins.get(s3_client)
+    if not origin:
+        raise ValueError("the credentials of a client are only known for clients built by a ClientRegistry")
+    registry, profile = origin
+    return registry.session_for(profile).get_credentials().get_frozen_credentials()
+
+
+def client_with_pool(s3_client, max_pool_connections):
+    """
+    Borrow a client equivalent to s3_client whose connection pool fits max_pool_connections workers,
+    from the registry that built s3_client, which closes it with its other clients
+    :param s3_client: boto3 s3 client
+    :param max_pool_connections: int: number of connections the caller will use at once
+    :return: boto3 s3 client, s3_client itself if its pool is already big enough or it was not
+             built by a registry
+    """
+    if s3_client.meta.config.max_pool_connections >= max_pool_connections:
+        return s3_client
+
+    origin = _client_origins.get(s3_client)
+    if not origin:
+        logging.warning(
+            f"s3 client not built by a ClientRegistry, its pool of {s3_client.meta.config.max_pool_connections} "
+            f"connections is used for {max_pool_connections} workers"
+        )
+        return s3_client
+    registry, profile = origin
+    return registry.client_for(profile, max_pool_connections)
+
+
+def client_spec(s3_client, max_pool_connections=None):
+    """
+    Picklable description of a client, used to rebuild it in another process
+    :param s3_client: boto3 s3 client built by a ClientRegistry
+    :param max_pool_connections: int: pool size of the rebuilt client (default: the same as s3_client)
+    :return: dict: arguments for client_from_spec
+    """
+    credentials = frozen_credentials(s3_client)
+    return {
+        "region_name": s3_client.meta.region_name,
+        "endpoint_url": s3_client.meta.endpoint_url,
+        "aws_access_key_id": credentials.access_key,
+        "aws_secret_access_key": credentials.secret_key,
+        "aws_session_token": credentials.token,
+        "max_pool_connections": max_pool_connections or s3_client.meta.config.max_pool_connections,
+        "retries": s3_client.meta.config.retries,
+        "s3": s3_client.meta.config.s3,
+    }
+
+
+def client_from_spec(spec):
+    """
+    Build a client from the description returned by client_spec
+    :param spec: dict: client description
+    :return: boto3 s3 client
+    """
+    spec = dict(spec)
+    config = Config(
+        max_pool_connections=spec.pop("max_pool_connections"),
+        retries=spec.pop("retries"),
+        s3=spec.pop("s3"),
+    )
+    return boto3.Session().client("s3", config=config, **spec)
@@ -0,0 +1,295 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any
+from utils.metrics import percentile
+
+# ## Eventual consistency polling
+#
+# Some features (versioning, object lock, retention) take a while to be known by every replica of
+# the backend. Instead of sleeping a fixed, growing, amount of time between attempts, the helpers
+# below poll with short jittered sleeps and stop as soon as enough consecutive reads agree.
+#
+# Reads meant to hit different replicas can be sent concurrently (fan_out), boto3 clients are
+# thread-safe and share their connection pool, so a round of N reads costs about one round-trip.
+#
+# Replayed cassettes (see utils/cassette.py) answer with responses that already reflect the waits
+# of the recorded run, so the delays between the polls of converge and of the waiters can be
+# skipped. Other sleeps (injected latency, retries of the specs) are not affected.
+
+_delays_skipped = threading.Event()
+
+
+def skip_delays(skip):
+    """
+    Skip, or make again, the delays between the polls of converge and of the waiters
+    :param skip: bool: True to skip the delays
+    """
+    if skip:
+        _delays_skipped.set()
+    else:
+        _delays_skipped.clear()
+
+
+def poll_delay(seconds):
+    """
+    Sleep between two polls, unless the delays are skipped
+    :param seconds: float: delay in seconds
+    """
+    if not _delays_skipped.is_set():
+        time.sleep(seconds)
+
+
+@dataclass
+class ConvergenceResult:
+    """
+    Outcome of a converge call
+    :param name: str: label used in logs and in the convergence history
+    :param value: last value returned by the probe (None if it never returned)
+    :param converged: bool: True if the quorum was reached before the timeout
+    :param elapsed: float: seconds spent until convergence or timeout
+    :param probes: int: number of probe calls made
+    :param rounds: int: number of times the agreement counter was reset (disagreements or errors)
+    :param disagreement: float: fraction of the probes that disagreed with the majority of their round
+    """
+    name: str
+    value: Any
+    converged: bool
+    elapsed: float
+    probes: int
+    rounds: int
+    disagreement: float = 0.0
+
+
+@dataclass
+class QuorumRead:
+    """
+    Outcome of one round of concurrent reads
+    :param value: a value of the largest group of agreeing reads (None if every read failed)
+    :param agreed: bool: True if the largest accepted group reached the agreement rule
+    :param agreeing: int: size of the largest group of accepted and equal reads
+    :param fan_out: int: number of reads sent
+    """
+    value: Any
+    agreed: bool
+    agreeing: int
+    fan_out: int
+
+    @property
+    def disagreeing(self):
+        return self.fan_out - self.agreeing
+
+
+# every converge call is appended here, so runs can report how long consistency waits took;
+# only the latest ones are kept, waiters, resets and probes add one entry each for the whole session
+CONVERGENCE_HISTORY_SIZE = 10000
+convergence_history = deque(maxlen=CONVERGENCE_HISTORY_SIZE)
+_history_lock = threading.Lock()
+
+
+def record_convergence(result):
+    """
+    Append a ConvergenceResult to the convergence history, for waits measured outside converge
+    """
+    with _history_lock:
+        convergence_history.append(result)
+
+
+def convergence_results():
+    """
+    Copy of the convergence history, safe to iterate while other threads keep recording
+    :return: list of ConvergenceResult, oldest first
+    """
+    with _history_lock:
+        return list(convergence_history)
+
+
+def _check_agreement(fan_out, agreement):
+    if fan_out < 1:
+        raise ValueError(f"fan_out must be at least 1, got {fan_out}")
+    if agreement is not None and not 1 <= agreement <= fan_out:
+        raise ValueError(f"agreement must be between 1 and fan_out ({fan_out}), got {agreement}")
+
+
+def backoff_delay(attempt, base_delay, max_delay):
+    """
+    Exponential backoff with full jitter
+    :param attempt: int: number of failed rounds so far (starting at 1)
+    :param base_delay: float: delay in seconds of the first round
+    :param max_delay: float: upper bound in seconds for a single sleep
+    :return: float: seconds to sleep
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+_read_executor = None
+_read_executor_lock = threading.Lock()
+
+
+def _get_read_executor():
+    global _read_executor
+    with _read_executor_lock:
+        if _read_executor is None:
+            _read_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="quorum-read")
+        return _read_executor
+
+
+def quorum_read(probe, fan_out, agreement=None, accept=bool, key=None, retry_on=(Exception,)):
+    """
+    Send fan_out identical reads concurrently and group the answers
+    :param probe: callable: makes one request and returns its value
+    :param fan_out: int: number of concurrent reads
+    :param agreement: int: reads that must be accepted and equal for the round to agree (default: all)
+    :param accept: callable: receives a value and returns True if it is the expected state
+    :param key: callable: extracts from a value what must be equal across agreeing reads (default: the value)
+    :param retry_on: tuple: exceptions that count as a disagreeing read instead of failing
+    :return: QuorumRead
+    :raises ValueError: if agreement is not between 1 and fan_out
+    """
+    _check_agreement(fan_out, agreement)
+    key = key or (lambda value: value)
+    agreement = agreement or fan_out
+
+    def read():
+        try:
+            return True, probe()
+        except retry_on as e:
+            logging.info(f"quorum read error: {e}")
+            return False, None
+
+    if fan_out == 1:
+        answers = [read()]
+    else:
+        answers = list(_get_read_executor().map(lambda _: read(), range(fan_out)))
+
+    # group accepted answers by key, keys can be unhashable (dicts) so compare them pairwise
+    groups = []
+    last_value = None
+    for ok, value in answers:
+        if not ok:
+            continue
+        last_value = value
+        if not accept(value):
+            continue
+        for group in groups:
+            if group[0] == key(value):
+                group[1].append(value)
+                break
+        else:
+            groups.append((key(value), [value]))
+
+    if not groups:
+        return QuorumRead(last_value, False, 0, fan_out)
+    _, largest = max(groups, key=lambda group: len(group[1]))
+    return QuorumRead(largest[0], len(largest) >= agreement, len(largest), fan_out)
+
+
+def converge(probe, accept=bool, key=None, quorum=1, fan_out=1, agreement=None, timeout=300,
+             base_delay=0.2, max_delay=5, retry_on=(Exception,), name="converge"):
+    """
+    Call probe until quorum consecutive reads are accepted and agree with each other
+    :param probe: callable: makes one request and returns its value
+    :param accept: callable: receives a value and returns True if it is the expected state
+    :param key: callable: extracts from a value what must be equal across agreeing reads (default: the value)
+    :param quorum: int: number of consecutive agreeing rounds needed to consider the state converged
+    :param fan_out: int: number of concurrent reads per round
+    :param agreement: int: reads of a round that must be accepted and equal (default: all of them)
+    :param timeout: float: overall deadline in seconds, sleeps never go past it
+    :param base_delay: float: first backoff sleep in seconds after a disagreement
+    :param max_delay: float: maximum backoff sleep in seconds
+    :param retry_on: tuple: exceptions raised by probe that count as a disagreement instead of failing
+    :param name: str: label for logs and for the convergence history
+    :return: ConvergenceResult
+    :raises ValueError: if agreement is not between 1 and fan_out, as no round could ever agree
+    """
+    _check_agreement(fan_out, agreement)
+    key = key or (lambda value: value)
+    start = time.monotonic()
+    deadline = start + timeout
+    value = None
+    probes = 0
+    disagreeing = 0
+    rounds = 0
+    agreeing = 0
+    agreed_key = None
+
+    while True:
+        read = quorum_read(probe, fan_out, agreement, accept, key, retry_on)
+        probes += read.fan_out
+        disagreeing += read.disagreeing
+        if read.value is not None:
+            value = read.value
+
+        if not read.agreed:
+            logging.info(f"[{name}] probe {probes}: consistency not yet reached ({read.agreeing}/{read.fan_out} agree)")
+            agreeing = 0
+        elif agreeing and key(read.value) == agreed_key:
+            agreeing += 1
+        else:
+            # first agreeing round, or a round that agrees on something new, starts a new streak
+            agreed_key = key(read.value)
+            agreeing = 1
+
+        if agreeing >= quorum:
+            converged = True
+            break
+
+        now = time.monotonic()
+        if now >= deadline:
+            converged = False
+            break
+
+        # consecutive rounds of a quorum are made back to back, only a disagreement pays a sleep
+        if agreeing == 0:
+            rounds += 1
+            poll_delay(min(backoff_delay(rounds, base_delay, max_delay), deadline - now))
+
+    result = ConvergenceResult(
+        name, value, converged, time.monotonic() - start, probes, rounds, disagreeing / probes
+    )
+    record_convergence(result)
+    logging.warning(
+        f"[{name}] Total consistency wait time={result.elapsed:.3f}s probes={probes} "
+        f"disagreement={result.disagreement:.0%} converged={converged}"
+    )
+    return result
+
+
+def summarize_convergence(results=None):
+    """
+    Distribution of the consistency waits, grouped by name
+    :param results: list of ConvergenceResult (default: the whole convergence history)
+    :return: dict: name to count, converged count, p50, p90, p99, max and mean wait in seconds
+    """
+    if results is None:
+        results = convergence_results()
+    groups = {}
+    for result in results:
+        groups.setdefault(result.name, []).append(result)
+
+    summary = {}
+    for name, group in sorted(groups.items()):
+        elapsed = [result.elapsed for result in group]
+        summary[name] = {
+            "count": len(group),
+            "converged": sum(1 for result in group if result.converged),
+            "p50": percentile(elapsed, 0.5),
+            "p90": percentile(elapsed, 0.9),
+            "p99": percentile(elapsed, 0.99),
+            "max": max(elapsed),
+            "mean": sum(elapsed) / len(elapsed),
+            "probes": sum(result.probes for result in group),
+        }
+    return summary
+
+
+def format_convergence_summary(summary):
+    return "\n".join(
+        f"{name}: n={stats['count']} converged={stats['converged']} p50={stats['p50']:.3f}s "
+        f"p90={stats['p90']:.3f}s p99={stats['p99']:.3f}s max={stats['max']:.3f}s probes={stats['probes']}"
+        for name, stats in summary.items()
+    )
@@ -1,7 +1,16 @@
 import logging
+import multiprocessing
 import pytest
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from botocore.exceptions import ClientError
 from utils.utils import generate_valid_bucket_name
+from utils.clients import client_with_pool, client_spec, client_from_spec
+from utils.async_engine import upload_objects_async, download_objects_async
+from utils.teardown import defer_or_run
 import os
 
 ### Functions
@@ -49,19 +58,29 @@ def upload_object(s3_client, bucket_name, object_key, body_file):
     return response['ResponseMetadata']['HTTPStatusCode'] 
 
 
-def upload_multiple_objects(s3_client, bucket_name, file_path:str, object_prefix:str, object_quantity:int) -> int:
+def upload_multiple_objects(s3_client, bucket_name, file_path:str, object_prefix:str, object_quantity:int, concurrency:int=None, backend:str="thread", processes:int=None) -> int:
     """
-    Utilizing multithreading uploads multiple objects while changing their names
+    Utilizing multithreading (or asyncio) uploads multiple objects while changing their names
     :param s3_client: boto3 s3 client
     :param bucket_name: str: name of the bucket
     :param file_path: str: list of paths of the objects to be uploaded
     :param object_prefix: str: prefix to be added to the object name
     :param object_quantity: int: number of objects to be uploaded
+    :param concurrency: int: number of worker threads and pooled connections (or async requests in flight, or threads per process)
+    :param backend: str: "thread" for boto3 on a thread pool, "async" for the asyncio engine, "process" for boto3 on worker processes
+    :param processes: int: number of worker processes of the "process" backend, cpu count by default
     :return: int: number of successful uploads
     """
     
-    objects_names = [{"key": f"{object_prefix}-{i}", "path": file_path} for i in range(object_quantity)]
-    successful_uploads = upload_objects_multithreaded(s3_client, bucket_name, objects_names)
+    check_backend(backend)
+    objects_names = ({"key": f"{object_prefix}-{i}", "path": file_path} for i in range(object_quantity))
+    if backend == "async":
+        return upload_objects_async(s3_client, bucket_name, objects_names, max_in_flight=concurrency or ASYNC_DEFAULT_IN_FLIGHT)
+    if backend == "process":
+        items = ((bucket_name, path["key"], path["path"]) for path in objects_names)
+        results = process_transfer(s3_client, upload_object, items, processes=processes, threads=concurrency)
+        return sum(1 for status in results if status == 200)
+    successful_uploads = upload_objects_multithreaded(s3_client, bucket_name, objects_names, concurrency=concurrency)
 
     return successful_uploads
 
@@ -90,16 +109,114 @@ def list_all_objects(s3_client, bucket_name):
     :param bucket_name: str: name of the bucket
     :return: list str: names of objects in the bucket
     """
-    objects_names = []
+    return list(iter_objects(s3_client, bucket_name))
 
+
+def iter_objects(s3_client, bucket_name, prefix="", records=False):
+    """
+    Stream the objects of a bucket page by page, without holding the whole listing in memory
+    :param s3_client: boto3 s3 client
+    :param bucket_name: str: name of the bucket
+    :param prefix: str: only list keys starting with this prefix
+    :param records: bool: yield the full object records (Key, Size, ETag...) instead of the keys
+    :yield: str or dict: key or object record
+    """
     paginator = s3_client.get_paginator("list_objects_v2")
-    pages = paginator.paginate(Bucket=bucket_name)
-    for page in pages:
-        if 'Contents' in page:
-            for obj in page['Contents']:
-                objects_names.append(obj['Key'])
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            yield obj if records else obj["Key"]
+
+
+def count_objects(s3_client, bucket_name, prefix="", prefixes=None, delimiter=None):
+    """
+    Count the objects of a bucket streaming the listing, optionally sharded (see iter_objects_parallel)
+    :param s3_client: boto3 s3 client
+    :param bucket_name: str: name of the bucket
+    :param prefix: str: only count keys starting with this prefix
+    :param prefixes: list str: disjoint prefixes to list concurrently
+    :param delimiter: str: discover the shards from the top-level common prefixes
+    :return: int: number of objects
+    """
+    if prefixes or delimiter:
+        keys = iter_objects_parallel(s3_client, bucket_name, prefixes=prefixes, delimiter=delimiter)
+    else:
+        keys = iter_objects(s3_client, bucket_name, prefix=prefix)
+    return sum(1 for _ in keys)
 
-    return objects_names
+
+def _discover_shards(s3_client, bucket_name, delimiter):
+    """
+    List the top level of a bucket, returning its loose objects and its common prefixes
+    :return: tuple (list, list): object records outside of any prefix and the common prefixes
+    """
+    loose_objects = []
+    prefixes = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket_name, Delimiter=delimiter):
+        loose_objects.extend(page.get("Contents", []))
+        prefixes.extend(p["Prefix"] for p in page.get("CommonPrefixes", []))
+    return loose_objects, prefixes
+
+
+def iter_objects_parallel(s3_client, bucket_name, prefixes=None, delimiter=None, records=False, concurrency=None):
+    """
+    Stream the objects of a bucket listing disjoint shards of the keyspace concurrently
+    The shards are the given prefixes, or the top-level common prefixes found with the delimiter.
+    Output order is not the lexicographic order of the keys.
+    :param s3_client: boto3 s3 client
+    :param bucket_name: str: name of the bucket
+    :param prefixes: list str: disjoint prefixes covering the keys to be listed
+    :param delimiter: str: used to discover the shards when prefixes is not given
+    :param records: bool: yield the full object records instead of the keys
+    :param concurrency: int: number of shards listed at once, cpu count by default
+    :yield: str or dict: key or object record
+    """
+    if prefixes is None:
+        loose_objects, prefixes = _discover_shards(s3_client, bucket_name, delimiter or "/")
+        for obj in loose_objects:
+            yield obj if records else obj["Key"]
+
+    client, concurrency = _transfer_client(s3_client, concurrency)
+    # pages are handed over through a bounded queue, so fast shards can't pile up the whole listing
+    pages = queue.Queue(maxsize=2 * concurrency)
+    stop = threading.Event()
+    shard_done = object()
+
+    def list_shard(prefix):
+        try:
+            paginator = client.get_paginator("list_objects_v2")
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+                contents = page.get("Contents", [])
+                while not stop.is_set():
+                    try:
+                        pages.put(contents, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        finally:
+            pages.put(shard_done)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(list_shard, prefix) for prefix in prefixes]
+        remaining = len(futures)
+        try:
+            while remaining:
+                contents = pages.get()
+                if contents is shard_done:
+                    remaining -= 1
+                    continue
+                for obj in contents:
+                    yield obj if records else obj["Key"]
+        finally:
+            # the consumer stopped early (or a shard failed), let the other shards give up
+            stop.set()
+            while remaining:
+                if pages.get() is shard_done:
+                    remaining -= 1
+        for future in futures:
+            future.result()
 
 
 def delete_object(s3_client, bucket_name, object_key):
@@ -142,80 +259,394 @@ def delete_bucket(s3_client, bucket_name):
 
 
 # ## Multi-threading
+#
+# All workers of a transfer share one client, so the client's connection pool must have one
+# connection per worker, otherwise urllib3 opens extra connections and discards them with
+# "Connection pool is full", paying a new handshake for those requests, and the measured
+# throughput is the client's, not the server's. The helpers below borrow a client whose pool
+# matches the requested concurrency. botocore's pool never blocks a worker, so there is no
+# connection wait to report; the stats keep the latency of every request instead.
 
-def upload_objects_multithreaded(s3_client, bucket_name, objects_paths):
+DEFAULT_CONCURRENCY = os.cpu_count()
+ASYNC_DEFAULT_IN_FLIGHT = 1000
+TRANSFER_BACKENDS = ("thread", "async", "process")
+
+
+def check_backend(backend):
+    """
+    :raises ValueError: if backend is not one of TRANSFER_BACKENDS
+    """
+    if backend not in TRANSFER_BACKENDS:
+        raise ValueError(f"Unknown transfer backend {backend!r}, expected one of {TRANSFER_BACKENDS}")
+
+
+class TransferStats:
+    """
+    Counters of a transfer, filled by the helpers when passed as stats
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.latencies = array("d")
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(seconds)
+
+    def as_dict(self):
+        """
+        Picklable copy of the counters, used to send them from worker processes
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "latencies": self.latencies.tobytes(),
+            }
+
+    def merge(self, counters):
+        """
+        Add the counters returned by as_dict (e.g. by another process) to these
+        """
+        latencies = array("d")
+        latencies.frombytes(counters["latencies"])
+        with self._lock:
+            self.requests += counters["requests"]
+            self.latencies.extend(latencies)
+
+    def __repr__(self):
+        total = sum(self.latencies)
+        mean = total / len(self.latencies) if self.latencies else 0.0
+        return f"TransferStats(requests={self.requests}, mean_latency_seconds={mean:.3f})"
+
+
+def _timed(s3_client, stats, function, *args):
+    """
+    Run function(s3_client, *args), recording its latency in stats
+    """
+    if stats is None:
+        return function(s3_client, *args)
+    start = time.monotonic()
+    try:
+        return function(s3_client, *args)
+    finally:
+        stats.record_latency(time.monotonic() - start)
+
+
+def _transfer_client(s3_client, concurrency):
+    """
+    Borrow a client with a connection pool matching the number of workers
+    :return: tuple (client, int): the client and the effective concurrency
+    """
+    concurrency = concurrency or DEFAULT_CONCURRENCY
+    return client_with_pool(s3_client, concurrency), concurrency
+
+
+def stream_transfer(s3_client, function, items, concurrency=None, window=None, stats=None):
+    """
+    Run function(client, *item) for every item keeping at most window requests in flight
+    Items are pulled lazily from the iterable, so memory stays flat whatever the number of objects
+    :param s3_client: boto3 s3 client
+    :param function: callable: transfer function receiving the client followed by the item values
+    :param items: iterable: tuples of arguments, can be a generator
+    :param concurrency: int: number of worker threads and pooled connections, cpu count by default
+    :param window: int: maximum number of submitted and not yet completed requests, 2 x concurrency by default
+    :param stats: TransferStats: optional, receives the request latencies
+    :yield: results of function, in completion order
+    """
+    client, concurrency = _transfer_client(s3_client, concurrency)
+    window = window or 2 * concurrency
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for item in items:
+            if len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(_timed, client, stats, function, *item))
+        for future in as_completed(pending):
+            yield future.result()
+
+
+def upload_objects_multithreaded(s3_client, bucket_name, objects_paths, concurrency=None, stats=None, window=None):
     """
     Upload all objects to one bucket in parallel
-    The number of simultaneous uploads are limited by the number of objects in the list
+    The number of simultaneous uploads are limited by the concurrency
     :param s3_client: boto3 s3 client
     :param bucket_name: str: name of the bucket
-    :param objects_paths: list: list of paths of the objects to be uploaded
+    :param objects_paths: iterable: dicts with "key" and "path" of the objects to be uploaded, can be a generator
+    :param concurrency: int: number of worker threads and pooled connections, cpu count by default
+    :param stats: TransferStats: optional, receives the request latencies
+    :param window: int: maximum number of requests in flight, 2 x concurrency by default
     :return: int: number of successful uploads
     """
+    items = ((bucket_name, path['key'], path['path']) for path in objects_paths)
+    results = stream_transfer(s3_client, upload_object, items, concurrency, window, stats)
 
-    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-        # atributes processes to the available workers
-        futures = [executor.submit(upload_object, s3_client, bucket_name, path['key'], path['path']) for path in objects_paths]
-        
-        # List all results of the futures
-        successful_uploads = list(filter(lambda f: f.result()==200, as_completed(futures)))
-        logging.info(f"Successful uploads: {successful_uploads}")
-    
-        return len(successful_uploads)
+    successful_uploads = sum(1 for status in results if status == 200)
+    logging.info(f"Successful uploads: {successful_uploads}")
+    if stats is not None:
+        logging.info(f"Uploads of bucket {bucket_name}: {stats}")
+
+    return successful_uploads
 
 
-def download_objects_multithreaded(s3_client, bucket_name):
+def download_objects_multithreaded(s3_client, bucket_name, concurrency=None, stats=None, window=None, backend="thread", processes=None):
     """
     Download all objects from a bucket in parallel
-    The number of simultaneous downloads are limited by the number of objects in the list
+    Keys are streamed from the listing while the first downloads are already running
     :param s3_client: boto3 s3 client
     :param bucket_name: str: name of the bucket
+    :param concurrency: int: number of worker threads and pooled connections (or async requests in flight, or threads per process)
+    :param stats: TransferStats: optional, receives the request latencies
+    :param window: int: maximum number of requests in flight, 2 x concurrency by default
+    :param backend: str: "thread" for boto3 on a thread pool, "async" for the asyncio engine, "process" for boto3 on worker processes
+    :param processes: int: number of worker processes of the "process" backend, cpu count by default
     :return: int: number of successful downloads
     """
+    check_backend(backend)
+    if backend == "async":
+        return download_objects_async(s3_client, bucket_name, max_in_flight=concurrency or ASYNC_DEFAULT_IN_FLIGHT)
+    if backend == "process":
+        items = ((bucket_name, key) for key in iter_objects(s3_client, bucket_name))
+        results = process_transfer(s3_client, download_object, items, processes=processes, threads=concurrency, stats=stats)
+        return sum(1 for status in results if status == 200)
 
-    objects_keys = list_all_objects(s3_client, bucket_name)
+    items = ((bucket_name, key) for key in iter_objects(s3_client, bucket_name))
+    results = stream_transfer(s3_client, download_object, items, concurrency, window, stats)
 
-    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-        # atributes processes to the available workers
-        futures = [executor.submit(download_object, s3_client, bucket_name, key) for key in objects_keys]
-        
-        # List all results of the futures
-        successful_downloads = list(filter(lambda f: f.result()==200, as_completed(futures)))
-        logging.info(f"Successful downloads: {successful_downloads}")
+    successful_downloads = sum(1 for status in results if status == 200)
+    logging.info(f"Successful downloads: {successful_downloads}")
+    if stats is not None:
+        logging.info(f"Downloads of bucket {bucket_name}: {stats}")
 
+    return successful_downloads
 
-    return len(successful_downloads)
 
-
-def delete_objects_multithreaded(s3_client, bucket_name):
+def delete_objects_multithreaded(s3_client, bucket_name, concurrency=None):
     """
     Delete all objects in a bucket in parallel
     :param s3_client: boto3 s3 client
     :param bucket_name: str: name of the bucket
+    :param concurrency: int: number of DeleteObjects batches in flight, cpu count by default
     :return: int: number of successful deletions
     """
-    objects_keys = list_all_objects(s3_client, bucket_name)
+    client, concurrency = _transfer_client(s3_client, concurrency)
+    successful_deletions, errors = delete_objects_in_batches(client, bucket_name, max_in_flight=concurrency)
+    logging.info(f"Successful deletions: {successful_deletions}, errors: {len(errors)}")
+
+    return successful_deletions
+
+
+# ## Multi-processing
+#
+# Above a few thousand requests per second a single Python process saturates one core on SigV4
+# signing, XML parsing and hashing, whatever the number of threads. In process mode the work items
+# are split in chunks handed to worker processes, each one with its own client and thread pool,
+# and the results and latencies are merged back in the parent.
+
+PROCESS_DEFAULT_THREADS = 16
+PROCESS_CHUNK_SIZE = 1000
+
+_worker_client = None
+_worker_threads = None
+
+
+def _init_transfer_worker(spec, threads):
+    global _worker_client, _worker_threads
+    _worker_client = client_from_spec(spec)
+    _worker_threads = threads
 
-    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
-        # atributes processes to the available workers
-        futures = [executor.submit(delete_object, s3_client, bucket_name, key) for key in objects_keys]
 
-        # List all results of the futures
-        successful_deletions = list(filter(lambda f: f.result()==204, as_completed(futures)))
-        logging.info(f"Successful deletions: {successful_deletions}")
+def _transfer_chunk(function, items):
+    stats = TransferStats()
+    results = list(stream_transfer(_worker_client, function, items, concurrency=_worker_threads, stats=stats))
+    return results, stats.as_dict()
 
-    return len(successful_deletions)
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def process_transfer(s3_client, function, items, processes=None, threads=None, chunk_size=PROCESS_CHUNK_SIZE, stats=None):
+    """
+    Run function(client, *item) for every item on a pool of worker processes
+    :param s3_client: boto3 s3 client, rebuilt in every worker from its credentials, region and endpoint
+    :param function: callable: module-level transfer function receiving the client followed by the item values
+    :param items: iterable: tuples of arguments, can be a generator, consumed chunk by chunk
+    :param processes: int: number of worker processes, cpu count by default
+    :param threads: int: worker threads (and pooled connections) per process
+    :param chunk_size: int: items sent to a worker at once
+    :param stats: TransferStats: optional, receives the merged request latencies of all workers
+    :yield: results of function, a chunk at a time
+    """
+    processes = processes or DEFAULT_CONCURRENCY
+    threads = threads or PROCESS_DEFAULT_THREADS
+    spec = client_spec(s3_client, threads)
+    pending = set()
+
+    def collect(done):
+        for future in done:
+            results, counters = future.result()
+            if stats is not None:
+                stats.merge(counters)
+            yield from results
+
+    # spawn, as forking a process that already runs threads (and boto3 clients) is not safe
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_transfer_worker,
+        initargs=(spec, threads),
+    ) as executor:
+        for chunk in _chunks(items, chunk_size):
+            if len(pending) >= 2 * processes:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from collect(done)
+            pending.add(executor.submit(_transfer_chunk, function, chunk))
+        yield from collect(wait(pending).done)
+
+
+# ## Batched deletion
+#
+# DeleteObjects removes up to 1000 keys per request, so emptying a bucket costs one request per
+# listing page instead of one request per key. Pages are consumed straight from the paginator
+# and only a bounded number of batches is kept in flight at once.
+
+DELETE_OBJECTS_BATCH_SIZE = 1000
+
+
+def _delete_batch(s3_client, bucket_name, batch, bypass_governance):
+    """
+    Send one DeleteObjects request and return the per-key errors reported by the server
+    :param s3_client: boto3 s3 client
+    :param bucket_name: str: name of the bucket
+    :param batch: list: dicts with "Key" and optionally "VersionId"
+    :param bypass_governance: bool: retry keys denied by a GOVERNANCE retention with bypass
+    :return: tuple (int, list): number of deleted entries and the errors of the remaining ones
+    """
+    response = s3_client.delete_objects(
+        Bucket=bucket_name,
+        Delete={"Objects": batch, "Quiet": True},
+    )
+    errors = response.get("Errors", [])
+
+    denied = [{k: e[k] for k in ("Key", "VersionId") if e.get(k)} for e in errors if e.get("Code") == "AccessDenied"]
+    if bypass_governance and denied:
+        logging.info(f"Retrying deletion of {len(denied)} entries with governance bypass")
+        retry_response = s3_client.delete_objects(
+            Bucket=bucket_name,
+            Delete={"Objects": denied, "Quiet": True},
+            BypassGovernanceRetention=True,
+        )
+        errors = [e for e in errors if e.get("Code") != "AccessDenied"] + retry_response.get("Errors", [])
+
+    return len(batch) - len(errors), errors
+
+
+def _batch_failure_errors(batch, exception):
+    """
+    Per-key errors, in the format of the DeleteObjects Errors, for a batch whose request failed
+    :param batch: list: dicts with "Key" and optionally "VersionId"
+    :param exception: Exception: error raised by the request
+    :return: list of dicts with Key, VersionId, Code and Message
+    """
+    if isinstance(exception, ClientError):
+        code = exception.response.get("Error", {}).get("Code")
+    else:
+        code = type(exception).__name__
+    return [{**entry, "Code": code, "Message": str(exception)} for entry in batch]
+
+
+def _iter_delete_entries(s3_client, bucket_name, versions):
+    """
+    Stream the entries of a bucket in the format expected by DeleteObjects
+    :param s3_client: boto3 s3 client
+    :param bucket_name: str: name of the bucket
+    :param versions: bool: list object versions and delete markers instead of current keys
+    :yield: dict: "Key" and, for versions, "VersionId"
+    """
+    if versions:
+        paginator = s3_client.get_paginator("list_object_versions")
+        for page in paginator.paginate(Bucket=bucket_name):
+            for entry in page.get("Versions", []) + page.get("DeleteMarkers", []):
+                yield {"Key": entry["Key"], "VersionId": entry["VersionId"]}
+    else:
+        for key in iter_objects(s3_client, bucket_name):
+            yield {"Key": key}
+
+
+def delete_objects_in_batches(s3_client, bucket_name, versions=False, bypass_governance=False, max_in_flight=4):
+    """
+    Empty a bucket sending DeleteObjects batches while the listing is still being paginated
+    :param s3_client: boto3 s3 client
+    :param bucket_name: str: name of the bucket
+    :param versions: bool: also delete every object version and delete marker
+    :param bypass_governance: bool: retry entries denied by GOVERNANCE retention with bypass
+    :param max_in_flight: int: maximum number of DeleteObjects requests running at once
+    :return: tuple (int, list): number of deleted entries and the per-key errors
+    """
+    deleted = 0
+    errors = []
+    # in-flight DeleteObjects requests and their batches
+    pending = {}
+
+    def collect(done):
+        nonlocal deleted
+        for future in done:
+            batch = pending.pop(future)
+            try:
+                count, batch_errors = future.result()
+            except Exception as e:
+                # the whole request failed (throttling, network, access denied): none of its entries were deleted
+                logging.error(f"Error deleting batch from bucket {bucket_name}: {e}")
+                count, batch_errors = 0, _batch_failure_errors(batch, e)
+            deleted += count
+            errors.extend(batch_errors)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        batch = []
+        for entry in _iter_delete_entries(s3_client, bucket_name, versions):
+            batch.append(entry)
+            if len(batch) < DELETE_OBJECTS_BATCH_SIZE:
+                continue
+            if len(pending) >= max_in_flight:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            pending[executor.submit(_delete_batch, s3_client, bucket_name, batch, bypass_governance)] = batch
+            batch = []
+        if batch:
+            pending[executor.submit(_delete_batch, s3_client, bucket_name, batch, bypass_governance)] = batch
+        collect(wait(pending).done)
+
+    for error in errors:
+        logging.warning(
+            f"Failed to delete {error.get('Key')} (version {error.get('VersionId')}) "
+            f"in bucket {bucket_name}: {error.get('Code')} {error.get('Message')}"
+        )
+    logging.info(f"Deleted {deleted} entries from bucket {bucket_name}, {len(errors)} errors")
+
+    return deleted, errors
 
 
 
 # ## Fixtures
 
 @pytest.fixture
-def fixture_bucket_with_name(s3_client, request):
+def fixture_bucket_with_name(s3_client, request, deferred_teardown):
     """
     Creates a bucekt with a random name and then tear it down
     :param s3_client: boto s3 cliet
     :param request: dict: contains the name of the current test
+    :param deferred_teardown: DeferredTeardown to delete the bucket in background, or None
     :yield: str: generated bucket name
     """
 
@@ -227,8 +658,12 @@ def fixture_bucket_with_name(s3_client, request):
 
     yield bucket_name
 
-    delete_objects_multithreaded(s3_client, bucket_name)
-    delete_bucket(s3_client, bucket_name)
+    defer_or_run(
+        deferred_teardown,
+        f"bucket {bucket_name}",
+        lambda: delete_objects_in_batches(s3_client, bucket_name),
+        lambda: delete_bucket(s3_client, bucket_name),
+    )
 
 
 @pytest.fixture
@@ -246,6 +681,6 @@ def fixture_upload_multiple_objects(s3_client, fixture_bucket_with_name, request
 
     logging.info(f"{qnt}, {path}")
 
-    objects_names = [{"key": f"multiple-object'-{i}", "path": path} for i in range(qnt)]
+    objects_names = ({"key": f"multiple-object'-{i}", "path": path} for i in range(qnt))
     return upload_objects_multithreaded(s3_client, fixture_bucket_with_name, objects_names)
 
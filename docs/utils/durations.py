@@ -0,0 +1,174 @@
+import logging
+import sqlite3
+import time
+from contextlib import closing
+from xdist.scheduler import LoadScheduling
+
+# ## Duration-aware scheduling
+#
+# pytest-xdist hands tests to workers in collection order, so the few tests that take minutes
+# (10k objects, lock fixtures) may end up on the same worker, which then sets the time of the
+# whole run. The history below keeps how long each test took, per config file, in a SQLite file.
+# DurationScheduling uses it to run the longest tests first: every worker holds at most two tests
+# (the running one and the next), and takes the longest pending test when it finishes one. This
+# is longest-processing-time-first list scheduling, which keeps the wall time close to the total
+# work divided by the number of workers.
+#
+# Tests without history are estimated from their speed markers (rapid, regular, slow). The
+# scheduler runs in the xdist controller, which does not collect tests, so the workers store these
+# estimates in the same file while collecting.
+
+# estimated seconds of a test without history, by speed marker
+MARKER_ESTIMATES = {"rapid": 1.0, "regular": 10.0, "slow": 60.0}
+DEFAULT_ESTIMATE = MARKER_ESTIMATES["regular"]
+# weight of the newest duration in the moving average of a test
+SMOOTHING = 0.5
+
+
+class DurationHistory:
+    """
+    Per-config durations of the tests, kept in a SQLite file
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS durations ("
+                "config TEXT, nodeid TEXT, seconds REAL, runs INTEGER, updated REAL, "
+                "PRIMARY KEY (config, nodeid))"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS marker_estimates (config TEXT, nodeid TEXT, seconds REAL, "
+                "PRIMARY KEY (config, nodeid))"
+            )
+
+    def _connect(self):
+        # runs of different configs, and the collecting xdist worker, may write at the same time
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def record(self, config_name, durations):
+        """
+        Merge the durations of a run into the history, as a moving average per test
+        :param config_name: str: name of the params file of the run
+        :param durations: dict: node id to seconds (setup, call and teardown)
+        """
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            for nodeid, seconds in durations.items():
+                connection.execute(
+                    "INSERT INTO durations (config, nodeid, seconds, runs, updated) VALUES (?, ?, ?, 1, ?) "
+                    "ON CONFLICT (config, nodeid) DO UPDATE SET "
+                    "seconds = ? * excluded.seconds + (1 - ?) * seconds, runs = runs + 1, updated = excluded.updated",
+                    (config_name, nodeid, seconds, now, SMOOTHING, SMOOTHING),
+                )
+
+    def store_marker_estimates(self, config_name, estimates):
+        """
+        :param estimates: dict: node id to the seconds estimated from its markers
+        """
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO marker_estimates (config, nodeid, seconds) VALUES (?, ?, ?)",
+                [(config_name, nodeid, seconds) for nodeid, seconds in estimates.items()],
+            )
+
+    def durations(self, config_name):
+        """
+        :param config_name: str: name of the params file
+        :return: dict: node id to the averaged seconds of the tests that already ran with it
+        """
+        with closing(self._connect()) as connection:
+            return dict(connection.execute(
+                "SELECT nodeid, seconds FROM durations WHERE config = ?", (config_name,)
+            ))
+
+    def estimates(self, config_name, nodeids):
+        """
+        Estimated duration of each test: its history, or else its marker estimate
+        :param config_name: str: name of the params file of the run
+        :param nodeids: list of node ids
+        :return: dict: node id to seconds, and the number of tests estimated from history
+        """
+        history = self.durations(config_name)
+        with closing(self._connect()) as connection:
+            markers = dict(connection.execute(
+                "SELECT nodeid, seconds FROM marker_estimates WHERE config = ?", (config_name,)
+            ))
+        estimates = {}
+        for nodeid in nodeids:
+            if nodeid in history:
+                estimates[nodeid] = history[nodeid]
+            else:
+                estimates[nodeid] = markers.get(nodeid, DEFAULT_ESTIMATE)
+        return estimates, sum(1 for nodeid in nodeids if nodeid in history)
+
+
+def marker_estimate(item):
+    """
+    Estimated seconds of a test from its speed marker
+    :param item: pytest.Item
+    """
+    for marker, seconds in MARKER_ESTIMATES.items():
+        if item.get_closest_marker(marker):
+            return seconds
+    return DEFAULT_ESTIMATE
+
+
+class DurationScheduling(LoadScheduling):
+    """
+    xdist scheduling of the longest pending test first, on whichever worker is free
+    """
+
+    def __init__(self, config, log=None, history=None, config_name=None):
+        """
+        :param history: DurationHistory: source of the estimates
+        :param config_name: str: name of the params file of the run
+        """
+        super().__init__(config, log)
+        self.history = history
+        self.config_name = config_name
+        self.estimates = {}
+
+    def schedule(self):
+        assert self.collection_is_completed
+
+        # initial distribution already happened, a node was added
+        if self.collection is not None:
+            for node in self.nodes:
+                self.check_schedule(node)
+            return
+
+        if not self._check_nodes_have_same_collection():
+            self.log("**Different tests collected, aborting run**")
+            return
+
+        self.collection = next(iter(self.node2collection.values()))
+        self.estimates, known = self.history.estimates(self.config_name, self.collection)
+        # stable sort: tests with the same estimate keep their collection order
+        self.pending[:] = sorted(range(len(self.collection)), key=lambda index: -self.estimates[self.collection[index]])
+        total = sum(self.estimates.values())
+        logging.info(
+            f"[durations] {len(self.collection)} tests ({known} with history), estimated work {total:.0f}s, "
+            f"{total / max(1, len(self.nodes)):.0f}s per worker"
+        )
+        # one test per node and round, so the longest tests start at the same time on different nodes
+        for _ in range(2):
+            for node in self.nodes:
+                self._send_tests(node, 1)
+        if not self.pending:
+            for node in self.nodes:
+                node.shutdown()
+
+    def check_schedule(self, node, duration=0):
+        """
+        Keep two tests on the node: the running one and the next, the longest pending
+        """
+        if node.shutting_down:
+            return
+        if self.pending:
+            missing = 2 - len(self.node2pending[node])
+            if missing > 0:
+                self._send_tests(node, missing)
+        else:
+            node.shutdown()
@@ -0,0 +1,242 @@
+import logging
+import math
+import random
+import threading
+import time
+import yaml
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ConnectionClosedError
+
+# ## Fault injection
+#
+# Retries, backoff and the *_with_determination helpers only show their cost when the backend
+# misbehaves, which a healthy endpoint rarely does on demand. A FaultInjector attaches to boto3
+# clients and degrades their requests on purpose, following a fault profile (a yaml file):
+#
+#     seed: 42
+#     operations:
+#       default:
+#         latency: {distribution: lognormal, median: 0.01, sigma: 0.5}
+#       PutObject:
+#         slow_down: 0.05
+#         connection_reset: 0.01
+#         slow_first_byte: {probability: 0.05, seconds: 1.5}
+#         latency_spike: {probability: 0.01, distribution: uniform, min: 2, max: 5}
+#
+# Rules of an operation are merged over the "default" ones. Per request attempt:
+# - slow_down: probability of answering 503 SlowDown without sending the request
+# - connection_reset: probability of failing with a closed connection without sending the request
+# - slow_first_byte: probability and seconds added before the response headers are handed over
+# - latency: distribution of the seconds added to every response
+# - latency_spike: probability and distribution of an extra delay, for tail latency
+#
+# Faults are injected per attempt, so botocore retries them like real ones and the request
+# metrics record them. Distributions are constant (seconds), uniform (min, max), exponential
+# (mean) or lognormal (median, sigma).
+
+FAULT_RULES = ("slow_down", "connection_reset", "slow_first_byte", "latency", "latency_spike")
+# distribution to the settings it needs
+DISTRIBUTION_PARAMETERS = {
+    "constant": ("seconds",),
+    "uniform": ("min", "max"),
+    "exponential": ("mean",),
+    "lognormal": ("median", "sigma"),
+}
+DISTRIBUTIONS = tuple(DISTRIBUTION_PARAMETERS)
+
+SLOW_DOWN_BODY = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n'
+    b"<Error><Code>SlowDown</Code><Message>Please reduce your request rate.</Message></Error>"
+)
+
+
+class _RawBody:
+    """
+    Minimal urllib3-like body of an injected response
+    """
+
+    def __init__(self, content):
+        self._content = content
+
+    def stream(self, *args, **kwargs):
+        yield self._content
+
+    def read(self, *args, **kwargs):
+        content, self._content = self._content, b""
+        return content
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _check_mapping(name, value):
+    if not isinstance(value, dict):
+        raise ValueError(f"Fault profile {name}: expected a mapping, got {value!r}")
+
+
+def _check_number(operation, rule, setting, value):
+    if not _is_number(value) or value < 0:
+        raise ValueError(f"Fault profile {operation}.{rule}: {setting} {value!r} is not a non-negative number")
+
+
+def _check_distribution(operation, rule, spec):
+    distribution = spec.get("distribution", "constant")
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Fault profile {operation}.{rule}: unknown distribution {distribution!r}, expected one of {DISTRIBUTIONS}")
+    for setting in DISTRIBUTION_PARAMETERS[distribution]:
+        if setting not in spec:
+            raise ValueError(f"Fault profile {operation}.{rule}: {distribution} distribution needs {setting}")
+        _check_number(operation, rule, setting, spec[setting])
+    # the mean and the median are divided by, and taken the log of
+    for setting in ("mean", "median"):
+        if setting in DISTRIBUTION_PARAMETERS[distribution] and spec[setting] == 0:
+            raise ValueError(f"Fault profile {operation}.{rule}: {distribution} distribution needs a {setting} above 0")
+
+
+def _check_probability(operation, rule, probability):
+    if not _is_number(probability) or not 0 <= probability <= 1:
+        raise ValueError(f"Fault profile {operation}.{rule}: probability {probability!r} is not between 0 and 1")
+
+
+def validate_profile(profile):
+    """
+    Check a fault profile, raising ValueError on any malformed part: settings that are not mappings,
+    unknown rules or distributions, missing distribution settings, bad numbers or probabilities
+    :param profile: dict: parsed fault profile
+    """
+    if not isinstance(profile, dict):
+        raise ValueError(f"Fault profile: expected a mapping, got {profile!r}")
+    operations = profile.get("operations") or {}
+    _check_mapping("operations", operations)
+    for operation, rules in operations.items():
+        _check_mapping(operation, rules)
+        unknown = set(rules) - set(FAULT_RULES)
+        if unknown:
+            raise ValueError(f"Fault profile {operation}: unknown rules {sorted(unknown)}, expected some of {FAULT_RULES}")
+        for rule in ("slow_down", "connection_reset"):
+            if rule in rules:
+                _check_probability(operation, rule, rules[rule])
+        for rule in ("slow_first_byte", "latency", "latency_spike"):
+            if rule in rules:
+                _check_mapping(f"{operation}.{rule}", rules[rule])
+        for rule in ("slow_first_byte", "latency_spike"):
+            if rule in rules:
+                _check_probability(operation, rule, rules[rule].get("probability", 0))
+        if "slow_first_byte" in rules:
+            _check_number(operation, "slow_first_byte", "seconds", rules["slow_first_byte"].get("seconds", 0))
+        for rule in ("latency", "latency_spike"):
+            if rule in rules:
+                _check_distribution(operation, rule, rules[rule])
+
+
+class FaultInjector:
+    """
+    Degrades the requests of the clients it is attached to, following a fault profile
+    """
+
+    def __init__(self, profile):
+        """
+        :param profile: dict: fault profile with an optional seed and rules per operation
+        """
+        validate_profile(profile)
+        self.seed = profile.get("seed")
+        operations = profile.get("operations") or {}
+        self._default = operations.get("default", {})
+        self._rules = {name: {**self._default, **rules} for name, rules in operations.items() if name != "default"}
+        self._random = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.injected = {}
+        self.injected_seconds = 0.0
+
+    @classmethod
+    def from_yaml(cls, path):
+        with open(path, "r") as f:
+            return cls(yaml.safe_load(f) or {})
+
+    def rules_for(self, operation):
+        return self._rules.get(operation, self._default)
+
+    def attach(self, s3_client):
+        """
+        Register the injector on a client's events and delay its HTTP responses
+        Attach it before the request recorder, so the recorded time to first byte includes the delays
+        :param s3_client: boto3 s3 client
+        """
+        s3_client.meta.events.register("before-send.s3", self._before_send)
+
+        http_session = s3_client._endpoint.http_session
+        send = http_session.send
+
+        def delayed_send(request):
+            response = send(request)
+            delay = getattr(self._local, "delay", 0)
+            if delay:
+                self._local.delay = 0
+                time.sleep(delay)
+            return response
+
+        http_session.send = delayed_send
+
+    def _draw(self, spec):
+        distribution = spec.get("distribution", "constant")
+        with self._lock:
+            if distribution == "uniform":
+                return self._random.uniform(spec["min"], spec["max"])
+            if distribution == "exponential":
+                return self._random.expovariate(1 / spec["mean"])
+            if distribution == "lognormal":
+                return self._random.lognormvariate(math.log(spec["median"]), spec["sigma"])
+            return spec.get("seconds", 0)
+
+    def _happens(self, probability):
+        with self._lock:
+            return self._random.random() < probability
+
+    def _count(self, operation, fault, seconds=0.0):
+        with self._lock:
+            counts = self.injected.setdefault(operation, {})
+            counts[fault] = counts.get(fault, 0) + 1
+            self.injected_seconds += seconds
+
+    def _before_send(self, request, event_name, **kwargs):
+        operation = event_name.rsplit(".", 1)[-1]
+        rules = self.rules_for(operation)
+        self._local.delay = 0
+        if not rules:
+            return None
+
+        if self._happens(rules.get("connection_reset", 0)):
+            self._count(operation, "connection_reset")
+            logging.debug(f"[faults] {operation}: injected connection reset")
+            raise ConnectionClosedError(endpoint_url=request.url)
+        if self._happens(rules.get("slow_down", 0)):
+            self._count(operation, "slow_down")
+            logging.debug(f"[faults] {operation}: injected 503 SlowDown")
+            headers = {"Content-Type": "application/xml", "Content-Length": str(len(SLOW_DOWN_BODY))}
+            return AWSResponse(request.url, 503, headers, _RawBody(SLOW_DOWN_BODY))
+
+        delay = 0.0
+        if "latency" in rules:
+            delay += self._draw(rules["latency"])
+        slow_first_byte = rules.get("slow_first_byte")
+        if slow_first_byte and self._happens(slow_first_byte.get("probability", 0)):
+            delay += slow_first_byte.get("seconds", 0)
+            self._count(operation, "slow_first_byte")
+        spike = rules.get("latency_spike")
+        if spike and self._happens(spike.get("probability", 0)):
+            delay += self._draw(spike)
+            self._count(operation, "latency_spike")
+        if delay:
+            with self._lock:
+                self.injected_seconds += delay
+        self._local.delay = delay
+        return None
+
+    def summary(self):
+        faults = ", ".join(
+            f"{operation}({' '.join(f'{fault}={count}' for fault, count in sorted(counts.items()))})"
+            for operation, counts in sorted(self.injected.items())
+        )
+        return f"injected faults seed={self.seed} delay={self.injected_seconds:.2f}s {faults or 'none'}"
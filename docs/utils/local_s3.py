@@ -0,0 +1,1175 @@
+import argparse
+import base64
+import fnmatch
+import hashlib
+import json
+import logging
+import random
+import socket
+import sys
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, quote_plus, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+# ## Local S3 stand-in
+#
+# An in-memory S3-compatible HTTP server implementing what the specs use: buckets, objects,
+# versioning, object lock and retention, canned ACLs, bucket policies, multipart uploads, presigned
+# URLs and storage classes. Signatures are not verified, the access key of a request identifies its
+# tenant, so profiles with different keys behave as different accounts.
+#
+# Bucket settings (versioning, object lock, ACL, policy), new buckets and new objects in listings
+# are replicated with a lag: every change reaches each of the simulated replicas after its own delay,
+# and every request is served by a random replica. This reproduces the eventual consistency the
+# *_with_determination helpers and fixtures wait for, with delays set per setting, so the helpers
+# can be tuned and benchmarked offline.
+#
+# It is started by the test session when the params yaml has a "local_s3" record (see
+# params/local.yaml), or standalone with `python -m utils.local_s3` from the docs directory.
+
+S3_XMLNS = "http://s3.amazonaws.com/doc/2006-03-01/"
+XSI = 'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+ALL_USERS = "http://acs.amazonaws.com/groups/global/AllUsers"
+AUTHENTICATED_USERS = "http://acs.amazonaws.com/groups/global/AuthenticatedUsers"
+LOG_DELIVERY = "http://acs.amazonaws.com/groups/s3/LogDelivery"
+CANNED_ACLS = (
+    "private", "public-read", "public-read-write", "authenticated-read",
+    "bucket-owner-read", "bucket-owner-full-control", "log-delivery-write",
+)
+STORAGE_CLASSES = ("STANDARD", "GLACIER_IR", "COLD_INSTANT", "STANDARD_IA", "GLACIER", "DEEP_ARCHIVE")
+MIN_PART_SIZE = 5 * 1024 * 1024
+LAGGED_SETTINGS = ("bucket", "versioning", "object_lock", "acl", "policy", "listing")
+
+
+class S3Error(Exception):
+    def __init__(self, status, code, message=""):
+        super().__init__(f"{status} {code} {message}")
+        self.status = status
+        self.code = code
+        self.message = message or code
+
+
+def owner_id(access_key):
+    """
+    Canonical ID of the tenant of an access key
+    """
+    return hashlib.sha256(access_key.encode()).hexdigest()[:32]
+
+
+def _iso(timestamp):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(timestamp)) + f".{int(timestamp % 1 * 1000):03d}Z"
+
+
+def _parse_iso(value):
+    return datetime.fromisoformat(value.strip().replace("Z", "+00:00")).timestamp()
+
+
+def _to_xml(tag, value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return "".join(_to_xml(tag, item) for item in value)
+    name = tag.split()[0]
+    if isinstance(value, dict):
+        return f"<{tag}>{''.join(_to_xml(k, v) for k, v in value.items())}</{name}>"
+    if isinstance(value, bool):
+        value = "true" if value else "false"
+    return f"<{tag}>{escape(str(value))}</{name}>"
+
+
+def xml_document(root, children, namespace=True):
+    xmlns = f' xmlns="{S3_XMLNS}"' if namespace else ""
+    inner = "".join(_to_xml(k, v) for k, v in children.items())
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n<{root}{xmlns}>{inner}</{root}>'.encode()
+
+
+def _children(element, name):
+    return [child for child in element if child.tag.split("}")[-1] == name]
+
+
+def _text(element, name, default=None):
+    found = _children(element, name)
+    return found[0].text if found and found[0].text is not None else default
+
+
+class Replicated:
+    """
+    A value whose changes reach each replica after a delay drawn for that replica
+    """
+
+    def __init__(self, value, lag, replicas):
+        # entries of (time each replica sees the value, value), oldest first
+        self._entries = [((0.0,) * replicas, value)]
+        self._lag = lag
+        self._replicas = replicas
+
+    def set(self, value):
+        now = time.time()
+        self._entries.append((tuple(now + self._lag() for _ in range(self._replicas)), value))
+        # drop the entries every replica has moved past
+        while len(self._entries) > 1 and max(self._entries[1][0]) <= now:
+            self._entries.pop(0)
+
+    def get(self, replica=None):
+        """
+        :param replica: int: replica reading the value, None for the latest value
+        """
+        if replica is None:
+            return self._entries[-1][1]
+        now = time.time()
+        for visible_at, value in reversed(self._entries):
+            if visible_at[replica] <= now:
+                return value
+        return self._entries[0][1]
+
+
+@dataclass
+class ObjectVersion:
+    key: str
+    version_id: str
+    owner: str
+    body: bytes = b""
+    etag: str = ""
+    last_modified: float = 0.0
+    storage_class: str = "STANDARD"
+    content_type: str = "binary/octet-stream"
+    metadata: dict = field(default_factory=dict)
+    acl: str = "private"
+    retention_mode: Optional[str] = None
+    retain_until: Optional[float] = None
+    delete_marker: bool = False
+    listed_at: tuple = ()
+
+
+@dataclass
+class MultipartUpload:
+    upload_id: str
+    key: str
+    owner: str
+    initiated: float
+    storage_class: str
+    content_type: str
+    metadata: dict
+    parts: dict = field(default_factory=dict)
+
+
+class Bucket:
+    def __init__(self, store, name, owner, region, lock_enabled=False):
+        self.name = name
+        self.owner = owner
+        self.region = region
+        self.created = time.time()
+        self.visible_at = tuple(self.created + store.delay("bucket") for _ in range(store.replicas))
+        self.versioning = store.replicated("versioning", None)
+        self.object_lock = store.replicated("object_lock", None)
+        self.acl = store.replicated("acl", "private")
+        self.policy = store.replicated("policy", None)
+        self.objects = {}
+        self.uploads = {}
+        if lock_enabled:
+            self.versioning.set("Enabled")
+            self.object_lock.set({"ObjectLockEnabled": "Enabled"})
+
+    def latest(self, key):
+        versions = self.objects.get(key)
+        return versions[-1] if versions else None
+
+
+class LocalS3Store:
+    """
+    In-memory state of the stand-in, every operation runs under one lock
+    """
+
+    def __init__(self, region="local", lag=None, replicas=3):
+        """
+        :param region: str: region of the buckets, "us-east-1" lets an owner re-create its buckets
+        :param lag: dict: setting name (bucket, versioning, object_lock, acl, policy, listing) to the
+                    seconds a replica takes to see a change, a number or a [min, max] range
+        :param replicas: int: number of simulated replicas
+        """
+        self.region = region
+        self.lag = dict(lag or {})
+        unknown = set(self.lag) - set(LAGGED_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown lag settings {sorted(unknown)}, expected some of {LAGGED_SETTINGS}")
+        self.replicas = replicas
+        self.lock = threading.RLock()
+        self.buckets = {}
+
+    def delay(self, setting):
+        lag = self.lag.get(setting, 0)
+        if isinstance(lag, (list, tuple)):
+            return random.uniform(*lag)
+        return lag
+
+    def replicated(self, setting, value):
+        return Replicated(value, lambda: self.delay(setting), self.replicas)
+
+    def pick_replica(self):
+        return random.randrange(self.replicas)
+
+
+class Request:
+    """
+    A parsed S3 request
+    """
+
+    def __init__(self, method, bucket, key, query, headers, body, requester):
+        self.method = method
+        self.bucket = bucket
+        self.key = key
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.requester = requester
+
+    def has(self, name):
+        return name in self.query
+
+    def header(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+
+class LocalS3:
+    """
+    The S3 operations, on top of a LocalS3Store
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    # ### Access control
+
+    def _grants(self, acl, owner):
+        owner_grant = {"Grantee": ("CanonicalUser", owner), "Permission": "FULL_CONTROL"}
+        extra = {
+            "public-read": [(ALL_USERS, "READ")],
+            "public-read-write": [(ALL_USERS, "READ"), (ALL_USERS, "WRITE")],
+            "authenticated-read": [(AUTHENTICATED_USERS, "READ")],
+            "log-delivery-write": [(LOG_DELIVERY, "WRITE"), (LOG_DELIVERY, "READ_ACP")],
+        }.get(acl, [])
+        return [{"Grantee": ("Group", uri), "Permission": permission} for uri, permission in extra] + [owner_grant]
+
+    def _acl_allows(self, acl, owner, requester, permission):
+        if requester == owner:
+            return True
+        for grant in self._grants(acl, owner):
+            kind, grantee = grant["Grantee"]
+            if grant["Permission"] not in (permission, "FULL_CONTROL"):
+                continue
+            if grantee == ALL_USERS or (grantee == AUTHENTICATED_USERS and requester):
+                return True
+        return False
+
+    def _policy_effect(self, bucket, replica, action, resource, requester):
+        """
+        :return: "Deny", "Allow" or None when no statement of the bucket policy matches
+        """
+        policy = bucket.policy.get(replica)
+        if not policy:
+            return None
+        effect = None
+        for statement in policy["Statement"]:
+            actions = statement.get("Action", [])
+            actions = [actions] if isinstance(actions, str) else actions
+            if not any(fnmatch.fnmatch(action.lower(), pattern.lower()) for pattern in actions):
+                continue
+            resources = statement.get("Resource", [])
+            resources = [resources] if isinstance(resources, str) else resources
+            if not any(fnmatch.fnmatch(resource, pattern.replace("arn:aws:s3:::", "")) for pattern in resources):
+                continue
+            principals = statement.get("Principal", "*")
+            if isinstance(principals, dict):
+                principals = principals.get("AWS", [])
+            principals = [principals] if isinstance(principals, str) else principals
+            if "*" not in principals and requester not in principals:
+                continue
+            if statement.get("Effect") == "Deny":
+                return "Deny"
+            effect = "Allow"
+        return effect
+
+    def authorize(self, request, bucket, replica, action, permission, version=None):
+        """
+        Check the bucket policy, then the ACL of the bucket (or of the object version)
+        :param action: str: policy action, e.g. s3:GetObject
+        :param permission: str: ACL permission (READ or WRITE), None for owner-only operations
+        :param version: ObjectVersion whose ACL is checked instead of the bucket's one
+        """
+        resource = f"{bucket.name}/{request.key}" if request.key else bucket.name
+        effect = self._policy_effect(bucket, replica, action, resource, request.requester)
+        if effect == "Deny":
+            raise S3Error(403, "AccessDeniedByBucketPolicy", "Access denied by bucket policy")
+        if effect == "Allow" or request.requester == bucket.owner:
+            return
+        if permission:
+            if version is not None:
+                if self._acl_allows(version.acl, version.owner, request.requester, permission):
+                    return
+            elif self._acl_allows(bucket.acl.get(replica), bucket.owner, request.requester, permission):
+                return
+        raise S3Error(403, "AccessDenied", "Access Denied")
+
+    def _acl_document(self, acl, owner):
+        grants = []
+        for grant in self._grants(acl, owner):
+            kind, grantee = grant["Grantee"]
+            if kind == "Group":
+                grantee_xml = {f'Grantee {XSI} xsi:type="Group"': {"URI": grantee}}
+            else:
+                grantee_xml = {f'Grantee {XSI} xsi:type="CanonicalUser"': {"ID": grantee, "DisplayName": grantee}}
+            grants.append({**grantee_xml, "Permission": grant["Permission"]})
+        return xml_document("AccessControlPolicy", {
+            "Owner": {"ID": owner, "DisplayName": owner},
+            "AccessControlList": {"Grant": grants},
+        })
+
+    def _canned_acl(self, request):
+        acl = request.header("x-amz-acl")
+        if acl is None and request.body:
+            raise S3Error(501, "NotImplemented", "Only canned ACLs are supported")
+        if acl not in CANNED_ACLS:
+            raise S3Error(400, "InvalidArgument", f"Invalid canned ACL {acl!r}")
+        return acl
+
+    # ### Dispatch
+
+    def handle(self, request):
+        """
+        :return: (status, headers dict, body bytes)
+        """
+        with self.store.lock:
+            replica = self.store.pick_replica()
+            if not request.bucket:
+                if request.method == "GET":
+                    return self.list_buckets(request, replica)
+                raise S3Error(405, "MethodNotAllowed")
+            if request.key is None:
+                return self.bucket_operation(request, replica)
+            return self.object_operation(request, replica)
+
+    def _bucket(self, request, replica=None):
+        bucket = self.store.buckets.get(request.bucket)
+        if bucket is None or (replica is not None and bucket.visible_at[replica] > time.time()):
+            raise S3Error(404, "NoSuchBucket", "The specified bucket does not exist")
+        return bucket
+
+    def bucket_operation(self, request, replica):
+        method = request.method
+        if method == "PUT" and not request.query:
+            return self.create_bucket(request)
+
+        if method == "HEAD":
+            bucket = self._bucket(request, replica)
+            self.authorize(request, bucket, replica, "s3:ListBucket", "READ")
+            return 200, {"x-amz-bucket-region": bucket.region}, b""
+
+        bucket = self._bucket(request)
+        if request.has("versioning"):
+            self.authorize(request, bucket, replica, "s3:PutBucketVersioning" if method == "PUT" else "s3:GetBucketVersioning", None)
+            return self.bucket_versioning(request, bucket, replica)
+        if request.has("object-lock"):
+            self.authorize(request, bucket, replica, "s3:PutBucketObjectLockConfiguration", None)
+            return self.bucket_object_lock(request, bucket, replica)
+        if request.has("acl"):
+            self.authorize(request, bucket, replica, "s3:PutBucketAcl" if method == "PUT" else "s3:GetBucketAcl", None)
+            if method == "PUT":
+                bucket.acl.set(self._canned_acl(request))
+                return 200, {}, b""
+            return 200, {}, self._acl_document(bucket.acl.get(replica), bucket.owner)
+        if request.has("policy"):
+            self.authorize(request, bucket, replica, "s3:PutBucketPolicy", None)
+            return self.bucket_policy(request, bucket, replica)
+        if request.has("location"):
+            self.authorize(request, bucket, replica, "s3:GetBucketLocation", None)
+            region = "" if bucket.region == "us-east-1" else bucket.region
+            return 200, {}, f'<?xml version="1.0" encoding="UTF-8"?>\n<LocationConstraint xmlns="{S3_XMLNS}">{region}</LocationConstraint>'.encode()
+        if request.has("delete") and method == "POST":
+            self.authorize(request, bucket, replica, "s3:DeleteObject", "WRITE")
+            return self.delete_objects(request, bucket)
+        if request.has("uploads") and method == "GET":
+            self.authorize(request, bucket, replica, "s3:ListBucketMultipartUploads", "READ")
+            return self.list_multipart_uploads(request, bucket)
+        if request.has("versions") and method == "GET":
+            self.authorize(request, bucket, replica, "s3:ListBucketVersions", "READ")
+            return self.list_object_versions(request, bucket, replica)
+        if method == "GET":
+            self.authorize(request, bucket, replica, "s3:ListBucket", "READ")
+            return self.list_objects(request, bucket, replica)
+        if method == "DELETE" and not request.query:
+            self.authorize(request, bucket, replica, "s3:DeleteBucket", None)
+            if any(bucket.objects.values()) or bucket.uploads:
+                raise S3Error(409, "BucketNotEmpty", "The bucket you tried to delete is not empty")
+            del self.store.buckets[bucket.name]
+            return 204, {}, b""
+        raise S3Error(501, "NotImplemented", f"{method} {sorted(request.query)} is not implemented")
+
+    def object_operation(self, request, replica):
+        method = request.method
+        bucket = self._bucket(request)
+        if request.has("uploadId") or (request.has("uploads") and method == "POST"):
+            self.authorize(request, bucket, replica, "s3:PutObject", "WRITE")
+            return self.multipart(request, bucket, replica)
+        if request.has("acl"):
+            return self.object_acl(request, bucket, replica)
+        if request.has("retention"):
+            return self.object_retention(request, bucket, replica)
+        if request.has("attributes"):
+            version = self._version(request, bucket)
+            self.authorize(request, bucket, replica, "s3:GetObject", "READ", version)
+            return self.object_attributes(request, version)
+        if method == "PUT":
+            self.authorize(request, bucket, replica, "s3:PutObject", "WRITE")
+            if request.header("x-amz-copy-source"):
+                return self.copy_object(request, bucket, replica)
+            return self.put_object(request, bucket, replica, request.body)
+        if method in ("GET", "HEAD"):
+            version = self._version(request, bucket)
+            self.authorize(request, bucket, replica, "s3:GetObject", "READ", version)
+            return self.get_object(request, version, method)
+        if method == "DELETE":
+            self.authorize(request, bucket, replica, "s3:DeleteObject", "WRITE")
+            return self.delete_object(request, bucket, replica)
+        raise S3Error(501, "NotImplemented", f"{method} {sorted(request.query)} is not implemented")
+
+    # ### Buckets
+
+    def list_buckets(self, request, replica):
+        if not request.requester:
+            raise S3Error(403, "AccessDenied", "Anonymous users cannot list buckets")
+        now = time.time()
+        buckets = sorted(
+            (bucket for bucket in self.store.buckets.values()
+             if bucket.owner == request.requester and bucket.visible_at[replica] <= now),
+            key=lambda bucket: bucket.name,
+        )
+        return 200, {}, xml_document("ListAllMyBucketsResult", {
+            "Owner": {"ID": request.requester, "DisplayName": request.requester},
+            "Buckets": {"Bucket": [{"Name": b.name, "CreationDate": _iso(b.created)} for b in buckets]},
+        })
+
+    def create_bucket(self, request):
+        if not request.requester:
+            raise S3Error(403, "AccessDenied", "Anonymous users cannot create buckets")
+        existing = self.store.buckets.get(request.bucket)
+        if existing:
+            if existing.owner != request.requester:
+                raise S3Error(409, "BucketAlreadyExists", "The requested bucket name is not available")
+            if self.store.region != "us-east-1":
+                raise S3Error(409, "BucketAlreadyOwnedByYou", "Your previous request to create the named bucket succeeded")
+            return 200, {"Location": f"/{request.bucket}"}, b""
+        region = self.store.region
+        if request.body:
+            constraint = _text(ET.fromstring(request.body), "LocationConstraint")
+            region = constraint or region
+        lock_enabled = request.header("x-amz-bucket-object-lock-enabled", "").lower() == "true"
+        self.store.buckets[request.bucket] = Bucket(self.store, request.bucket, request.requester, region, lock_enabled)
+        acl = request.header("x-amz-acl")
+        if acl:
+            self.store.buckets[request.bucket].acl.set(self._canned_acl(request))
+        return 200, {"Location": f"/{request.bucket}"}, b""
+
+    def bucket_versioning(self, request, bucket, replica):
+        if request.method == "PUT":
+            status = _text(ET.fromstring(request.body), "Status")
+            if status not in ("Enabled", "Suspended"):
+                raise S3Error(400, "MalformedXML", "Versioning status must be Enabled or Suspended")
+            if status == "Suspended" and bucket.object_lock.get():
+                raise S3Error(409, "InvalidBucketState", "Versioning cannot be suspended on a bucket with object lock")
+            bucket.versioning.set(status)
+            return 200, {}, b""
+        status = bucket.versioning.get(replica)
+        return 200, {}, xml_document("VersioningConfiguration", {"Status": status} if status else {})
+
+    def bucket_object_lock(self, request, bucket, replica):
+        if request.method == "PUT":
+            if bucket.versioning.get() != "Enabled":
+                raise S3Error(409, "InvalidBucketState", "Object lock requires a versioned bucket")
+            root = ET.fromstring(request.body)
+            configuration = {"ObjectLockEnabled": _text(root, "ObjectLockEnabled")}
+            rules = _children(root, "Rule")
+            if rules:
+                retention = _children(rules[0], "DefaultRetention")[0]
+                mode = _text(retention, "Mode")
+                if mode not in ("GOVERNANCE", "COMPLIANCE"):
+                    raise S3Error(400, "MalformedXML", f"Invalid retention mode {mode}")
+                configuration["Rule"] = {"DefaultRetention": {
+                    name: int(value) if name != "Mode" else value
+                    for name in ("Mode", "Days", "Years")
+                    if (value := _text(retention, name)) is not None
+                }}
+            bucket.object_lock.set(configuration)
+            return 200, {}, b""
+        configuration = bucket.object_lock.get(replica)
+        if not configuration:
+            raise S3Error(404, "ObjectLockConfigurationNotFoundError", "Object Lock configuration does not exist for this bucket")
+        return 200, {}, xml_document("ObjectLockConfiguration", configuration)
+
+    def bucket_policy(self, request, bucket, replica):
+        if request.method == "PUT":
+            try:
+                policy = json.loads(request.body)
+            except ValueError:
+                raise S3Error(400, "MalformedJSON", "Policies must be valid JSON")
+            if (
+                not isinstance(policy, dict) or policy.get("Version") != "2012-10-17"
+                or not isinstance(policy.get("Statement"), list) or not policy["Statement"]
+                or any(statement.get("Effect") not in ("Allow", "Deny") for statement in policy["Statement"])
+            ):
+                raise S3Error(400, "MalformedPolicy", "Policies must have Version 2012-10-17 and Allow or Deny statements")
+            bucket.policy.set(policy)
+            return 204, {}, b""
+        if request.method == "DELETE":
+            bucket.policy.set(None)
+            return 204, {}, b""
+        policy = bucket.policy.get(replica)
+        if not policy:
+            raise S3Error(404, "NoSuchBucketPolicy", "The bucket policy does not exist")
+        return 200, {}, json.dumps(policy).encode()
+
+    # ### Listings
+
+    def _listed(self, version, replica):
+        return not version.listed_at or version.listed_at[replica] <= time.time()
+
+    def _encode(self, request, value):
+        return quote_plus(value, safe="/") if request.query.get("encoding-type") == "url" else value
+
+    def list_objects(self, request, bucket, replica):
+        v2 = request.query.get("list-type") == "2"
+        prefix = request.query.get("prefix", "")
+        delimiter = request.query.get("delimiter", "")
+        max_keys = int(request.query.get("max-keys", 1000))
+        if v2:
+            token = request.query.get("continuation-token")
+            start = base64.urlsafe_b64decode(token).decode() if token else request.query.get("start-after", "")
+        else:
+            start = request.query.get("marker", "")
+
+        contents, prefixes, last, truncated = [], [], None, False
+        for key in sorted(bucket.objects):
+            version = bucket.latest(key)
+            if key <= start or not key.startswith(prefix) or version.delete_marker or not self._listed(version, replica):
+                continue
+            if delimiter and start.endswith(delimiter) and key.startswith(start):
+                continue
+            common = None
+            if delimiter and delimiter in key[len(prefix):]:
+                common = key[:len(prefix) + key[len(prefix):].index(delimiter) + len(delimiter)]
+                if prefixes and prefixes[-1] == common:
+                    continue
+            if len(contents) + len(prefixes) >= max_keys:
+                truncated = True
+                break
+            if common:
+                prefixes.append(common)
+                last = common
+            else:
+                contents.append(version)
+                last = key
+
+        result = {"Name": bucket.name, "Prefix": self._encode(request, prefix)}
+        if v2:
+            result["KeyCount"] = len(contents) + len(prefixes)
+            if request.query.get("continuation-token"):
+                result["ContinuationToken"] = request.query["continuation-token"]
+            if truncated:
+                result["NextContinuationToken"] = base64.urlsafe_b64encode(last.encode()).decode()
+        else:
+            result["Marker"] = self._encode(request, start)
+            if truncated and delimiter:
+                result["NextMarker"] = self._encode(request, last)
+        result.update({"MaxKeys": max_keys, "IsTruncated": truncated})
+        if delimiter:
+            result["Delimiter"] = self._encode(request, delimiter)
+        if request.query.get("encoding-type") == "url":
+            result["EncodingType"] = "url"
+        owner = not v2 or request.query.get("fetch-owner") == "true"
+        result["Contents"] = [
+            {
+                "Key": self._encode(request, version.key),
+                "LastModified": _iso(version.last_modified),
+                "ETag": version.etag,
+                "Size": len(version.body),
+                "StorageClass": version.storage_class,
+                "Owner": {"ID": version.owner, "DisplayName": version.owner} if owner else None,
+            }
+            for version in contents
+        ]
+        result["CommonPrefixes"] = [{"Prefix": self._encode(request, common)} for common in prefixes]
+        return 200, {}, xml_document("ListBucketResult", result)
+
+    def list_object_versions(self, request, bucket, replica):
+        prefix = request.query.get("prefix", "")
+        max_keys = int(request.query.get("max-keys", 1000))
+        key_marker = request.query.get("key-marker", "")
+        version_marker = request.query.get("version-id-marker", "")
+
+        entries, truncated, next_markers = [], False, None
+        for key in sorted(bucket.objects):
+            if not key.startswith(prefix) or key < key_marker:
+                continue
+            versions = [version for version in reversed(bucket.objects[key]) if self._listed(version, replica)]
+            for index, version in enumerate(versions):
+                if key == key_marker:
+                    # resume after the version marker, or after the whole key without one
+                    if not version_marker:
+                        break
+                    position = next((i for i, v in enumerate(versions) if v.version_id == version_marker), None)
+                    if position is None or index <= position:
+                        continue
+                if len(entries) >= max_keys:
+                    truncated = True
+                    break
+                entries.append((version, index == 0))
+                next_markers = (key, version.version_id)
+            if truncated:
+                break
+
+        result = {"Name": bucket.name, "Prefix": self._encode(request, prefix), "KeyMarker": key_marker,
+                  "VersionIdMarker": version_marker, "MaxKeys": max_keys, "IsTruncated": truncated}
+        if truncated:
+            result["NextKeyMarker"] = self._encode(request, next_markers[0])
+            result["NextVersionIdMarker"] = next_markers[1]
+        if request.query.get("encoding-type") == "url":
+            result["EncodingType"] = "url"
+        result["Version"] = []
+        result["DeleteMarker"] = []
+        for version, is_latest in entries:
+            entry = {
+                "Key": self._encode(request, version.key),
+                "VersionId": version.version_id,
+                "IsLatest": is_latest,
+                "LastModified": _iso(version.last_modified),
+            }
+            if version.delete_marker:
+                result["DeleteMarker"].append({**entry, "Owner": {"ID": version.owner}})
+            else:
+                result["Version"].append({**entry, "ETag": version.etag, "Size": len(version.body),
+                                          "StorageClass": version.storage_class, "Owner": {"ID": version.owner}})
+        return 200, {}, xml_document("ListVersionsResult", result)
+
+    # ### Objects
+
+    def _version(self, request, bucket):
+        version_id = request.query.get("versionId")
+        versions = bucket.objects.get(request.key, [])
+        if version_id:
+            version = next((v for v in versions if v.version_id == version_id), None)
+            if version is None:
+                raise S3Error(404, "NoSuchVersion", "The specified version does not exist")
+            if version.delete_marker:
+                raise S3Error(405, "MethodNotAllowed", "The specified method is not allowed against a delete marker")
+            return version
+        if not versions or versions[-1].delete_marker:
+            raise S3Error(404, "NoSuchKey", "The specified key does not exist")
+        return versions[-1]
+
+    def _store_version(self, bucket, replica, version):
+        """
+        Add a version as the replica serving the request sees the bucket versioning
+        :return: dict: response headers of the new version
+        """
+        versioned = bucket.versioning.get(replica) == "Enabled"
+        version.version_id = uuid.uuid4().hex if versioned else "null"
+        version.last_modified = time.time()
+        version.listed_at = tuple(version.last_modified + self.store.delay("listing") for _ in range(self.store.replicas))
+        versions = bucket.objects.setdefault(version.key, [])
+        if not versioned:
+            versions[:] = [v for v in versions if v.version_id != "null"]
+        versions.append(version)
+        return {"x-amz-version-id": version.version_id} if versioned else {}
+
+    def _apply_retention(self, request, bucket, replica, version):
+        mode = request.header("x-amz-object-lock-mode")
+        until = request.header("x-amz-object-lock-retain-until-date")
+        if mode and until:
+            version.retention_mode, version.retain_until = mode, _parse_iso(until)
+            return
+        configuration = bucket.object_lock.get(replica) or {}
+        retention = configuration.get("Rule", {}).get("DefaultRetention")
+        if retention and version.version_id != "null":
+            days = retention.get("Days", 0) + 365 * retention.get("Years", 0)
+            version.retention_mode = retention["Mode"]
+            version.retain_until = version.last_modified + days * 86400
+
+    def _metadata(self, request):
+        return {name[len("x-amz-meta-"):]: value for name, value in request.headers.items() if name.startswith("x-amz-meta-")}
+
+    def _storage_class(self, request, default="STANDARD"):
+        storage_class = request.header("x-amz-storage-class", default)
+        if storage_class not in STORAGE_CLASSES:
+            raise S3Error(400, "InvalidStorageClass", f"The storage class {storage_class} is not valid")
+        return storage_class
+
+    def put_object(self, request, bucket, replica, body):
+        acl = request.header("x-amz-acl", "private")
+        if acl not in CANNED_ACLS:
+            raise S3Error(400, "InvalidArgument", f"Invalid canned ACL {acl!r}")
+        version = ObjectVersion(
+            key=request.key,
+            version_id="",
+            owner=request.requester or bucket.owner,
+            body=body,
+            etag=f'"{hashlib.md5(body).hexdigest()}"',
+            storage_class=self._storage_class(request),
+            content_type=request.header("content-type", "binary/octet-stream"),
+            metadata=self._metadata(request),
+            acl=acl,
+        )
+        headers = self._store_version(bucket, replica, version)
+        self._apply_retention(request, bucket, replica, version)
+        headers["ETag"] = version.etag
+        if version.storage_class != "STANDARD":
+            headers["x-amz-storage-class"] = version.storage_class
+        return 200, headers, b""
+
+    def copy_object(self, request, bucket, replica):
+        source = unquote(request.header("x-amz-copy-source")).lstrip("/")
+        source, _, source_query = source.partition("?")
+        source_bucket_name, _, source_key = source.partition("/")
+        source_request = Request("GET", source_bucket_name, source_key, parse_qs_first(source_query),
+                                 {}, b"", request.requester)
+        source_bucket = self._bucket(source_request)
+        source_version = self._version(source_request, source_bucket)
+        self.authorize(source_request, source_bucket, replica, "s3:GetObject", "READ", source_version)
+
+        replace = request.header("x-amz-metadata-directive", "COPY") == "REPLACE"
+        version = ObjectVersion(
+            key=request.key,
+            version_id="",
+            owner=request.requester or bucket.owner,
+            body=source_version.body,
+            etag=source_version.etag,
+            storage_class=self._storage_class(request, default="STANDARD"),
+            content_type=request.header("content-type", source_version.content_type) if replace else source_version.content_type,
+            metadata=self._metadata(request) if replace else dict(source_version.metadata),
+            acl=request.header("x-amz-acl", "private"),
+        )
+        headers = self._store_version(bucket, replica, version)
+        self._apply_retention(request, bucket, replica, version)
+        if source_version.version_id != "null":
+            headers["x-amz-copy-source-version-id"] = source_version.version_id
+        return 200, headers, xml_document("CopyObjectResult", {
+            "LastModified": _iso(version.last_modified), "ETag": version.etag,
+        })
+
+    def get_object(self, request, version, method):
+        headers = {
+            "ETag": version.etag,
+            "Last-Modified": formatdate(version.last_modified, usegmt=True),
+            "Content-Type": version.content_type,
+            "Accept-Ranges": "bytes",
+        }
+        if version.version_id != "null":
+            headers["x-amz-version-id"] = version.version_id
+        if version.storage_class != "STANDARD":
+            headers["x-amz-storage-class"] = version.storage_class
+        if version.retention_mode:
+            headers["x-amz-object-lock-mode"] = version.retention_mode
+            headers["x-amz-object-lock-retain-until-date"] = _iso(version.retain_until)
+        for name, value in version.metadata.items():
+            headers[f"x-amz-meta-{name}"] = value
+
+        body = version.body
+        status = 200
+        byte_range = request.header("range")
+        if byte_range and byte_range.startswith("bytes="):
+            first, _, last = byte_range[len("bytes="):].partition("-")
+            if first:
+                start, end = int(first), min(int(last) if last else len(body) - 1, len(body) - 1)
+            else:
+                start, end = max(0, len(body) - int(last)), len(body) - 1
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            body = body[start:end + 1]
+            status = 206
+        headers["Content-Length"] = str(len(body))
+        return status, headers, b"" if method == "HEAD" else body
+
+    def _check_retention(self, request, version):
+        if not version.retention_mode or version.retain_until <= time.time():
+            return
+        bypass = request.header("x-amz-bypass-governance-retention", "").lower() == "true"
+        if version.retention_mode == "COMPLIANCE" or not bypass:
+            raise S3Error(403, "AccessDenied", "Access Denied because object protected by object lock")
+
+    def _delete(self, request, bucket, replica, key, version_id):
+        """
+        :return: dict: response headers (x-amz-version-id, x-amz-delete-marker)
+        """
+        versions = bucket.objects.get(key, [])
+        if version_id:
+            version = next((v for v in versions if v.version_id == version_id), None)
+            if version is None:
+                return {}
+            self._check_retention(request, version)
+            versions.remove(version)
+            if not versions:
+                bucket.objects.pop(key, None)
+            headers = {"x-amz-version-id": version_id}
+            if version.delete_marker:
+                headers["x-amz-delete-marker"] = "true"
+            return headers
+        if bucket.versioning.get(replica) in ("Enabled", "Suspended"):
+            marker = ObjectVersion(key=key, version_id="", owner=request.requester or bucket.owner, delete_marker=True)
+            headers = self._store_version(bucket, replica, marker)
+            return {**headers, "x-amz-delete-marker": "true"}
+        versions[:] = [v for v in versions if v.version_id != "null"]
+        if not versions:
+            bucket.objects.pop(key, None)
+        return {}
+
+    def delete_object(self, request, bucket, replica):
+        return 204, self._delete(request, bucket, replica, request.key, request.query.get("versionId")), b""
+
+    def delete_objects(self, request, bucket):
+        root = ET.fromstring(request.body)
+        quiet = (_text(root, "Quiet") or "").lower() == "true"
+        deleted, errors = [], []
+        for entry in _children(root, "Object"):
+            key, version_id = _text(entry, "Key"), _text(entry, "VersionId")
+            try:
+                replica = self.store.pick_replica()
+                headers = self._delete(request, bucket, replica, key, version_id)
+            except S3Error as e:
+                errors.append({"Key": key, "VersionId": version_id, "Code": e.code, "Message": e.message})
+                continue
+            if not quiet:
+                result = {"Key": key, "VersionId": version_id}
+                if headers.get("x-amz-delete-marker"):
+                    result.update({"DeleteMarker": True, "DeleteMarkerVersionId": headers.get("x-amz-version-id")})
+                deleted.append(result)
+        return 200, {}, xml_document("DeleteResult", {"Deleted": deleted, "Error": errors})
+
+    def object_attributes(self, request, version):
+        names = [name.strip() for name in request.header("x-amz-object-attributes", "").split(",")]
+        result = {}
+        if "ETag" in names:
+            result["ETag"] = version.etag.strip('"')
+        if "StorageClass" in names:
+            result["StorageClass"] = version.storage_class
+        if "ObjectSize" in names:
+            result["ObjectSize"] = len(version.body)
+        headers = {"Last-Modified": formatdate(version.last_modified, usegmt=True)}
+        if version.version_id != "null":
+            headers["x-amz-version-id"] = version.version_id
+        return 200, headers, xml_document("GetObjectAttributesResponse", result)
+
+    def object_acl(self, request, bucket, replica):
+        version = self._version(request, bucket)
+        if request.requester not in (version.owner, bucket.owner):
+            raise S3Error(403, "AccessDenied", "Access Denied")
+        if request.method == "PUT":
+            version.acl = self._canned_acl(request)
+            return 200, {}, b""
+        return 200, {}, self._acl_document(version.acl, version.owner)
+
+    def object_retention(self, request, bucket, replica):
+        version = self._version(request, bucket)
+        self.authorize(request, bucket, replica, "s3:GetObjectRetention", None)
+        if request.method == "PUT":
+            root = ET.fromstring(request.body)
+            mode, until = _text(root, "Mode"), _parse_iso(_text(root, "RetainUntilDate"))
+            if version.retention_mode == "COMPLIANCE" and until < (version.retain_until or 0):
+                raise S3Error(403, "AccessDenied", "COMPLIANCE retention cannot be shortened")
+            if version.retention_mode == "GOVERNANCE" and until < (version.retain_until or 0):
+                self._check_retention(request, version)
+            version.retention_mode, version.retain_until = mode, until
+            return 200, {}, b""
+        if not version.retention_mode:
+            raise S3Error(404, "NoSuchObjectLockConfiguration", "The specified object does not have a ObjectLock configuration")
+        return 200, {}, xml_document("Retention", {"Mode": version.retention_mode, "RetainUntilDate": _iso(version.retain_until)})
+
+    # ### Multipart uploads
+
+    def multipart(self, request, bucket, replica):
+        method = request.method
+        if request.has("uploads"):
+            upload = MultipartUpload(
+                upload_id=uuid.uuid4().hex,
+                key=request.key,
+                owner=request.requester or bucket.owner,
+                initiated=time.time(),
+                storage_class=self._storage_class(request),
+                content_type=request.header("content-type", "binary/octet-stream"),
+                metadata=self._metadata(request),
+            )
+            bucket.uploads[upload.upload_id] = upload
+            return 200, {}, xml_document("InitiateMultipartUploadResult", {
+                "Bucket": bucket.name, "Key": request.key, "UploadId": upload.upload_id,
+            })
+
+        upload = bucket.uploads.get(request.query["uploadId"])
+        if upload is None or upload.key != request.key:
+            raise S3Error(404, "NoSuchUpload", "The specified multipart upload does not exist")
+        if method == "PUT":
+            part_number = int(request.query["partNumber"])
+            etag = f'"{hashlib.md5(request.body).hexdigest()}"'
+            upload.parts[part_number] = (request.body, etag, time.time())
+            return 200, {"ETag": etag}, b""
+        if method == "DELETE":
+            del bucket.uploads[upload.upload_id]
+            return 204, {}, b""
+        if method == "GET":
+            return 200, {}, xml_document("ListPartsResult", {
+                "Bucket": bucket.name, "Key": upload.key, "UploadId": upload.upload_id,
+                "StorageClass": upload.storage_class, "IsTruncated": False,
+                "Part": [
+                    {"PartNumber": number, "LastModified": _iso(modified), "ETag": etag, "Size": len(body)}
+                    for number, (body, etag, modified) in sorted(upload.parts.items())
+                ],
+            })
+
+        # complete
+        requested = [
+            (int(_text(part, "PartNumber")), _text(part, "ETag"))
+            for part in _children(ET.fromstring(request.body), "Part")
+        ]
+        if [number for number, _ in requested] != sorted(number for number, _ in requested):
+            raise S3Error(400, "InvalidPartOrder", "The list of parts was not in ascending order")
+        bodies, digests = [], []
+        for index, (number, etag) in enumerate(requested):
+            part = upload.parts.get(number)
+            if part is None or part[1].strip('"') != (etag or "").strip('"'):
+                raise S3Error(400, "InvalidPart", f"Part {number} could not be found")
+            if index < len(requested) - 1 and len(part[0]) < MIN_PART_SIZE:
+                raise S3Error(400, "EntityTooSmall", "Your proposed upload is smaller than the minimum allowed size")
+            bodies.append(part[0])
+            digests.append(hashlib.md5(part[0]).digest())
+        body = b"".join(bodies)
+        version = ObjectVersion(
+            key=upload.key, version_id="", owner=upload.owner, body=body,
+            etag=f'"{hashlib.md5(b"".join(digests)).hexdigest()}-{len(requested)}"',
+            storage_class=upload.storage_class, content_type=upload.content_type, metadata=upload.metadata,
+        )
+        headers = self._store_version(bucket, replica, version)
+        self._apply_retention(request, bucket, replica, version)
+        del bucket.uploads[upload.upload_id]
+        return 200, headers, xml_document("CompleteMultipartUploadResult", {
+            "Location": f"/{bucket.name}/{upload.key}", "Bucket": bucket.name, "Key": upload.key, "ETag": version.etag,
+        })
+
+    def list_multipart_uploads(self, request, bucket):
+        prefix = request.query.get("prefix", "")
+        uploads = sorted(
+            (upload for upload in bucket.uploads.values() if upload.key.startswith(prefix)),
+            key=lambda upload: (upload.key, upload.initiated),
+        )
+        return 200, {}, xml_document("ListMultipartUploadsResult", {
+            "Bucket": bucket.name, "Prefix": prefix, "IsTruncated": False,
+            "Upload": [
+                {"Key": upload.key, "UploadId": upload.upload_id, "StorageClass": upload.storage_class,
+                 "Initiated": _iso(upload.initiated), "Owner": {"ID": upload.owner}}
+                for upload in uploads
+            ],
+        })
+
+
+def parse_qs_first(query):
+    return {name: values[0] for name, values in parse_qs(query, keep_blank_values=True).items()}
+
+
+def decode_aws_chunked(body):
+    """
+    Payload of a body sent with aws-chunked content encoding (chunk signatures and trailers are dropped)
+    """
+    payload = []
+    position = 0
+    while True:
+        line_end = body.index(b"\r\n", position)
+        size = int(body[position:line_end].split(b";")[0], 16)
+        position = line_end + 2
+        if size == 0:
+            return b"".join(payload)
+        payload.append(body[position:position + size])
+        position += size + 2
+
+
+def requester_of(headers, query):
+    """
+    Tenant of a request from the access key of its signature, None for anonymous requests
+    """
+    credential = query.get("X-Amz-Credential") or query.get("AWSAccessKeyId")
+    authorization = headers.get("authorization", "")
+    if not credential and "Credential=" in authorization:
+        credential = authorization.split("Credential=")[1]
+    elif not credential and authorization.startswith("AWS "):
+        credential = authorization[len("AWS "):]
+    if not credential:
+        return None
+    return owner_id(credential.split("/")[0].split(":")[0])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "LocalS3"
+
+    def setup(self):
+        super().setup()
+        # headers and body go out in separate writes, without this a client reading the body
+        # waits for a delayed ACK (about 40ms) on every response
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        logging.debug(f"[local_s3] {self.address_string()} {format % args}")
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    while self.rfile.readline() not in (b"\r\n", b""):
+                        pass
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            body = b"".join(chunks)
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        encoding = self.headers.get("Content-Encoding", "")
+        if "aws-chunked" in encoding or self.headers.get("x-amz-content-sha256", "").startswith("STREAMING-"):
+            body = decode_aws_chunked(body)
+        return body
+
+    def _route(self):
+        parts = urlsplit(self.path)
+        query = parse_qs_first(parts.query)
+        path = unquote(parts.path)
+        host = self.headers.get("Host", "").split(":")[0]
+        server_host = self.server.server_hostname
+        if server_host and host.endswith("." + server_host):
+            # virtual-hosted style
+            bucket, key = host[:-len(server_host) - 1], path.lstrip("/")
+        else:
+            bucket, _, key = path.lstrip("/").partition("/")
+            if "/" not in path.lstrip("/"):
+                key = None
+        return bucket or None, key or None, query
+
+    def _handle(self):
+        body = self._read_body()
+        bucket, key, query = self._route()
+        headers = {name.lower(): value for name, value in self.headers.items()}
+        request_id = uuid.uuid4().hex[:16].upper()
+        try:
+            expires = query.get("X-Amz-Expires")
+            if expires and datetime.strptime(query["X-Amz-Date"], "%Y%m%dT%H%M%SZ").replace(
+                tzinfo=timezone.utc
+            ) + timedelta(seconds=int(expires)) < datetime.now(timezone.utc):
+                raise S3Error(403, "AccessDenied", "Request has expired")
+            request = Request(self.command, bucket, key, query, headers, body, requester_of(headers, query))
+            status, response_headers, response_body = self.server.s3.handle(request)
+        except S3Error as e:
+            status, response_headers = e.status, {}
+            response_body = xml_document("Error", {
+                "Code": e.code, "Message": e.message, "Resource": self.path, "RequestId": request_id,
+            }, namespace=False)
+        except Exception as e:
+            logging.exception(f"[local_s3] {self.command} {self.path} failed")
+            status, response_headers = 500, {}
+            response_body = xml_document("Error", {"Code": "InternalError", "Message": str(e)}, namespace=False)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        self.send_response(status)
+        self.send_header("x-amz-request-id", request_id)
+        if response_body and "Content-Type" not in response_headers:
+            self.send_header("Content-Type", "application/xml")
+        for name, value in response_headers.items():
+            self.send_header(name, value)
+        if "Content-Length" not in response_headers:
+            self.send_header("Content-Length", str(0 if self.command == "HEAD" else len(response_body)))
+        self.end_headers()
+        if self.command != "HEAD" and status not in (204, 304):
+            self.wfile.write(response_body)
+
+    do_GET = do_PUT = do_POST = do_DELETE = do_HEAD = _handle
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients hang up mid-request (timeouts, interrupted tests), that is no error of the stand-in
+        error = sys.exc_info()[1]
+        if isinstance(error, (ConnectionResetError, BrokenPipeError)):
+            logging.debug(f"[local_s3] {client_address[0]} closed the connection: {error!r}")
+            return
+        logging.exception(f"[local_s3] error serving {client_address[0]}")
+
+
+class LocalS3Server:
+    """
+    The stand-in served on a background thread
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, region="local", lag=None, replicas=3, latency=0):
+        """
+        :param host: str: address to listen on
+        :param port: int: port to listen on, 0 for any free port
+        :param region: str: region of the buckets
+        :param lag: dict: replication lag per setting, see LocalS3Store
+        :param replicas: int: number of simulated replicas
+        :param latency: float: seconds added to every response
+        """
+        self.store = LocalS3Store(region=region, lag=lag, replicas=replicas)
+        self.httpd = _HTTPServer((host, port), _Handler)
+        self.httpd.s3 = LocalS3(self.store)
+        self.httpd.server_hostname = host if not host.replace(".", "").isdigit() else None
+        self.httpd.latency = latency
+        self._thread = None
+
+    @property
+    def endpoint_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="local-s3", daemon=True)
+        self._thread.start()
+        logging.info(f"[local_s3] serving on {self.endpoint_url} with lag {self.store.lag}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local S3 stand-in with simulated replication lag")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9555)
+    parser.add_argument("--region", default="local")
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--lag", action="append", default=[], metavar="SETTING=SECONDS[:MAX]",
+                        help=f"replication lag of one of {', '.join(LAGGED_SETTINGS)}, e.g. versioning=0:2")
+    args = parser.parse_args()
+    lag = {}
+    for item in args.lag:
+        setting, _, seconds = item.partition("=")
+        low, _, high = seconds.partition(":")
+        lag[setting] = [float(low), float(high)] if high else float(low)
+
+    logging.basicConfig(level=logging.INFO)
+    server = LocalS3Server(args.host, args.port, args.region, lag, args.replicas, args.latency)
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import csv
+import logging
+import threading
+import time
+from array import array
+
+# ## Request metrics
+#
+# A recorder attaches to boto3 clients through botocore events and keeps, per operation, one
+# sample per request in compact arrays (latency, time to first byte, status, retries and bytes).
+# Percentiles and histograms are computed from the arrays on demand, so recording a request costs
+# a few appends.
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def percentile(samples, fraction):
+    """
+    Nearest-rank percentile
+    :param samples: sequence of numbers
+    :param fraction: float: between 0 and 1
+    :return: float or None if there are no samples
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+class OperationSamples:
+    """
+    Array-backed samples of one operation
+    """
+
+    def __init__(self):
+        self.latency = array("d")
+        self.ttfb = array("d")
+        self.status = array("H")
+        self.retries = array("H")
+        self.bytes_sent = array("Q")
+        self.bytes_received = array("Q")
+        self.error_codes = {}
+
+    def __len__(self):
+        return len(self.latency)
+
+    def append(self, latency, ttfb, status, retries, bytes_sent, bytes_received, error_code=None):
+        self.latency.append(latency)
+        self.ttfb.append(ttfb)
+        self.status.append(status)
+        self.retries.append(retries)
+        self.bytes_sent.append(bytes_sent)
+        self.bytes_received.append(bytes_received)
+        if error_code:
+            self.error_codes[error_code] = self.error_codes.get(error_code, 0) + 1
+
+    def histogram(self, start=0, buckets=LATENCY_BUCKETS):
+        """
+        Cumulative latency histogram of the samples from index start
+        :return: list of (upper bound, count) pairs, the last bound is inf
+        """
+        counts = [0] * (len(buckets) + 1)
+        for latency in self.latency[start:]:
+            for i, bound in enumerate(buckets):
+                if latency <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        cumulative = []
+        total = 0
+        for bound, count in zip(list(buckets) + [float("inf")], counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+    def summary(self, start=0):
+        """
+        Percentiles and totals of the samples from index start
+        :return: dict
+        """
+        latency = self.latency[start:]
+        ttfb = self.ttfb[start:]
+        return {
+            "count": len(latency),
+            "p50": percentile(latency, 0.5),
+            "p90": percentile(latency, 0.9),
+            "p99": percentile(latency, 0.99),
+            "ttfb_p50": percentile(ttfb, 0.5),
+            "errors": sum(1 for status in self.status[start:] if status == 0 or status >= 300),
+            "retries": sum(self.retries[start:]),
+            "bytes_sent": sum(self.bytes_sent[start:]),
+            "bytes_received": sum(self.bytes_received[start:]),
+        }
+
+
+class RequestRecorder:
+    """
+    Records every request made by the clients it is attached to
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.operations = {}
+
+    def attach(self, s3_client):
+        """
+        Register the recorder on a client's events and time its HTTP sends
+        :param s3_client: boto3 s3 client
+        """
+        events = s3_client.meta.events
+        events.register("before-call.s3", self._before_call)
+        events.register("before-send.s3", self._before_send)
+        events.register("after-call.s3", self._after_call)
+        events.register("after-call-error.s3", self._after_call_error)
+
+        # botocore sends with preload_content=False, so send returns when the headers arrived
+        http_session = s3_client._endpoint.http_session
+        send = http_session.send
+
+        def timed_send(request):
+            start = time.monotonic()
+            response = send(request)
+            self._local.ttfb = time.monotonic() - start
+            return response
+
+        http_session.send = timed_send
+
+    def _before_call(self, model, context, **kwargs):
+        context["metrics_start"] = time.monotonic()
+        context["metrics_operation"] = model.name
+
+    def _before_send(self, request, **kwargs):
+        self._local.ttfb = None
+        self._local.send_start = time.monotonic()
+        body = request.body
+        length = request.headers.get("Content-Length")
+        if length is not None:
+            self._local.bytes_sent = int(length)
+        elif isinstance(body, (bytes, str)):
+            self._local.bytes_sent = len(body)
+        else:
+            self._local.bytes_sent = 0
+
+    def _record(self, operation, context, status, retries, bytes_received, error_code=None):
+        now = time.monotonic()
+        latency = now - context.get("metrics_start", now)
+        ttfb = getattr(self._local, "ttfb", None)
+        if ttfb is None:
+            # the response did not come from the network (e.g. short-circuited by a before-send handler)
+            ttfb = now - getattr(self._local, "send_start", now)
+        bytes_sent = getattr(self._local, "bytes_sent", 0)
+        with self._lock:
+            samples = self.operations.setdefault(operation, OperationSamples())
+            samples.append(latency, ttfb, status, retries, bytes_sent, bytes_received, error_code)
+
+    def _after_call(self, http_response, parsed, model, context, **kwargs):
+        metadata = parsed.get("ResponseMetadata", {})
+        error_code = parsed.get("Error", {}).get("Code") if http_response.status_code >= 300 else None
+        self._record(
+            model.name,
+            context,
+            http_response.status_code,
+            metadata.get("RetryAttempts", 0),
+            int(http_response.headers.get("Content-Length") or 0),
+            error_code,
+        )
+
+    def _after_call_error(self, exception, context, **kwargs):
+        operation = context.get("metrics_operation") or type(exception).__name__
+        self._record(operation, context, 0, 0, 0, type(exception).__name__)
+
+    def mark(self):
+        """
+        Current position of every operation, to summarize only what happens after it
+        :return: dict: operation name to number of samples
+        """
+        with self._lock:
+            return {operation: len(samples) for operation, samples in self.operations.items()}
+
+    def summary(self, since=None):
+        """
+        Per-operation percentiles and totals
+        :param since: dict: positions returned by mark, None for everything
+        :return: dict: operation name to summary dict
+        """
+        since = since or {}
+        with self._lock:
+            return {
+                operation: samples.summary(since.get(operation, 0))
+                for operation, samples in sorted(self.operations.items())
+                if len(samples) > since.get(operation, 0)
+            }
+
+    def format_summary(self, since=None):
+        lines = []
+        for operation, summary in self.summary(since).items():
+            lines.append(
+                f"{operation}: n={summary['count']} p50={summary['p50'] * 1000:.1f}ms "
+                f"p90={summary['p90'] * 1000:.1f}ms p99={summary['p99'] * 1000:.1f}ms "
+                f"errors={summary['errors']} retries={summary['retries']}"
+            )
+        return "\n".join(lines)
+
+    def export_csv(self, path):
+        """
+        Write every raw sample, one row per request
+        :param path: str: destination csv file
+        """
+        with self._lock, open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["operation", "latency", "ttfb", "status", "retries", "bytes_sent", "bytes_received"])
+            for operation, samples in sorted(self.operations.items()):
+                for row in zip(samples.latency, samples.ttfb, samples.status, samples.retries,
+                               samples.bytes_sent, samples.bytes_received):
+                    writer.writerow([operation, *row])
+        logging.info(f"Exported raw request metrics to {path}")
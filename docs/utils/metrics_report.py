@@ -0,0 +1,140 @@
+import json
+import logging
+import os
+import time
+from utils.consistency import convergence_results
+from utils.metrics import LATENCY_BUCKETS
+
+# ## Run metrics report
+#
+# Pytest plugin that writes, at the end of a run, the request latency histograms, error counts by
+# S3 error code, consistency wait durations and test durations to an OpenMetrics text file and a
+# JSON file, labelled with the profile and region of the run, so regional health checks can be
+# scraped by monitoring instead of parsed from logs. Under pytest-xdist every worker writes the
+# files of the requests and tests it ran, suffixed with its worker id, and the controller none.
+# Their samples carry a worker label, so the series of two workers never collide when the files
+# are scraped together.
+
+METRIC_PREFIX = "s3specs"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _bound(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class MetricsReport:
+    """
+    Collects test durations and writes the run metrics at session finish
+    :param output_dir: str: directory of the .prom and .json files
+    :param labels: dict: labels added to every metric (profile, region), plus the xdist worker id
+    :param get_recorder: callable returning the session RequestRecorder, or None if no request was made
+    """
+
+    def __init__(self, output_dir, labels, get_recorder):
+        self.output_dir = output_dir
+        self.worker = os.environ.get("PYTEST_XDIST_WORKER")
+        self.labels = {**labels, "worker": self.worker} if self.worker else labels
+        self.get_recorder = get_recorder
+        self.tests = {}
+        self.started = time.time()
+
+    def pytest_runtest_logreport(self, report):
+        test = self.tests.setdefault(report.nodeid, {"duration": 0.0, "outcome": "passed"})
+        test["duration"] += report.duration
+        if report.failed:
+            test["outcome"] = "failed"
+        elif report.skipped and test["outcome"] == "passed":
+            test["outcome"] = "skipped"
+
+    def pytest_sessionfinish(self, session):
+        os.makedirs(self.output_dir, exist_ok=True)
+        data = self.collect()
+        name = self.labels.get("profile") or "run"
+        if self.worker:
+            name = f"{name}.{self.worker}"
+        base = os.path.join(self.output_dir, name)
+
+        with open(f"{base}.json", "w") as f:
+            json.dump(data, f, indent=2)
+        with open(f"{base}.prom", "w") as f:
+            f.write(self.openmetrics(data))
+        logging.info(f"Run metrics written to {base}.json and {base}.prom")
+
+    def collect(self):
+        """
+        Gather every metric of the run in a JSON-serializable dict
+        """
+        recorder = self.get_recorder()
+        operations = {}
+        if recorder:
+            for operation, samples in sorted(recorder.operations.items()):
+                operations[operation] = {
+                    **samples.summary(),
+                    "latency_sum": sum(samples.latency),
+                    "histogram": [[bound, count] for bound, count in samples.histogram()],
+                    "error_codes": dict(samples.error_codes),
+                }
+        return {
+            "labels": self.labels,
+            "started": self.started,
+            "finished": time.time(),
+            "operations": operations,
+            "consistency_waits": [
+                {"name": result.name, "seconds": result.elapsed, "probes": result.probes,
+                 "converged": result.converged, "disagreement": result.disagreement}
+                for result in convergence_results()
+            ],
+            "tests": self.tests,
+        }
+
+    def openmetrics(self, data):
+        """
+        Render the collected metrics in the OpenMetrics text format
+        """
+        labels = self.labels
+        lines = []
+
+        name = f"{METRIC_PREFIX}_request_duration_seconds"
+        lines += [f"# TYPE {name} histogram", f"# UNIT {name} seconds",
+                  f"# HELP {name} Latency of S3 requests by operation."]
+        for operation, stats in data["operations"].items():
+            for bound, count in stats["histogram"]:
+                lines.append(f"{name}_bucket{_labels(**labels, operation=operation, le=_bound(bound))} {count}")
+            lines.append(f"{name}_count{_labels(**labels, operation=operation)} {stats['count']}")
+            lines.append(f"{name}_sum{_labels(**labels, operation=operation)} {stats['latency_sum']}")
+
+        name = f"{METRIC_PREFIX}_request_errors"
+        lines += [f"# TYPE {name} counter", f"# HELP {name} S3 requests that failed, by error code."]
+        for operation, stats in data["operations"].items():
+            for code, count in sorted(stats["error_codes"].items()):
+                lines.append(f"{name}_total{_labels(**labels, operation=operation, code=code)} {count}")
+
+        name = f"{METRIC_PREFIX}_consistency_wait_seconds"
+        lines += [f"# TYPE {name} histogram", f"# UNIT {name} seconds",
+                  f"# HELP {name} Time until eventually consistent state was observed, by helper."]
+        waits = {}
+        for wait in data["consistency_waits"]:
+            waits.setdefault(wait["name"], []).append(wait["seconds"])
+        for helper, seconds in sorted(waits.items()):
+            for bound in list(LATENCY_BUCKETS) + [float("inf")]:
+                count = sum(1 for value in seconds if value <= bound)
+                lines.append(f"{name}_bucket{_labels(**labels, helper=helper, le=_bound(bound))} {count}")
+            lines.append(f"{name}_count{_labels(**labels, helper=helper)} {len(seconds)}")
+            lines.append(f"{name}_sum{_labels(**labels, helper=helper)} {sum(seconds)}")
+
+        name = f"{METRIC_PREFIX}_test_duration_seconds"
+        lines += [f"# TYPE {name} gauge", f"# UNIT {name} seconds",
+                  f"# HELP {name} Duration of each test (setup, call and teardown)."]
+        for nodeid, test in sorted(data["tests"].items()):
+            lines.append(f"{name}{_labels(**labels, test=nodeid, outcome=test['outcome'])} {test['duration']}")
+
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
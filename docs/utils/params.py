@@ -0,0 +1,189 @@
+import dataclasses
+from collections.abc import Mapping
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Optional, Tuple
+import yaml
+from utils.waiters import DEFAULT_WAITER_CONFIG, WAITERS
+
+# ## Test params
+#
+# The params yaml (--config) is read once per session into immutable records, validated when the
+# session starts, so a malformed profile fails the run right away instead of the tests that use it.
+# Records keep the dict-like interface of the parsed yaml (profile["region_name"],
+# profile.get("lock_mode"), "profile_name" in profile) for the fixtures and helpers that read them
+# as dicts, and expose the same settings as attributes.
+
+LOCK_MODES = ("GOVERNANCE", "COMPLIANCE")
+RETRY_MODES = ("legacy", "standard", "adaptive")
+DEFAULT_LOCK_MODE = "COMPLIANCE"
+
+
+def freeze(value):
+    """
+    Read-only copy of a parsed yaml value: dicts become mapping proxies and lists become tuples
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class _Record(Mapping):
+    """
+    Mapping over the fields of a dataclass that were set in the yaml
+    """
+
+    def __getitem__(self, key):
+        if key not in self._set_fields():
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self._set_fields())
+
+    def __len__(self):
+        return len(self._set_fields())
+
+    def _set_fields(self):
+        return [field.name for field in dataclasses.fields(self) if getattr(self, field.name) is not None]
+
+
+def _check_type(where, name, value, expected, type_name):
+    if value is not None and (not isinstance(value, expected) or isinstance(value, bool) and bool not in expected):
+        raise ValueError(f"{where}: {name} must be {type_name}, got {value!r}")
+
+
+@dataclass(frozen=True)
+class Profile(_Record):
+    """
+    Credentials and settings of one account, from the profiles of the params yaml
+    """
+    profile_name: Optional[str] = None
+    region_name: Optional[str] = None
+    endpoint_url: Optional[str] = None
+    aws_access_key_id: Optional[str] = None
+    aws_secret_access_key: Optional[str] = None
+    lock_mode: Optional[str] = None
+    mgc_path: Optional[str] = None
+    max_pool_connections: Optional[int] = None
+    retry_mode: Optional[str] = None
+    max_attempts: Optional[int] = None
+    waiters: Optional[Mapping] = None
+
+    @classmethod
+    def from_dict(cls, record, where="profile"):
+        """
+        :param record: dict: profile record of the params yaml
+        :param where: str: position of the record, for the error messages
+        :raises ValueError: on unknown or missing settings and values of the wrong type
+        """
+        if not isinstance(record, dict):
+            raise ValueError(f"{where}: expected a mapping of settings, got {record!r}")
+        known = {field.name for field in dataclasses.fields(cls)}
+        unknown = set(record) - known
+        if unknown:
+            raise ValueError(f"{where}: unknown settings {sorted(unknown)}, expected some of {sorted(known)}")
+        for name in ("profile_name", "region_name", "endpoint_url", "aws_access_key_id",
+                     "aws_secret_access_key", "lock_mode", "mgc_path", "retry_mode"):
+            _check_type(where, name, record.get(name), (str,), "a string")
+        for name in ("max_pool_connections", "max_attempts"):
+            _check_type(where, name, record.get(name), (int,), "an integer")
+            if record.get(name) is not None and record[name] < 1:
+                raise ValueError(f"{where}: {name} must be positive, got {record[name]}")
+        if not record.get("profile_name"):
+            missing = [name for name in ("region_name", "aws_access_key_id", "aws_secret_access_key") if not record.get(name)]
+            if missing:
+                raise ValueError(f"{where}: needs a profile_name, or explicit credentials (missing {missing})")
+        if record.get("lock_mode") is not None and record["lock_mode"] not in LOCK_MODES:
+            raise ValueError(f"{where}: lock_mode must be one of {LOCK_MODES}, got {record['lock_mode']!r}")
+        if record.get("retry_mode") is not None and record["retry_mode"] not in RETRY_MODES:
+            raise ValueError(f"{where}: retry_mode must be one of {RETRY_MODES}, got {record['retry_mode']!r}")
+        waiters = record.get("waiters")
+        if waiters is not None:
+            if not isinstance(waiters, dict):
+                raise ValueError(f"{where}: waiters must be a mapping, got {waiters!r}")
+            unknown = set(waiters) - set(DEFAULT_WAITER_CONFIG)
+            if unknown:
+                raise ValueError(f"{where}: unknown waiter settings {sorted(unknown)}, expected some of {sorted(DEFAULT_WAITER_CONFIG)}")
+            for name in ("initial_delay", "delay", "backoff", "max_delay"):
+                _check_type(where, f"waiters.{name}", waiters.get(name), (int, float), "a number")
+                if waiters.get(name) is not None and waiters[name] < 0:
+                    raise ValueError(f"{where}: waiters.{name} must not be negative, got {waiters[name]}")
+            _check_type(where, "waiters.max_attempts", waiters.get("max_attempts"), (int,), "an integer")
+            if waiters.get("max_attempts") is not None and waiters["max_attempts"] < 1:
+                raise ValueError(f"{where}: waiters.max_attempts must be positive, got {waiters['max_attempts']}")
+            skip = waiters.get("skip")
+            if skip is not None and (not isinstance(skip, list) or not all(isinstance(name, str) for name in skip)):
+                raise ValueError(f"{where}: waiters.skip must be a list of waiter names, got {skip!r}")
+            unknown = set(skip or ()) - set(WAITERS)
+            if unknown:
+                raise ValueError(f"{where}: unknown waiters to skip {sorted(unknown)}, expected some of {sorted(WAITERS)}")
+        return cls(**{name: freeze(value) for name, value in record.items()})
+
+    @property
+    def name(self):
+        """
+        Label of the profile: its name, or the region of explicit credentials
+        """
+        return self.profile_name or self.region_name
+
+    @property
+    def effective_lock_mode(self):
+        return self.lock_mode or DEFAULT_LOCK_MODE
+
+
+@dataclass(frozen=True)
+class TestParams(_Record):
+    """
+    Parsed and validated params yaml
+    """
+    profiles: Tuple[Profile, ...]
+    default_profile_index: int = 0
+    docs_dir: Optional[str] = None
+    local_s3: Optional[Mapping] = None
+
+    # not a test class, despite the name
+    __test__ = False
+
+    @classmethod
+    def from_dict(cls, params):
+        """
+        :param params: dict: parsed params yaml
+        :raises ValueError: on unknown or missing settings, malformed profiles or an out of range default profile
+        """
+        if not isinstance(params, dict):
+            raise ValueError(f"expected a mapping with a list of profiles, got {params!r}")
+        known = {field.name for field in dataclasses.fields(cls)}
+        unknown = set(params) - known
+        if unknown:
+            raise ValueError(f"unknown settings {sorted(unknown)}, expected some of {sorted(known)}")
+        records = params.get("profiles")
+        if not isinstance(records, list) or not records:
+            raise ValueError("profiles must be a non-empty list")
+        profiles = tuple(Profile.from_dict(record, f"profiles[{index}]") for index, record in enumerate(records))
+        index = params.get("default_profile_index")
+        index = 0 if index is None else index
+        _check_type("params", "default_profile_index", index, (int,), "an integer")
+        if not 0 <= index < len(profiles):
+            raise ValueError(f"default_profile_index {index} is out of the {len(profiles)} profiles")
+        _check_type("params", "docs_dir", params.get("docs_dir"), (str,), "a string")
+        local_s3 = params.get("local_s3")
+        if local_s3 is not None and not isinstance(local_s3, dict):
+            raise ValueError(f"local_s3 must be a mapping, got {local_s3!r}")
+        return cls(
+            profiles=profiles,
+            default_profile_index=index,
+            docs_dir=params.get("docs_dir"),
+            local_s3=freeze(local_s3),
+        )
+
+    @classmethod
+    def from_yaml(cls, path):
+        with open(path, "r") as f:
+            return cls.from_dict(yaml.safe_load(f))
+
+    @property
+    def default_profile(self):
+        return self.profiles[self.default_profile_index]
@@ -0,0 +1,111 @@
+import logging
+import threading
+
+# ## Reusable fixtures
+#
+# Parametrized specs build the same expensive fixture for every case, e.g. the ACL matrix
+# creates one versioned bucket (and waits for its versioning to be consistent) for each of its
+# 7 ACLs x 6 methods. Cases that only differ by a cheap parameter can share one instance, as long
+# as it is reset between them. A spec declares which parameters make cases share fixtures with
+# the reuse_fixtures marker:
+#
+#     @pytest.mark.reuse_fixtures("acl_name")
+#
+# and a ResettableFixture keeps one instance per value of those parameters, set up by the first
+# case and reset before each of the following ones. Cases without the marker get an instance of
+# their own, torn down after them. The shared instances are torn down with the ResettableFixture,
+# usually at the end of the module. Cases sharing an instance should run in the same xdist worker,
+# mark them with the same xdist_group and run with `--dist loadgroup`.
+
+REUSE_MARKER = "reuse_fixtures"
+
+
+def reuse_key(item):
+    """
+    Values of the parameters named by the reuse_fixtures marker of a test
+    :param item: pytest.Item
+    :return: tuple of (name, value) shared by the tests that may reuse fixtures, None if the test has no marker
+    """
+    marker = item.get_closest_marker(REUSE_MARKER)
+    callspec = getattr(item, "callspec", None)
+    if not marker or not callspec:
+        return None
+    return tuple((name, repr(callspec.params[name])) for name in marker.args)
+
+
+def group_by_reuse_key(items):
+    """
+    Order the tests so the ones with the same reuse key run one after the other, each group where
+    its first test was, and the other tests keep their places
+    :param items: list of pytest.Item
+    :return: list of pytest.Item
+    """
+    groups = {}
+    for index, item in enumerate(items):
+        key = reuse_key(item)
+        group = (item.nodeid.split("::")[0], key) if key is not None else index
+        groups.setdefault(group, []).append(item)
+    return [item for group in groups.values() for item in group]
+
+
+class ResettableFixture:
+    """
+    Fixture instances shared by the tests with the same reuse key, reset between them
+    """
+
+    def __init__(self, name, setup, reset, teardown):
+        """
+        :param name: str: label for logs and the summary
+        :param setup: callable: returns a new instance
+        :param reset: callable: receives an instance used by a previous test and restores its initial state
+        :param teardown: callable: receives an instance and releases it
+        """
+        self.name = name
+        self._setup = setup
+        self._reset = reset
+        self._teardown = teardown
+        self._lock = threading.Lock()
+        self._instances = {}
+        self.setups = 0
+        self.reuses = 0
+
+    def acquire(self, key):
+        """
+        :param key: tuple: reuse key of the test (see reuse_key), None for an instance of its own
+        :return: the instance for the test, set up or reset
+        """
+        with self._lock:
+            instance = self._instances.get(key) if key is not None else None
+            if instance is None:
+                self.setups += 1
+            else:
+                self.reuses += 1
+        if instance is None:
+            instance = self._setup()
+            if key is not None:
+                with self._lock:
+                    self._instances[key] = instance
+            return instance
+        logging.info(f"[{self.name}] reusing the instance of {key}")
+        self._reset(instance)
+        return instance
+
+    def release(self, key, instance):
+        """
+        Give back an instance after a test, only the ones of their own are torn down right away
+        """
+        if key is None:
+            self._teardown(instance)
+
+    def close(self):
+        with self._lock:
+            instances, self._instances = list(self._instances.values()), {}
+        for instance in instances:
+            try:
+                self._teardown(instance)
+            except Exception as e:
+                logging.warning(f"[{self.name}] teardown error {e}")
+        logging.info(f"[shared_fixtures] {self.summary()}")
+
+    def summary(self):
+        return f"{self.name} setups={self.setups} reuses={self.reuses}"
@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from utils.consistency import backoff_delay
+
+# ## Deferred teardown
+#
+# Fixture teardowns delete objects and buckets and then wait for the deletion to be visible, which
+# takes seconds that the next test spends waiting. With a DeferredTeardown the fixtures hand their
+# teardown steps to background threads and return right away. Failed steps are retried with
+# backoff, and the session drains the queue at its end and reports what could not be cleaned up.
+
+
+class DeferredTeardown:
+    """
+    Runs teardown steps on background threads until drained
+    """
+
+    def __init__(self, workers=8, max_attempts=5, base_delay=1, max_delay=30):
+        """
+        :param workers: int: number of teardowns running at once
+        :param max_attempts: int: attempts of each step before the teardown is reported as failed
+        :param base_delay: float: first backoff sleep in seconds after a failed step
+        :param max_delay: float: maximum backoff sleep in seconds
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="deferred-teardown")
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.done = 0
+        self.retries = 0
+        self.outstanding = 0
+        self.failures = []
+        self.background_seconds = 0.0
+        self.drain_seconds = 0.0
+
+    def submit(self, description, *steps):
+        """
+        Queue a teardown
+        :param description: str: what is torn down, used in logs and in the report
+        :param steps: callables without arguments run in order, a failed step is retried without
+                      running the previous ones again
+        """
+        with self._lock:
+            self.submitted += 1
+            self.outstanding += 1
+        self._executor.submit(self._run, description, steps)
+
+    def _run(self, description, steps):
+        start = time.monotonic()
+        try:
+            for step in steps:
+                for attempt in range(1, self.max_attempts + 1):
+                    try:
+                        step()
+                        break
+                    except Exception as e:
+                        if attempt == self.max_attempts:
+                            raise
+                        logging.info(f"[deferred_teardown] {description} attempt {attempt} failed: {e}")
+                        with self._lock:
+                            self.retries += 1
+                        time.sleep(backoff_delay(attempt, self.base_delay, self.max_delay))
+            with self._lock:
+                self.done += 1
+        except Exception as e:
+            logging.error(f"[deferred_teardown] {description} failed: {e}")
+            with self._lock:
+                self.failures.append((description, repr(e)))
+        finally:
+            with self._lock:
+                self.outstanding -= 1
+                self.background_seconds += time.monotonic() - start
+
+    def drain(self):
+        """
+        Wait for every queued teardown to finish
+        :return: list of (description, error) of the teardowns that failed
+        """
+        start = time.monotonic()
+        logging.info(f"[deferred_teardown] draining {self.outstanding} outstanding teardowns")
+        self._executor.shutdown(wait=True)
+        self.drain_seconds = time.monotonic() - start
+        return self.failures
+
+    def summary(self):
+        return (
+            f"deferred teardowns submitted={self.submitted} done={self.done} failed={len(self.failures)} "
+            f"retries={self.retries} background time={self.background_seconds:.2f}s "
+            f"drain wait={self.drain_seconds:.2f}s"
+        )
+
+
+def defer_or_run(deferred_teardown, description, *steps):
+    """
+    Hand teardown steps to a DeferredTeardown, or run them right away when there is none
+    :param deferred_teardown: DeferredTeardown or None
+    :param description: str: what is torn down
+    :param steps: callables without arguments run in order
+    """
+    if deferred_teardown:
+        deferred_teardown.submit(description, *steps)
+        return
+    for step in steps:
+        step()
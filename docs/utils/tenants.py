@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from utils.clients import frozen_credentials
+
+# ## Tenant cache
+#
+# Bucket policies name their principals by tenant (the owner ID of the account), which S3 only
+# tells in the Owner of a ListBuckets response. Listing the buckets of an account with thousands
+# of them for every parametrized policy case returns a large document each time, for an ID that
+# never changes. The cache below resolves the tenant of each client once, keeps it in memory for
+# the session and in a SQLite file for the next ones (and for the other xdist workers), until the
+# TTL expires. Entries are keyed by a hash of the endpoint, region and access key of the client,
+# the keys themselves are not stored.
+
+DEFAULT_TTL = 24 * 60 * 60
+
+
+def credentials_key(s3_client):
+    """
+    :param s3_client: boto3 s3 client
+    :return: str: hash identifying the account and endpoint of the client
+    """
+    identity = f"{s3_client.meta.endpoint_url}|{s3_client.meta.region_name}|{frozen_credentials(s3_client).access_key}"
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+def list_owner_id(s3_client):
+    """
+    Owner ID of the account of a client, listing at most one of its buckets
+    :param s3_client: boto3 s3 client
+    :return: str
+    """
+    return s3_client.list_buckets(MaxBuckets=1)["Owner"]["ID"]
+
+
+class TenantCache:
+    """
+    Owner IDs of the clients' accounts, in memory and in a SQLite file shared by runs and xdist workers
+    """
+
+    def __init__(self, db_path=None, ttl=DEFAULT_TTL):
+        """
+        :param db_path: str: SQLite file of the cache, None to keep the tenants in memory only
+        :param ttl: float: seconds a tenant read from the file is trusted
+        """
+        self.db_path = db_path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._tenants = {}
+        self.hits = 0
+        self.misses = 0
+        if db_path:
+            with closing(self._connect()) as connection, connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS tenants (key TEXT PRIMARY KEY, tenant TEXT, resolved REAL)"
+                )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _load(self, key):
+        if not self.db_path:
+            return None
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                "SELECT tenant FROM tenants WHERE key = ? AND resolved > ?", (key, time.time() - self.ttl)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _store(self, key, tenant):
+        if not self.db_path:
+            return
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO tenants (key, tenant, resolved) VALUES (?, ?, ?)", (key, tenant, time.time())
+            )
+
+    def tenant_of(self, s3_client):
+        """
+        :param s3_client: boto3 s3 client
+        :return: str: owner ID of the client's account
+        """
+        key = credentials_key(s3_client)
+        with self._lock:
+            tenant = self._tenants.get(key)
+        if tenant is None:
+            tenant = self._load(key)
+        if tenant is None:
+            tenant = list_owner_id(s3_client)
+            self._store(key, tenant)
+            logging.info(f"[tenants] resolved tenant {tenant} of {s3_client.meta.endpoint_url}")
+            with self._lock:
+                self.misses += 1
+        else:
+            with self._lock:
+                self.hits += 1
+        with self._lock:
+            self._tenants[key] = tenant
+        return tenant
+
+    def summary(self):
+        return f"tenant cache resolved={self.misses} reused={self.hits} ttl={self.ttl:.0f}s"
@@ -0,0 +1,146 @@
+import logging
+from utils.durations import marker_estimate
+
+# ## Time budget
+#
+# Regional health checks must end within a fixed window, while the duration of a run depends on
+# which tests `-m` selected. With a time budget, the tests are chosen from their estimated
+# durations (the duration history of the config file, or else their rapid, regular or slow
+# marker) so that the estimated work fits the budget times the number of xdist workers:
+#
+# 1. coverage: every feature marker among the collected tests gets at least one test, picking
+#    the tests that cover the most markers per estimated second (these are kept even when they
+#    alone exceed the budget, a health check without some feature would not check it)
+# 2. breadth: the remaining budget is spent round-robin over the specs, taking the cheapest
+#    pending test of each spec per round, so most specs are exercised before any spec runs in full
+#
+# The chosen tests are then ordered by spec and by the parameters of their module and class
+# scoped fixtures, so each of those fixtures is set up once for all the tests that share it.
+# xdist's default load scheduling hands tests to any worker and loses that order, run with
+# `--dist loadscope` (or loadgroup) to keep the tests of a module on one worker.
+
+FEATURE_MARKERS = ("acl", "locking", "policy", "cold_storage", "presign", "bucket_versioning")
+
+
+def feature_markers(item):
+    """
+    :param item: pytest.Item
+    :return: set of the feature markers of the test
+    """
+    return {marker for marker in FEATURE_MARKERS if item.get_closest_marker(marker)}
+
+
+def shared_fixture_key(item):
+    """
+    Fixtures of a test that outlive it: names and parameter indexes of its non-function scoped
+    fixtures (session ones excepted, every test shares them)
+    :param item: pytest.Item
+    :return: tuple, equal for tests that can share those fixtures
+    """
+    fixture_info = getattr(item, "_fixtureinfo", None)
+    if fixture_info is None:
+        return ()
+    callspec = getattr(item, "callspec", None)
+    key = []
+    for name in sorted(fixture_info.name2fixturedefs):
+        scope = fixture_info.name2fixturedefs[name][-1].scope
+        if scope in ("function", "session"):
+            continue
+        key.append((name, callspec.indices.get(name, -1) if callspec else -1))
+    return tuple(key)
+
+
+class TimeBudget:
+    """
+    Selection of the tests that fit a time budget, covering every feature marker
+    """
+
+    def __init__(self, budget, workers=1):
+        """
+        :param budget: float: seconds the run may take
+        :param workers: int: number of xdist workers sharing the work
+        """
+        self.budget = budget
+        self.workers = max(1, workers)
+        self.collected = 0
+        self.selected = []
+        self.estimated_seconds = 0.0
+        self.with_history = 0
+        self.covered = set()
+
+    @property
+    def capacity(self):
+        return self.budget * self.workers
+
+    def select(self, items, durations=None):
+        """
+        Choose the tests to run and order them to share fixtures
+        :param items: list of pytest.Item, in collection order
+        :param durations: dict: node id to the recorded seconds of the test (from DurationHistory)
+        :return: (selected, deselected) lists of pytest.Item
+        """
+        durations = durations or {}
+        position = {item.nodeid: index for index, item in enumerate(items)}
+        estimate = {item.nodeid: durations.get(item.nodeid, marker_estimate(item)) for item in items}
+        self.collected = len(items)
+        self.with_history = sum(1 for item in items if item.nodeid in durations)
+
+        chosen = set()
+        spent = 0.0
+
+        # coverage of the feature markers, most markers per second first
+        uncovered = set().union(*(feature_markers(item) for item in items)) if items else set()
+        while uncovered:
+            best = max(
+                (item for item in items if item.nodeid not in chosen and feature_markers(item) & uncovered),
+                key=lambda item: (len(feature_markers(item) & uncovered) / max(estimate[item.nodeid], 0.1),
+                                  -position[item.nodeid]),
+            )
+            chosen.add(best.nodeid)
+            spent += estimate[best.nodeid]
+            uncovered -= feature_markers(best)
+            self.covered |= feature_markers(best)
+
+        # breadth over the specs with what is left, cheapest pending test of each spec per round
+        by_spec = {}
+        for item in items:
+            if item.nodeid not in chosen:
+                by_spec.setdefault(item.nodeid.split("::")[0], []).append(item)
+        for spec_items in by_spec.values():
+            spec_items.sort(key=lambda item: (estimate[item.nodeid], position[item.nodeid]))
+        while by_spec:
+            for spec in list(by_spec):
+                spec_items = by_spec[spec]
+                if spec_items and spent + estimate[spec_items[0].nodeid] > self.capacity:
+                    # sorted by estimate, nothing after it fits either
+                    spec_items.clear()
+                if not spec_items:
+                    del by_spec[spec]
+                    continue
+                item = spec_items.pop(0)
+                chosen.add(item.nodeid)
+                spent += estimate[item.nodeid]
+
+        spec_rank = {}
+        for item in items:
+            spec_rank.setdefault(item.nodeid.split("::")[0], len(spec_rank))
+        self.selected = sorted(
+            (item for item in items if item.nodeid in chosen),
+            key=lambda item: (spec_rank[item.nodeid.split("::")[0]], shared_fixture_key(item), position[item.nodeid]),
+        )
+        self.estimated_seconds = spent
+        if spent > self.capacity:
+            logging.warning(
+                f"[time_budget] covering the feature markers takes an estimated {spent:.0f}s, "
+                f"over the budget of {self.budget:.0f}s x {self.workers} workers"
+            )
+        return self.selected, [item for item in items if item.nodeid not in chosen]
+
+    def summary(self):
+        missing = sorted(set(FEATURE_MARKERS) - self.covered)
+        return (
+            f"time budget {self.budget:.0f}s x {self.workers} workers: selected {len(self.selected)} of "
+            f"{self.collected} tests ({self.with_history} with history), estimated work {self.estimated_seconds:.0f}s, "
+            f"markers covered: {', '.join(sorted(self.covered)) or 'none'}"
+            + (f", not collected: {', '.join(missing)}" if missing else "")
+        )
@@ -0,0 +1,100 @@
+import logging
+import time
+from botocore.exceptions import ClientError, WaiterError
+from utils.clients import client_profile
+from utils.consistency import ConvergenceResult, poll_delay, record_convergence
+
+# ## Waiters
+#
+# botocore waiters poll every 5 seconds, starting with a sleep when the first check fails, so a
+# bucket or object that is visible a few milliseconds after being created still costs 5 seconds.
+# The waiters below make the same checks (HeadBucket and HeadObject) with a configurable curve:
+# an optional initial delay, then sleeps growing from delay by a backoff factor up to max_delay.
+# Profiles set the curve with a "waiters" record in the params yaml, and may list the waiters to
+# skip because the backend is strongly consistent for that operation. Every wait is recorded in
+# the convergence history, so it shows in the consistency waits of the run metrics.
+
+DEFAULT_WAITER_CONFIG = {
+    "initial_delay": 0,
+    "delay": 0.2,
+    "backoff": 2,
+    "max_delay": 5,
+    "max_attempts": 20,
+    "skip": [],
+}
+
+NOT_FOUND_CODES = ("404", "NoSuchBucket", "NoSuchKey", "NotFound")
+
+
+def _head_bucket(s3_client, Bucket):
+    try:
+        s3_client.head_bucket(Bucket=Bucket)
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] in NOT_FOUND_CODES:
+            return False
+        # like the botocore waiter, a bucket in another region (301) or of another owner (403) exists
+        if e.response["Error"]["Code"] in ("301", "403", "PermanentRedirect", "AccessDenied"):
+            return True
+        raise
+
+
+def _head_object(s3_client, Bucket, Key):
+    try:
+        s3_client.head_object(Bucket=Bucket, Key=Key)
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] in NOT_FOUND_CODES:
+            return False
+        raise
+
+
+# waiter name to (check returning whether the resource exists, expected result)
+WAITERS = {
+    "bucket_exists": (_head_bucket, True),
+    "bucket_not_exists": (_head_bucket, False),
+    "object_exists": (_head_object, True),
+    "object_not_exists": (_head_object, False),
+}
+
+
+def waiter_config(s3_client):
+    """
+    Waiter settings of the profile a client was built from, with defaults for the missing ones
+    :param s3_client: boto3 s3 client
+    :return: dict: initial_delay, delay, backoff, max_delay, max_attempts and skip
+    """
+    profile = client_profile(s3_client) or {}
+    return {**DEFAULT_WAITER_CONFIG, **profile.get("waiters", {})}
+
+
+def wait(s3_client, waiter_name, **kwargs):
+    """
+    Wait until a bucket or object exists, or not, with the waiter settings of the client's profile
+    :param s3_client: boto3 s3 client
+    :param waiter_name: str: bucket_exists, bucket_not_exists, object_exists or object_not_exists
+    :param kwargs: Bucket and, for object waiters, Key
+    :raises WaiterError: when max_attempts checks did not reach the expected state
+    """
+    config = waiter_config(s3_client)
+    name = f"waiter_{waiter_name}"
+    if waiter_name in config["skip"]:
+        logging.info(f"[{name}] skipped, the profile is strongly consistent for it")
+        return
+
+    check, expected = WAITERS[waiter_name]
+    start = time.monotonic()
+    poll_delay(config["initial_delay"])
+    for attempt in range(1, config["max_attempts"] + 1):
+        if check(s3_client, **kwargs) == expected:
+            record_convergence(ConvergenceResult(name, expected, True, time.monotonic() - start, attempt, attempt - 1))
+            return
+        if attempt < config["max_attempts"]:
+            poll_delay(min(config["max_delay"], config["delay"] * config["backoff"] ** (attempt - 1)))
+
+    record_convergence(ConvergenceResult(name, not expected, False, time.monotonic() - start, attempt, attempt))
+    raise WaiterError(
+        name=waiter_name,
+        reason=f"Max attempts exceeded ({config['max_attempts']})",
+        last_response={"Waiter": waiter_name, **kwargs},
+    )
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Unit tests of the helpers under docs/utils, run with `uv run pytest tests` from the repository
+# root. They need no endpoint and no params file: S3 calls go to in-memory fakes or botocore
+# Stubbers. The specs themselves live in docs/ and run against a region (see the README).
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "docs")
+if DOCS_DIR not in sys.path:
+    sys.path.insert(0, DOCS_DIR)
+
+pytest_plugins = ["pytester"]
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import pytest
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from botocore.credentials import Credentials
+from utils.async_engine import (
+    AsyncS3Engine,
+    _run_coroutine,
+    _run_windowed,
+    download_objects_async,
+    upload_objects_async,
+)
+from utils.clients import ClientRegistry
+
+
+class BucketHandler(BaseHTTPRequestHandler):
+    """
+    One bucket in memory: keys starting with "chunked" are sent chunked, "flaky" answers 503 once
+    and listings come in pages of 2 keys
+    """
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", chunked=False):
+        self.send_response(status)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for start in range(0, len(body), 3):
+                piece = body[start:start + 3]
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    def do_PUT(self):
+        key = urlsplit(self.path).path.split("/", 2)[2]
+        self.server.objects[key] = self.rfile.read(int(self.headers["Content-Length"]))
+        self._send(200)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        key = parts.path.split("/", 2)[2] if parts.path.count("/") > 1 else None
+        if key is None:
+            return self._list(parse_qs(parts.query))
+        if key == "flaky" and "flaky" not in self.server.failed:
+            self.server.failed.add("flaky")
+            return self._send(503, b"<Error><Code>SlowDown</Code></Error>")
+        self._send(200, self.server.objects[key], chunked=key.startswith("chunked"))
+
+    def _list(self, query):
+        keys = sorted(self.server.objects)
+        start = int(query.get("continuation-token", ["0"])[0])
+        page = keys[start:start + 2]
+        truncated = start + 2 < len(keys)
+        body = "<ListBucketResult>" + "".join(f"<Contents><Key>{key}</Key></Contents>" for key in page)
+        body += f"<IsTruncated>{str(truncated).lower()}</IsTruncated>"
+        if truncated:
+            body += f"<NextContinuationToken>{start + 2}</NextContinuationToken>"
+        self._send(200, (body + "</ListBucketResult>").encode())
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BucketHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.objects = {}
+    server.failed = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def engine_for(server, **kwargs):
+    return AsyncS3Engine(f"http://127.0.0.1:{server.server_address[1]}", "br-se1", Credentials("key", "secret"), **kwargs)
+
+
+def test_requests_reuse_keep_alive_connections(server):
+    async def run():
+        engine = engine_for(server, max_connections=2)
+        try:
+            for index in range(10):
+                assert (await engine.put_object("bucket", f"key-{index}", b"body")).status == 200
+            response = await engine.get_object("bucket", "key-3")
+            return engine.stats, response
+        finally:
+            await engine.close()
+
+    stats, response = asyncio.run(run())
+
+    assert response.body == b"body"
+    assert stats.requests == 11
+    assert stats.connections_opened == server.connections == 1
+
+
+def test_server_errors_are_retried_and_chunked_bodies_read(server):
+    server.objects.update({"flaky": b"eventually", "chunked-object": b"0123456789"})
+
+    async def run():
+        engine = engine_for(server)
+        try:
+            return await engine.get_object("bucket", "flaky"), await engine.get_object("bucket", "chunked-object"), engine.stats
+        finally:
+            await engine.close()
+
+    flaky, chunked, stats = asyncio.run(run())
+
+    assert (flaky.status, flaky.body) == (200, b"eventually")
+    assert chunked.body == b"0123456789"
+    assert stats.retries == 1
+    assert stats.statuses == {503: 1, 200: 2}
+
+
+def test_listing_follows_continuation_tokens(server):
+    server.objects.update({f"key-{index}": b"" for index in range(5)})
+
+    async def run():
+        engine = engine_for(server)
+        try:
+            return [key async for key in engine.iter_keys("bucket")], engine.stats.requests
+        finally:
+            await engine.close()
+
+    keys, requests = asyncio.run(run())
+
+    assert keys == [f"key-{index}" for index in range(5)]
+    assert requests == 3
+
+
+def test_windowed_requests_stay_within_the_window():
+    in_flight = peak = 0
+
+    async def request(index):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001 * (index % 3))
+        in_flight -= 1
+        if index == 7:
+            raise ConnectionError("reset")
+        return SimpleNamespace(status=200)
+
+    statuses = asyncio.run(_run_windowed((request(index) for index in range(40)), window=5))
+
+    assert sorted(statuses) == [0] + [200] * 39
+    assert peak <= 5
+
+
+def test_coroutines_run_under_a_running_loop():
+    async def answer():
+        return 42
+
+    async def caller():
+        # as from a notebook kernel, where asyncio.run refuses to nest loops
+        return _run_coroutine(answer())
+
+    assert _run_coroutine(answer()) == 42
+    assert asyncio.run(caller()) == 42
+
+
+def test_requests_in_flight_share_a_bounded_number_of_connections(server):
+    s3_client = ClientRegistry().client_for({
+        "region_name": "br-se1", "endpoint_url": f"http://127.0.0.1:{server.server_address[1]}",
+        "aws_access_key_id": "key", "aws_secret_access_key": "secret",
+    })
+    objects = [{"key": f"key-{index}", "path": "body"} for index in range(40)]
+
+    assert upload_objects_async(s3_client, "bucket", objects, max_in_flight=40, max_connections=3) == 40
+    assert server.connections <= 3
+    assert download_objects_async(s3_client, "bucket", max_in_flight=40, max_connections=3) == 40
+    assert server.connections <= 6
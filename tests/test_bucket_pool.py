@@ -0,0 +1,220 @@
+import itertools
+import sqlite3
+import threading
+import time
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from utils import bucket_pool
+from utils.bucket_pool import LOCK, VERSIONED, BucketPool, SharedBucketPool
+
+
+class Recording:
+    """
+    Pool whose buckets are names only: preparations, resets and teardowns are recorded, not sent
+    """
+
+    def __init__(self, *args, failing=(), stale=(), **kwargs):
+        self.preparations = itertools.count()
+        self.failing = set(failing)
+        self.stale = set(stale)
+        self.torn_down = []
+        self._record_lock = threading.Lock()
+        super().__init__(None, "GOVERNANCE", *args, **kwargs)
+
+    def prepare(self, kind, bucket_name=None):
+        with self._record_lock:
+            index = next(self.preparations)
+        if index in self.failing:
+            raise ConnectionError(f"preparation {index} reset")
+        bucket_name = bucket_name or f"{kind}-{index}"
+        with self._lock:
+            self.prepared += 1
+            self._kinds[bucket_name] = kind
+        return bucket_name
+
+    def reset(self, bucket_name, kind):
+        return bucket_name not in self.stale
+
+    def _teardown(self, bucket_name):
+        with self._record_lock:
+            self.torn_down.append(bucket_name)
+        return True
+
+
+class RecordingPool(Recording, BucketPool):
+    pass
+
+
+class RecordingSharedPool(Recording, SharedBucketPool):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def cleanups(monkeypatch):
+    calls = []
+    monkeypatch.setattr(bucket_pool, "cleanup_old_buckets", lambda s3_client, base_name: calls.append(base_name))
+    return calls
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def states(db_path):
+    db = sqlite3.connect(db_path)
+    try:
+        return dict(db.execute("SELECT name, state FROM buckets"))
+    finally:
+        db.close()
+
+
+def test_each_test_gets_a_bucket_of_its_own():
+    pool = RecordingPool({VERSIONED: 4, LOCK: 1}, spares=2, workers=2)
+
+    buckets = [pool.acquire(VERSIONED) for _ in range(4)] + [pool.acquire(LOCK)]
+    for bucket_name in buckets:
+        pool.release(bucket_name)
+    pool.close()
+
+    assert len(set(buckets)) == 5
+    assert [bucket_name.split("-")[0] for bucket_name in buckets] == [VERSIONED] * 4 + [LOCK]
+    assert (pool.prepared, pool.fallbacks, pool.failed) == (5, 0, 0)
+    assert sorted(pool.torn_down) == sorted(buckets)
+
+
+def test_a_released_bucket_is_reset_and_handed_again():
+    pool = RecordingPool({VERSIONED: 1}, spares=1, workers=1)
+
+    first = pool.acquire(VERSIONED)
+    pool.release(first)
+    wait_until(lambda: pool.recycled == 1)
+    second = pool.acquire(VERSIONED)
+    pool.close()
+
+    assert second == first
+    assert (pool.prepared, pool.fallbacks) == (1, 0)
+
+
+def test_a_bucket_that_cannot_be_reset_is_torn_down():
+    pool = RecordingPool({VERSIONED: 1}, spares=1, workers=1, stale={f"{VERSIONED}-0"})
+
+    first = pool.acquire(VERSIONED)
+    pool.release(first)
+    wait_until(lambda: pool.torn_down)
+    second = pool.acquire(VERSIONED)
+    pool.close()
+
+    assert pool.torn_down == [first]
+    assert second != first
+    assert (pool.recycled, pool.fallbacks) == (0, 1)
+
+
+def test_tests_beyond_the_demand_prepare_their_own_bucket():
+    pool = RecordingPool({VERSIONED: 1}, spares=1, workers=1)
+
+    first, second = pool.acquire(VERSIONED), pool.acquire(VERSIONED)
+    pool.close()
+
+    assert first != second
+    assert (pool.prepared, pool.fallbacks) == (2, 1)
+
+
+def test_a_failed_preparation_falls_back_to_the_test():
+    pool = RecordingPool({LOCK: 1}, spares=1, workers=1, failing={0})
+
+    bucket_name = pool.acquire(LOCK)
+    pool.close()
+
+    assert bucket_name == "lock-1"
+    assert (pool.failed, pool.fallbacks) == (1, 1)
+
+
+def test_spare_buckets_are_torn_down_on_close():
+    pool = RecordingPool({VERSIONED: 5}, spares=3, workers=2)
+
+    taken = pool.acquire(VERSIONED)
+    pool.close()
+
+    # every bucket prepared but the one taken was a spare
+    assert pool.prepared >= 3
+    assert sorted(pool.torn_down + [taken]) == sorted(f"{VERSIONED}-{index}" for index in range(pool.prepared))
+    assert f"prepared={pool.prepared}" in pool.summary()
+
+
+def test_workers_never_lease_the_same_bucket(tmp_path):
+    db_path = str(tmp_path / "bucket_pool.sqlite")
+    pools = [RecordingSharedPool({VERSIONED: 8}, db_path=db_path, worker=f"gw{index}", spares=2, poll_interval=0.01)
+             for index in range(2)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        buckets = list(executor.map(lambda index: pools[index % 2].acquire(VERSIONED), range(8)))
+    for pool in pools:
+        pool.close()
+
+    assert len(set(buckets)) == 8
+    assert sum(pool.prepared for pool in pools) == 8
+    assert sum(pool.fallbacks for pool in pools) == 0
+    assert sum(pool.leased for pool in pools) == 8
+    assert set(states(db_path).values()) == {"leased"}
+
+
+def test_a_bucket_released_by_one_worker_is_leased_by_another(tmp_path):
+    db_path = str(tmp_path / "bucket_pool.sqlite")
+    first = RecordingSharedPool({LOCK: 1}, db_path=db_path, worker="gw0", spares=1, poll_interval=0.01)
+    second = RecordingSharedPool({LOCK: 1}, db_path=db_path, worker="gw1", spares=1, poll_interval=0.01)
+
+    bucket_name = first.acquire(LOCK)
+    # the plan of the run is set by the first worker, so there is no bucket left to prepare
+    first.release(bucket_name)
+    wait_until(lambda: states(db_path)[bucket_name] == "ready")
+    leased = second.acquire(LOCK)
+    first.close()
+    second.close()
+
+    assert leased == bucket_name
+    assert (first.recycled, second.leased, second.fallbacks) == (1, 1, 0)
+
+
+def test_the_last_worker_to_finish_tears_down_the_leftovers(tmp_path, cleanups):
+    db_path = str(tmp_path / "bucket_pool.sqlite")
+    # preparation 0 of the first worker fails
+    first = RecordingSharedPool({VERSIONED: 3}, db_path=db_path, worker="gw0", spares=3, poll_interval=0.01, failing={0})
+    second = RecordingSharedPool({VERSIONED: 3}, db_path=db_path, worker="gw1", spares=3, poll_interval=0.01)
+    wait_until(lambda: "preparing" not in states(db_path).values() and len(states(db_path)) == 3)
+
+    leased = second.acquire(VERSIONED)
+    first.close()
+
+    assert first.torn_down == [] and cleanups == []
+
+    second.close()
+
+    final = states(db_path)
+    assert final.pop(leased) == "leased"
+    assert set(final.values()) == {"deleted"}
+    assert sorted(second.torn_down) == sorted(final)
+    assert cleanups == [bucket_pool.POOL_BASE_NAME]
+
+
+def test_a_worker_still_collecting_counts_as_running(tmp_path, cleanups):
+    db_path = str(tmp_path / "bucket_pool.sqlite")
+    run_workers = ["gw0", "gw1"]
+    first = RecordingSharedPool({LOCK: 1}, db_path=db_path, worker="gw0", run_workers=run_workers, spares=1,
+                                poll_interval=0.01)
+    wait_until(lambda: "ready" in states(db_path).values())
+
+    # gw1 has not started yet, the bucket it will lease is kept
+    first.close()
+    assert first.torn_down == [] and cleanups == []
+
+    second = RecordingSharedPool({LOCK: 1}, db_path=db_path, worker="gw1", run_workers=run_workers, spares=1,
+                                 poll_interval=0.01)
+    leased = second.acquire(LOCK)
+    second.release(leased)
+    second.close()
+
+    assert states(db_path) == {leased: "deleted"}
+    assert cleanups == [bucket_pool.POOL_BASE_NAME]
@@ -0,0 +1,140 @@
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+import pytest
+from botocore.stub import Stubber
+from utils.bucket_registry import ACTIVE, DELETED, UNREGISTERED, BucketRegistry
+from utils.clients import ClientRegistry
+
+PROFILE = {"region_name": "br-se1", "endpoint_url": "https://s3.example.com",
+           "aws_access_key_id": "key", "aws_secret_access_key": "secret"}
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return BucketRegistry(str(tmp_path / "buckets.sqlite"), reconcile_interval=60)
+
+
+@pytest.fixture
+def s3_client():
+    # a client built by a ClientRegistry, the account of the buckets comes from its credentials
+    client = ClientRegistry().client_for(PROFILE)
+    with Stubber(client) as stubber:
+        client.stubber = stubber
+        yield client
+
+
+def states(registry):
+    with closing(sqlite3.connect(registry.db_path)) as connection:
+        return dict(connection.execute("SELECT name, state FROM buckets").fetchall())
+
+
+def set_owner(registry, bucket_name, owner):
+    with closing(sqlite3.connect(registry.db_path)) as connection, connection:
+        connection.execute("UPDATE buckets SET owner = ? WHERE name = ?", (owner, bucket_name))
+
+
+def listing(*names, age=timedelta(days=1)):
+    created = datetime.now(timezone.utc) - age
+    return {"Buckets": [{"Name": name, "CreationDate": created} for name in names], "Owner": {"ID": "tenant"}}
+
+
+def test_created_and_deleted_buckets_are_recorded(registry, s3_client):
+    registry.attach(s3_client, lock_mode="GOVERNANCE")
+    s3_client.stubber.add_response("create_bucket", {}, {"Bucket": "test-acl-aaaaaa"})
+    s3_client.stubber.add_response("create_bucket", {}, {"Bucket": "test-acl-bbbbbb"})
+    s3_client.stubber.add_response("delete_bucket", {}, {"Bucket": "test-acl-aaaaaa"})
+    s3_client.stubber.add_client_error("delete_bucket", "NoSuchBucket", http_status_code=404,
+                                       expected_params={"Bucket": "test-acl-bbbbbb"})
+
+    s3_client.create_bucket(Bucket="test-acl-aaaaaa")
+    s3_client.create_bucket(Bucket="test-acl-bbbbbb")
+    s3_client.delete_bucket(Bucket="test-acl-aaaaaa")
+    with pytest.raises(s3_client.exceptions.NoSuchBucket):
+        s3_client.delete_bucket(Bucket="test-acl-bbbbbb")
+
+    assert states(registry) == {"test-acl-aaaaaa": DELETED, "test-acl-bbbbbb": DELETED}
+    assert registry.registered == 2
+
+
+def test_reconcile_adds_missed_buckets_and_drops_the_gone_ones(registry, s3_client):
+    registry.register(s3_client, "test-acl-gone00")
+    with closing(sqlite3.connect(registry.db_path)) as connection, connection:
+        connection.execute("UPDATE buckets SET created = created - 3600")
+    registry.register(s3_client, "test-acl-new000")
+    s3_client.stubber.add_response("list_buckets", listing("test-acl-older0", "other-bucket"))
+
+    assert registry.reconcile(s3_client)
+
+    assert states(registry) == {
+        "test-acl-gone00": DELETED,
+        # created within the listing margin, may be missing from the listing
+        "test-acl-new000": ACTIVE,
+        "test-acl-older0": UNREGISTERED,
+    }
+    assert registry.found_unregistered == 1
+
+
+def test_an_account_is_listed_once_per_interval(registry, s3_client):
+    s3_client.stubber.add_response("list_buckets", listing())
+    s3_client.stubber.add_response("list_buckets", listing())
+
+    assert registry.reconcile(s3_client)
+    assert not registry.reconcile(s3_client)
+    # another worker sharing the file does not list it either
+    assert not BucketRegistry(registry.db_path, reconcile_interval=60).reconcile(s3_client)
+    assert registry.reconcile(s3_client, force=True)
+    s3_client.stubber.assert_no_pending_responses()
+
+
+def test_cleanups_skip_the_buckets_of_other_live_processes(registry, s3_client):
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    for name, owner in (("test-acl-mine00", registry.owner),
+                        ("test-acl-live00", f"{socket.gethostname()}:{os.getppid()}"),
+                        ("test-acl-dead00", f"{socket.gethostname()}:{finished.pid}"),
+                        ("test-acl-remote", "other-host:1"),
+                        ("test-lock-aaaaa", registry.owner)):
+        registry.register(s3_client, name)
+        set_owner(registry, name, owner)
+    s3_client.stubber.add_response("list_buckets", listing())
+
+    candidates = registry.cleanup_candidates(s3_client, "acl-")
+
+    assert sorted(name for name, _ in candidates) == ["test-acl-dead00", "test-acl-mine00", "test-acl-remote"]
+    assert registry.skipped_live == 1
+    assert all(created.tzinfo is timezone.utc for _, created in candidates)
+
+
+class LimitedRegistry(BucketRegistry):
+    """
+    Registry whose connections take at most 999 variables per query, the default of SQLite before 3.32
+    """
+
+    def _connect(self):
+        connection = super()._connect()
+        connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+        return connection
+
+
+def test_reconcile_handles_more_buckets_than_a_query_takes_variables(tmp_path, s3_client):
+    registry = LimitedRegistry(str(tmp_path / "buckets.sqlite"), reconcile_interval=60)
+    kept = [f"test-acl-{index:06d}" for index in range(2000)]
+    gone = [f"test-acl-gone{index:02d}" for index in range(10)]
+    with closing(sqlite3.connect(registry.db_path)) as connection, connection:
+        connection.executemany(
+            "INSERT INTO buckets (name, account, lock_mode, created, state, owner, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(name, registry._account(s3_client), None, 0, ACTIVE, registry.owner, 0) for name in kept + gone],
+        )
+    s3_client.stubber.add_response("list_buckets", listing(*kept))
+
+    assert registry.reconcile(s3_client)
+
+    final = states(registry)
+    assert {final[name] for name in kept} == {ACTIVE}
+    assert {final[name] for name in gone} == {DELETED}
+    assert registry.found_unregistered == 0
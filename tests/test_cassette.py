@@ -0,0 +1,109 @@
+import os
+import time
+import pytest
+from utils.cassette import Cassette, CassetteMiss, cassette_path, use_cassette
+from utils.consistency import converge, poll_delay
+
+ENDPOINT = "https://s3.example.com"
+
+
+def recorded_cassette(path, exchanges):
+    """
+    Record (method, url, status, body) exchanges to a cassette file
+    """
+    cassette = Cassette(str(path), "record")
+    for method, url, status, body in exchanges:
+        cassette.record(cassette.request_key(method, url), status, {"Content-Type": "application/xml"}, body)
+    cassette.save()
+    return cassette
+
+
+def test_cassette_files_are_one_per_test_in_a_spec_directory():
+    assert cassette_path("cassettes", "acl_test.py::test_put_object_acl[private]") == os.path.join(
+        "cassettes", "acl_test", "test_put_object_acl_private.json")
+
+    long_name = cassette_path("cassettes", "spec_test.py::test_x[" + "a" * 200 + "]")
+    assert len(os.path.basename(long_name)) < 130
+    assert long_name != cassette_path("cassettes", "spec_test.py::test_x[" + "a" * 199 + "b]")
+
+
+def test_bucket_names_get_placeholders_numbered_per_base_name():
+    cassette = Cassette("unused.json", "record")
+    text = "test-acl-1a2b3c test-acl-4d5e6f test-lock-abcdef test-acl-1a2b3c"
+    assert cassette.normalize(text, allocate=True) == (
+        "{bucket:test-acl-:0} {bucket:test-acl-:1} {bucket:test-lock-:0} {bucket:test-acl-:0}")
+    # names never sent are left alone on incoming text
+    assert cassette.normalize("test-other-999999") == "test-other-999999"
+
+
+def test_request_keys_ignore_signatures_and_dates():
+    cassette = Cassette("unused.json", "record")
+    signed = cassette.request_key(
+        "GET", f"{ENDPOINT}/test-presign-a1b2c3/key?X-Amz-Signature=abc&X-Amz-Date=20240101T000000Z&versionId=v1")
+    later = cassette.request_key(
+        "GET", f"{ENDPOINT}/test-presign-a1b2c3/key?versionId=v1&X-Amz-Date=20250101T000000Z&X-Amz-Signature=def")
+    assert signed == later == ("GET", "s3.example.com/{bucket:test-presign-:0}/key?versionId=v1", "versionId")
+
+
+def test_replay_serves_the_recorded_answers_with_the_new_bucket_names(tmp_path):
+    path = tmp_path / "spec_test" / "test_a.json"
+    recorded_cassette(path, [
+        ("PUT", f"{ENDPOINT}/test-spec-aaaaaa", 200, b""),
+        ("GET", f"{ENDPOINT}/test-spec-aaaaaa?location=", 200, b"<Bucket>test-spec-aaaaaa</Bucket>"),
+        ("GET", f"{ENDPOINT}/test-spec-aaaaaa/image", 200, b"\xff\xd8\xff\xe0"),
+    ])
+
+    cassette = Cassette(str(path), "replay")
+    assert cassette.replay(cassette.request_key("PUT", f"{ENDPOINT}/test-spec-bbbbbb"))[0] == 200
+    status, headers, body = cassette.replay(cassette.request_key("GET", f"{ENDPOINT}/test-spec-bbbbbb?location="))
+    assert body == b"<Bucket>test-spec-bbbbbb</Bucket>"
+    assert headers == {"Content-Type": "application/xml"}
+    # binary bodies are kept as they were
+    assert cassette.replay(cassette.request_key("GET", f"{ENDPOINT}/test-spec-bbbbbb/image"))[2] == b"\xff\xd8\xff\xe0"
+    assert cassette.replayed == 3
+
+
+def test_each_recorded_answer_is_replayed_once_in_order(tmp_path):
+    path = tmp_path / "test_b.json"
+    recorded_cassette(path, [
+        ("GET", f"{ENDPOINT}/test-spec-aaaaaa?versioning=", 200, b"<Status>Suspended</Status>"),
+        ("GET", f"{ENDPOINT}/test-spec-aaaaaa?versioning=", 200, b"<Status>Enabled</Status>"),
+    ])
+
+    cassette = Cassette(str(path), "replay")
+    key = cassette.request_key("GET", f"{ENDPOINT}/test-spec-cccccc?versioning=")
+    assert cassette.replay(key)[2] == b"<Status>Suspended</Status>"
+    assert cassette.replay(key)[2] == b"<Status>Enabled</Status>"
+    with pytest.raises(CassetteMiss, match="--cassette-mode record"):
+        cassette.replay(key)
+
+
+def test_unmatched_urls_fall_back_to_the_same_operation(tmp_path):
+    path = tmp_path / "test_c.json"
+    recorded_cassette(path, [("GET", f"{ENDPOINT}/test-spec-aaaaaa/random-key-1?acl=", 200, b"<Grants/>")])
+
+    cassette = Cassette(str(path), "replay")
+    assert cassette.replay(cassette.request_key("GET", f"{ENDPOINT}/test-spec-dddddd/random-key-2?acl="))[2] == b"<Grants/>"
+    with pytest.raises(CassetteMiss):
+        cassette.replay(cassette.request_key("DELETE", f"{ENDPOINT}/test-spec-dddddd/random-key-2"))
+
+
+def test_replay_skips_the_polling_delays_only(tmp_path):
+    path = tmp_path / "spec_test" / "test_a.json"
+    recorded_cassette(path, [])
+    reads = iter([False, False, True])
+
+    def slow_converge():
+        return converge(lambda: next(reads), timeout=30, base_delay=10, max_delay=10)
+
+    with use_cassette(str(path), "replay"):
+        start = time.monotonic()
+        assert slow_converge().converged
+        # other sleeps, such as injected latency, still wait
+        time.sleep(0.05)
+        elapsed = time.monotonic() - start
+
+    assert 0.05 <= elapsed < 1
+    start = time.monotonic()
+    poll_delay(0.05)
+    assert time.monotonic() - start >= 0.05
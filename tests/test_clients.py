@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+import pickle
+import boto3
+import pytest
+from utils.clients import (
+    DEFAULT_MAX_POOL_CONNECTIONS,
+    ClientRegistry,
+    client_from_spec,
+    client_spec,
+    client_with_pool,
+    frozen_credentials,
+)
+
+PROFILE = {"region_name": "br-se1", "endpoint_url": "https://s3.example.com",
+           "aws_access_key_id": "key", "aws_secret_access_key": "secret"}
+
+
+def test_a_profile_gets_the_same_client_every_time():
+    registry = ClientRegistry()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(executor.map(lambda _: registry.client_for(dict(PROFILE)), range(32)))
+
+    assert all(client is clients[0] for client in clients)
+    assert (registry.built, registry.reused) == (1, 31)
+    assert clients[0].meta.config.max_pool_connections == DEFAULT_MAX_POOL_CONNECTIONS
+
+
+def test_clients_are_keyed_by_account_endpoint_and_pool_size():
+    registry = ClientRegistry()
+    client = registry.client_for(PROFILE)
+
+    assert registry.client_for(dict(PROFILE, aws_access_key_id="other")) is not client
+    assert registry.client_for(dict(PROFILE, endpoint_url="https://s3.other.example.com")) is not client
+    bigger = registry.client_for(PROFILE, max_pool_connections=64)
+    assert bigger is not client
+    assert bigger.meta.config.max_pool_connections == 64
+    assert registry.client_for(dict(PROFILE, max_pool_connections=64)) is bigger
+    # clients of one profile share its session
+    assert registry.session_for(PROFILE) is registry.session_for(dict(PROFILE))
+    assert registry.built == 4
+
+
+def test_clients_keep_botocore_retries_unless_the_profile_sets_them():
+    default = boto3.Session().client("s3", region_name="br-se1", aws_access_key_id="key", aws_secret_access_key="secret")
+
+    assert ClientRegistry().client_for(PROFILE).meta.config.retries == default.meta.config.retries
+    tuned = ClientRegistry().client_for(dict(PROFILE, retry_mode="standard", max_attempts=2))
+    assert tuned.meta.config.retries == {"mode": "standard", "total_max_attempts": 3}
+
+
+def test_credentials_come_from_the_session_of_the_registry():
+    client = ClientRegistry().client_for(PROFILE)
+    assert (frozen_credentials(client).access_key, frozen_credentials(client).secret_key) == ("key", "secret")
+
+    unregistered = boto3.Session().client("s3", region_name="br-se1", aws_access_key_id="key", aws_secret_access_key="secret")
+    with pytest.raises(ValueError, match="ClientRegistry"):
+        frozen_credentials(unregistered)
+
+
+def test_close_forgets_the_clients():
+    registry = ClientRegistry()
+    client = registry.client_for(PROFILE)
+
+    registry.close()
+
+    assert registry.client_for(PROFILE) is not client
+    assert "built=2 reused=0" in registry.summary()
+
+
+def test_transfers_borrow_a_client_with_a_pool_for_each_worker():
+    registry = ClientRegistry()
+    client = registry.client_for(PROFILE)
+
+    assert client_with_pool(client, 4) is client
+    bigger = client_with_pool(client, 32)
+    assert bigger.meta.config.max_pool_connections == 32
+    assert bigger is registry.client_for(PROFILE, max_pool_connections=32)
+
+
+def test_clients_not_built_by_a_registry_are_used_as_they_are():
+    client = boto3.Session().client("s3", region_name="br-se1", aws_access_key_id="key", aws_secret_access_key="secret")
+
+    assert client_with_pool(client, 32) is client
+
+
+def test_a_client_spec_rebuilds_an_equivalent_client():
+    client = ClientRegistry().client_for(PROFILE)
+
+    spec = pickle.loads(pickle.dumps(client_spec(client, 8)))
+    rebuilt = client_from_spec(spec)
+
+    assert (spec["aws_access_key_id"], spec["aws_secret_access_key"]) == ("key", "secret")
+    assert rebuilt.meta.endpoint_url == client.meta.endpoint_url
+    assert rebuilt.meta.region_name == "br-se1"
+    assert rebuilt.meta.config.max_pool_connections == 8
+
+
+def test_hooks_see_every_client_built():
+    built = []
+    registry = ClientRegistry(client_hooks=[lambda client, profile: built.append((client, profile["endpoint_url"]))])
+
+    client = registry.client_for(PROFILE)
+    registry.client_for(PROFILE)
+
+    assert built == [(client, "https://s3.example.com")]
@@ -0,0 +1,129 @@
+import itertools
+import pytest
+from utils import consistency
+from utils.consistency import (
+    CONVERGENCE_HISTORY_SIZE,
+    ConvergenceResult,
+    backoff_delay,
+    converge,
+    convergence_results,
+    quorum_read,
+    record_convergence,
+    summarize_convergence,
+)
+
+
+def sequence(*values):
+    """
+    Probe returning the values in order, then the last one forever
+    """
+    values = itertools.chain(values, itertools.repeat(values[-1]))
+    return lambda: next(values)
+
+
+def test_converge_waits_for_a_quorum_of_consecutive_reads():
+    probe = sequence(None, "Suspended", "Enabled", "Suspended", "Enabled")
+    result = converge(
+        probe, accept=lambda value: value == "Enabled", quorum=2, base_delay=0.001, max_delay=0.001, timeout=5,
+    )
+    assert result.converged
+    assert result.value == "Enabled"
+    # the first streak of Enabled was broken by a Suspended read
+    assert result.probes == 6
+    assert result.rounds == 3
+
+
+def test_converge_needs_the_agreeing_reads_to_be_equal():
+    probe = sequence({"Days": 1}, {"Days": 2}, {"Days": 2})
+    result = converge(probe, key=lambda value: value["Days"], quorum=2, base_delay=0.001, max_delay=0.001, timeout=5)
+    assert result.value == {"Days": 2}
+    # a read agreeing on a new value starts a new streak
+    assert result.probes == 3
+
+
+def test_converge_retries_the_listed_errors_only():
+    answers = iter([ConnectionError("reset"), "Enabled"])
+
+    def probe():
+        answer = next(answers)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    result = converge(probe, retry_on=(ConnectionError,), base_delay=0.001, max_delay=0.001, timeout=5)
+    assert (result.converged, result.probes) == (True, 2)
+
+
+def test_converge_times_out_on_a_state_never_reached():
+    result = converge(lambda: "Suspended", accept=lambda value: value == "Enabled", timeout=0.05,
+                      base_delay=0.001, max_delay=0.01)
+    assert not result.converged
+    assert result.value == "Suspended"
+    assert result.elapsed < 1
+
+
+def test_quorum_read_groups_equal_accepted_answers():
+    answers = iter(["Enabled", "Enabled", "Suspended", None])
+    read = quorum_read(lambda: next(answers), fan_out=1)
+    assert (read.value, read.agreed, read.agreeing) == ("Enabled", True, 1)
+
+    answers = ["Enabled", "Enabled", "Suspended", None]
+    read = quorum_read(lambda: answers.pop(), fan_out=4, agreement=2)
+    assert read.value == "Enabled"
+    assert read.agreed
+    assert (read.agreeing, read.disagreeing) == (2, 2)
+
+
+def test_quorum_read_counts_errors_as_disagreements():
+    def failing():
+        raise ConnectionError("reset")
+
+    read = quorum_read(failing, fan_out=3, retry_on=(ConnectionError,))
+    assert (read.value, read.agreed, read.agreeing) == (None, False, 0)
+
+
+def test_converge_rounds_fan_out_concurrent_reads():
+    reads = itertools.count()
+    # one read of the first round of 3 sees the old state
+    result = converge(lambda: next(reads) != 1, fan_out=3, agreement=3, base_delay=0.001, max_delay=0.001, timeout=5)
+    assert result.converged
+    assert result.probes == 6
+    assert result.disagreement == 1 / 6
+
+
+@pytest.mark.parametrize("fan_out, agreement", [(2, 3), (3, 0), (0, None)])
+def test_unreachable_agreements_are_rejected(fan_out, agreement):
+    with pytest.raises(ValueError):
+        quorum_read(lambda: True, fan_out=fan_out, agreement=agreement)
+    with pytest.raises(ValueError):
+        converge(lambda: True, fan_out=fan_out, agreement=agreement, timeout=0)
+
+
+def test_every_wait_is_recorded():
+    converge(lambda: True, name="test_recorded_wait")
+    assert convergence_results()[-1].name == "test_recorded_wait"
+
+
+def test_the_history_keeps_only_the_latest_waits():
+    for index in range(CONVERGENCE_HISTORY_SIZE + 10):
+        record_convergence(ConvergenceResult("test_bounded_history", index, True, 0.0, 1, 0))
+    assert len(consistency.convergence_history) == CONVERGENCE_HISTORY_SIZE
+    assert convergence_results()[-1].value == CONVERGENCE_HISTORY_SIZE + 9
+
+
+def test_waits_are_summarized_by_name():
+    results = [ConvergenceResult("versioning", None, True, seconds, 2, 1) for seconds in (0.1, 0.2, 0.3, 0.4)]
+    results.append(ConvergenceResult("listing", None, False, 5.0, 10, 9))
+
+    summary = summarize_convergence(results)
+
+    assert list(summary) == ["listing", "versioning"]
+    assert (summary["versioning"]["count"], summary["versioning"]["converged"], summary["versioning"]["probes"]) == (4, 4, 8)
+    assert (summary["versioning"]["p50"], summary["versioning"]["max"]) == (0.2, 0.4)
+    assert summary["listing"]["converged"] == 0
+
+
+def test_backoff_grows_up_to_the_maximum_delay():
+    assert all(0 <= backoff_delay(1, 0.2, 5) <= 0.2 for _ in range(100))
+    assert all(0 <= backoff_delay(10, 0.2, 5) <= 5 for _ in range(100))
+    assert max(backoff_delay(4, 0.2, 5) for _ in range(1000)) > 0.8
@@ -0,0 +1,295 @@
+import itertools
+import logging
+import threading
+import time
+import pytest
+from types import SimpleNamespace
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+from utils.clients import ClientRegistry
+from utils.crud import (
+    DELETE_OBJECTS_BATCH_SIZE,
+    TransferStats,
+    check_backend,
+    count_objects,
+    delete_objects_in_batches,
+    iter_objects_parallel,
+    process_transfer,
+    stream_transfer,
+    upload_objects_multithreaded,
+)
+
+PROFILE = {"region_name": "br-se1", "endpoint_url": "https://s3.example.com",
+           "aws_access_key_id": "key", "aws_secret_access_key": "secret"}
+
+
+class FakeClient:
+    """
+    Stands for a client with a pool big enough for any transfer
+    """
+    meta = SimpleNamespace(config=SimpleNamespace(max_pool_connections=1000))
+
+
+class FakePaginator:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, **kwargs):
+        return iter(self.pages)
+
+
+class FakeBucketClient:
+    """
+    Bucket listing in pages of 1000 keys, and a DeleteObjects answering from a callable
+    """
+
+    def __init__(self, keys, delete_objects, versions=()):
+        self.keys = keys
+        self.versions = list(versions)
+        self._delete_objects = delete_objects
+        self.delete_requests = []
+        self._lock = threading.Lock()
+
+    def get_paginator(self, name):
+        if name == "list_object_versions":
+            return FakePaginator([{"Versions": self.versions[:1], "DeleteMarkers": self.versions[1:]}])
+        assert name == "list_objects_v2"
+        pages = [{"Contents": [{"Key": key} for key in self.keys[start:start + 1000]]}
+                 for start in range(0, len(self.keys), 1000)]
+        return FakePaginator(pages)
+
+    def delete_objects(self, **kwargs):
+        with self._lock:
+            self.delete_requests.append(kwargs)
+        return self._delete_objects(kwargs)
+
+
+class ShardedListingClient(FakeClient):
+    """
+    ListObjectsV2 over a sorted key list, honoring Prefix and Delimiter, in pages of 10 keys
+    """
+
+    def __init__(self, keys, failing_prefix=None):
+        self.keys = sorted(keys)
+        self.failing_prefix = failing_prefix
+        self.pages_listed = 0
+        self._lock = threading.Lock()
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return self
+
+    def paginate(self, Bucket, Prefix="", Delimiter=None):
+        if Prefix and Prefix == self.failing_prefix:
+            raise ConnectionError(f"listing of {Prefix} reset")
+        keys = [key for key in self.keys if key.startswith(Prefix)]
+        if Delimiter:
+            prefixes = sorted({Prefix + key[len(Prefix):].split(Delimiter)[0] + Delimiter
+                               for key in keys if Delimiter in key[len(Prefix):]})
+            yield {"Contents": [{"Key": key} for key in keys if Delimiter not in key[len(Prefix):]],
+                   "CommonPrefixes": [{"Prefix": prefix} for prefix in prefixes]}
+            return
+        for start in range(0, len(keys), 10):
+            with self._lock:
+                self.pages_listed += 1
+            yield {"Contents": [{"Key": key} for key in keys[start:start + 10]]}
+
+
+def sharded_keys(shards=8, per_shard=100):
+    return [f"shard-{shard}/key-{index:03d}" for shard in range(shards) for index in range(per_shard)]
+
+
+def test_deletes_every_key_in_batches():
+    keys = [f"key-{index}" for index in range(2500)]
+    client = FakeBucketClient(keys, lambda request: {})
+
+    deleted, errors = delete_objects_in_batches(client, "bucket")
+
+    assert (deleted, errors) == (2500, [])
+    assert sorted(len(request["Delete"]["Objects"]) for request in client.delete_requests) == [500, 1000, 1000]
+    assert max(len(request["Delete"]["Objects"]) for request in client.delete_requests) <= DELETE_OBJECTS_BATCH_SIZE
+
+
+def test_versions_and_delete_markers_are_deleted_by_id():
+    versions = [{"Key": "a", "VersionId": "v1"}, {"Key": "a", "VersionId": "marker"}]
+    client = FakeBucketClient([], lambda request: {}, versions=versions)
+
+    deleted, errors = delete_objects_in_batches(client, "bucket", versions=True)
+
+    assert (deleted, errors) == (2, [])
+    assert client.delete_requests[0]["Delete"]["Objects"] == versions
+
+
+def test_per_key_errors_are_returned():
+    keys = [f"key-{index}" for index in range(10)]
+    client = FakeBucketClient(keys, lambda request: {"Errors": [{"Key": "key-3", "Code": "InternalError"}]})
+
+    deleted, errors = delete_objects_in_batches(client, "bucket")
+
+    assert deleted == 9
+    assert errors == [{"Key": "key-3", "Code": "InternalError"}]
+
+
+def test_a_failed_request_reports_every_key_of_its_batch():
+    def delete_objects(request):
+        if request["Delete"]["Objects"][0]["Key"] == "key-1000":
+            raise ClientError({"Error": {"Code": "SlowDown", "Message": "Please reduce your request rate."}}, "DeleteObjects")
+        return {}
+
+    keys = [f"key-{index}" for index in range(2500)]
+    client = FakeBucketClient(keys, delete_objects)
+
+    deleted, errors = delete_objects_in_batches(client, "bucket")
+
+    assert deleted == 1500
+    assert len(errors) == 1000
+    assert {error["Code"] for error in errors} == {"SlowDown"}
+    assert {error["Key"] for error in errors} == {f"key-{index}" for index in range(1000, 2000)}
+
+
+def test_a_total_failure_is_not_an_empty_bucket():
+    def delete_objects(request):
+        raise ConnectionError("connection reset")
+
+    client = FakeBucketClient(["a", "b"], delete_objects)
+
+    deleted, errors = delete_objects_in_batches(client, "bucket")
+
+    assert deleted == 0
+    assert [(error["Key"], error["Code"]) for error in errors] == [("a", "ConnectionError"), ("b", "ConnectionError")]
+
+
+def test_governance_denials_are_retried_with_bypass():
+    def delete_objects(request):
+        if request.get("BypassGovernanceRetention"):
+            return {}
+        return {"Errors": [{"Key": "locked", "VersionId": "v1", "Code": "AccessDenied"}]}
+
+    client = FakeBucketClient(["locked", "free"], delete_objects)
+
+    deleted, errors = delete_objects_in_batches(client, "bucket", bypass_governance=True)
+
+    assert (deleted, errors) == (2, [])
+    assert client.delete_requests[-1]["Delete"]["Objects"] == [{"Key": "locked", "VersionId": "v1"}]
+
+
+def test_unknown_transfer_backend_is_rejected():
+    check_backend("async")
+    with pytest.raises(ValueError, match="Unknown transfer backend"):
+        check_backend("threads")
+
+
+def test_uploads_use_a_client_pooled_for_their_concurrency():
+    registry = ClientRegistry()
+    pooled = registry.client_for(PROFILE, max_pool_connections=16)
+    stats = TransferStats()
+
+    with Stubber(pooled) as stubber:
+        for _ in range(3):
+            stubber.add_response("put_object", {"ResponseMetadata": {"HTTPStatusCode": 200}})
+        objects = [{"key": f"key-{index}", "path": b"body"} for index in range(3)]
+        uploaded = upload_objects_multithreaded(registry.client_for(PROFILE), "bucket", objects, concurrency=16, stats=stats)
+        stubber.assert_no_pending_responses()
+
+    assert uploaded == 3
+    assert stats.requests == 3
+
+
+@pytest.mark.parametrize("stats", [None, TransferStats()])
+def test_transfers_log_their_stats_only_when_collected(stats, caplog):
+    registry = ClientRegistry()
+    pooled = registry.client_for(PROFILE, max_pool_connections=16)
+
+    with Stubber(pooled) as stubber, caplog.at_level(logging.INFO):
+        stubber.add_response("put_object", {"ResponseMetadata": {"HTTPStatusCode": 200}})
+        upload_objects_multithreaded(registry.client_for(PROFILE), "bucket", [{"key": "key", "path": b"body"}],
+                                     concurrency=16, stats=stats)
+
+    assert "Successful uploads: 1" in caplog.messages
+    assert "None" not in caplog.text
+    assert ("TransferStats(requests=1" in caplog.text) == (stats is not None)
+
+
+def test_stream_transfer_keeps_at_most_window_requests_in_flight():
+    lock = threading.Lock()
+    pulled = finished = peak = 0
+
+    def items():
+        nonlocal pulled, peak
+        for index in range(60):
+            with lock:
+                peak = max(peak, pulled - finished)
+                pulled += 1
+            yield (index,)
+
+    def transfer(client, index):
+        nonlocal finished
+        time.sleep(0.001 * (index % 3))
+        with lock:
+            finished += 1
+        return index
+
+    results = list(stream_transfer(FakeClient(), transfer, items(), concurrency=4, window=6))
+
+    assert sorted(results) == list(range(60))
+    assert peak <= 6
+
+
+def test_stream_transfer_pulls_items_lazily():
+    pulled = itertools.count()
+    items = ((next(pulled),) for _ in itertools.count())
+
+    results = stream_transfer(FakeClient(), lambda client, index: index, items, concurrency=2, window=4)
+    first = list(itertools.islice(results, 10))
+    results.close()
+
+    assert len(first) == 10
+    assert next(pulled) <= 10 + 4 + 1
+
+
+def test_parallel_listing_covers_every_shard():
+    keys = sharded_keys() + ["loose-object"]
+    client = ShardedListingClient(keys)
+
+    assert sorted(iter_objects_parallel(client, "bucket", concurrency=3)) == sorted(keys)
+    prefixes = [f"shard-{shard}/" for shard in range(8)]
+    assert sorted(iter_objects_parallel(client, "bucket", prefixes=prefixes, records=True), key=lambda obj: obj["Key"]) == [
+        {"Key": key} for key in sorted(sharded_keys())]
+    assert count_objects(client, "bucket", delimiter="/") == len(keys)
+
+
+def test_parallel_listing_stops_the_shards_when_the_consumer_stops():
+    client = ShardedListingClient(sharded_keys(shards=4, per_shard=1000))
+
+    keys = iter_objects_parallel(client, "bucket", prefixes=[f"shard-{shard}/" for shard in range(4)], concurrency=4)
+    first = list(itertools.islice(keys, 5))
+    keys.close()
+
+    assert len(first) == 5
+    # the bounded queue held the shards back, and they gave up once the consumer left
+    listed = client.pages_listed
+    assert listed < 400 / 4
+    time.sleep(0.3)
+    assert client.pages_listed == listed
+
+
+def test_a_failed_shard_fails_the_listing():
+    client = ShardedListingClient(sharded_keys(shards=3, per_shard=20), failing_prefix="shard-1/")
+
+    with pytest.raises(ConnectionError, match="shard-1/"):
+        list(iter_objects_parallel(client, "bucket", prefixes=["shard-0/", "shard-1/", "shard-2/"]))
+
+
+def double(client, value):
+    return 2 * value
+
+
+def test_process_transfer_merges_the_results_and_stats_of_every_worker():
+    stats = TransferStats()
+    items = ((index,) for index in range(25))
+
+    results = process_transfer(ClientRegistry().client_for(PROFILE), double, items, processes=2, threads=2, chunk_size=10, stats=stats)
+
+    assert sorted(results) == [2 * index for index in range(25)]
+    assert stats.requests == 25
+    assert len(stats.latencies) == 25
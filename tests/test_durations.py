@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+from utils.durations import DEFAULT_ESTIMATE, DurationHistory, DurationScheduling, marker_estimate
+
+
+class FakeConfig:
+    def __init__(self, workers):
+        self.options = {"tx": [f"{workers}*popen"], "maxschedchunk": None}
+
+    def getvalue(self, name):
+        return self.options[name]
+
+    getoption = getvalue
+
+
+class FakeNode:
+    """
+    An xdist worker controller, keeping the tests it was sent
+    """
+
+    def __init__(self, name):
+        self.gateway = SimpleNamespace(id=name)
+        self.sent = []
+        self.shutting_down = False
+
+    def send_runtest_some(self, indexes):
+        self.sent.extend(indexes)
+
+    def shutdown(self):
+        self.shutting_down = True
+
+
+def scheduler(tmp_path, durations, workers=2):
+    history = DurationHistory(str(tmp_path / "durations.sqlite"))
+    history.record("local.yaml", durations)
+    scheduling = DurationScheduling(FakeConfig(workers), history=history, config_name="local.yaml")
+    nodes = [FakeNode(f"gw{index}") for index in range(workers)]
+    for node in nodes:
+        scheduling.add_node(node)
+    for node in nodes:
+        scheduling.add_node_collection(node, list(durations))
+    return scheduling, nodes
+
+
+def test_history_keeps_a_moving_average_per_config(tmp_path):
+    history = DurationHistory(str(tmp_path / "durations.sqlite"))
+    history.record("local.yaml", {"a_test.py::test_a": 10.0})
+    history.record("local.yaml", {"a_test.py::test_a": 20.0})
+    history.record("br-se1.yaml", {"a_test.py::test_a": 100.0})
+    estimates, known = history.estimates("local.yaml", ["a_test.py::test_a"])
+    assert (estimates, known) == ({"a_test.py::test_a": 15.0}, 1)
+
+
+def test_tests_without_history_are_estimated_from_their_markers(tmp_path, pytester):
+    fast, big, unmarked = pytester.getitems("""
+        import pytest
+
+        @pytest.mark.rapid
+        def test_fast():
+            pass
+
+        @pytest.mark.slow
+        def test_big():
+            pass
+
+        def test_unmarked():
+            pass
+    """)
+    assert marker_estimate(fast) < marker_estimate(big)
+    assert marker_estimate(unmarked) == DEFAULT_ESTIMATE
+
+    history = DurationHistory(str(tmp_path / "durations.sqlite"))
+    history.record("local.yaml", {"a_test.py::test_known": 3.0})
+    history.store_marker_estimates("local.yaml", {"a_test.py::test_big": 60.0})
+    estimates, known = history.estimates("local.yaml", ["a_test.py::test_known", "a_test.py::test_big", "a_test.py::test_new"])
+    assert estimates == {"a_test.py::test_known": 3.0, "a_test.py::test_big": 60.0, "a_test.py::test_new": DEFAULT_ESTIMATE}
+    assert known == 1
+
+
+def test_the_longest_tests_start_first_on_different_workers(tmp_path):
+    durations = {"t::short": 1.0, "t::longest": 90.0, "t::medium": 30.0, "t::long": 60.0, "t::tiny": 0.5}
+    scheduling, (first, second) = scheduler(tmp_path, durations)
+
+    scheduling.schedule()
+
+    names = list(durations)
+    assert [names[index] for index in first.sent] == ["t::longest", "t::medium"]
+    assert [names[index] for index in second.sent] == ["t::long", "t::short"]
+    assert [names[index] for index in scheduling.pending] == ["t::tiny"]
+
+
+def test_a_free_worker_takes_the_longest_pending_test_then_shuts_down(tmp_path):
+    durations = {"t::a": 5.0, "t::b": 4.0, "t::c": 3.0, "t::d": 2.0, "t::e": 1.0}
+    scheduling, (first, second) = scheduler(tmp_path, durations)
+    scheduling.schedule()
+
+    scheduling.mark_test_complete(second, second.sent[0])
+    assert second.sent[-1] == list(durations).index("t::e")
+    assert not scheduling.pending
+
+    scheduling.mark_test_complete(first, first.sent[0])
+    assert first.shutting_down
@@ -0,0 +1,105 @@
+import os
+import boto3
+import pytest
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionClosedError
+from utils.faults import FaultInjector, validate_profile
+from utils.params import TestParams
+
+PARAMS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "params")
+
+
+class FakeRequest:
+    url = "http://127.0.0.1:1/bucket/key"
+
+
+def offline_client(max_attempts=2):
+    # nothing listens on port 1: any request that is not answered by the injector fails
+    return boto3.client(
+        "s3",
+        region_name="local",
+        endpoint_url="http://127.0.0.1:1",
+        aws_access_key_id="key",
+        aws_secret_access_key="secret",
+        config=Config(retries={"mode": "standard", "max_attempts": max_attempts}, connect_timeout=0.5),
+    )
+
+
+@pytest.mark.parametrize("profile, message", [
+    ({"operations": {"PutObject": {"slow_dwn": 0.1}}}, "unknown rules"),
+    ({"operations": {"PutObject": {"slow_down": 1.5}}}, "not between 0 and 1"),
+    ({"operations": {"default": {"latency": {"distribution": "pareto"}}}}, "unknown distribution"),
+    ({"operations": {"GetObject": {"latency_spike": {"probability": -1, "seconds": 1}}}}, "not between 0 and 1"),
+    (["seed", 42], "expected a mapping"),
+    ({"operations": ["PutObject"]}, "expected a mapping"),
+    ({"operations": {"PutObject": 0.5}}, "expected a mapping"),
+    ({"operations": {"default": {"latency": 0.5}}}, "expected a mapping"),
+    ({"operations": {"PutObject": {"slow_first_byte": 1}}}, "expected a mapping"),
+    ({"operations": {"PutObject": {"slow_down": "often"}}}, "not between 0 and 1"),
+    ({"operations": {"default": {"latency": {"distribution": "uniform", "min": 1}}}}, "needs max"),
+    ({"operations": {"default": {"latency": {"distribution": "lognormal", "median": 0.01}}}}, "needs sigma"),
+    ({"operations": {"default": {"latency": {"distribution": "exponential", "mean": 0}}}}, "above 0"),
+    ({"operations": {"default": {"latency": {"seconds": "1s"}}}}, "not a non-negative number"),
+    ({"operations": {"PutObject": {"slow_first_byte": {"probability": 0.1, "seconds": -1}}}}, "not a non-negative number"),
+])
+def test_malformed_profiles_are_rejected(profile, message):
+    with pytest.raises(ValueError, match=message):
+        validate_profile(profile)
+
+
+def test_operation_rules_are_merged_over_the_default_ones():
+    injector = FaultInjector({"operations": {
+        "default": {"latency": {"seconds": 0.1}, "slow_down": 0.5},
+        "PutObject": {"slow_down": 0.2},
+    }})
+    assert injector.rules_for("PutObject") == {"latency": {"seconds": 0.1}, "slow_down": 0.2}
+    assert injector.rules_for("GetObject") == {"latency": {"seconds": 0.1}, "slow_down": 0.5}
+
+
+def test_slow_down_answers_are_retried_like_real_ones():
+    injector = FaultInjector({"operations": {"HeadBucket": {"slow_down": 1}}})
+    client = offline_client(max_attempts=3)
+    injector.attach(client)
+
+    with pytest.raises(ClientError) as error:
+        client.head_bucket(Bucket="bucket")
+
+    assert error.value.response["Error"]["Code"] == "SlowDown"
+    retries = error.value.response["ResponseMetadata"]["RetryAttempts"]
+    assert retries >= 2
+    # the client retried the injected answers, and every attempt was injected
+    assert injector.injected == {"HeadBucket": {"slow_down": retries + 1}}
+
+
+def test_connection_resets_fail_without_sending():
+    injector = FaultInjector({"operations": {"ListBuckets": {"connection_reset": 1}}})
+    client = offline_client(max_attempts=1)
+    injector.attach(client)
+
+    with pytest.raises(ConnectionClosedError):
+        client.list_buckets()
+    # every attempt, retries included, was answered by the injector
+    assert list(injector.injected) == ["ListBuckets"]
+    assert list(injector.injected["ListBuckets"]) == ["connection_reset"]
+
+
+def test_the_same_seed_draws_the_same_delays():
+    profile = {"seed": 7, "operations": {"default": {
+        "latency": {"distribution": "lognormal", "median": 0.01, "sigma": 0.5},
+        "latency_spike": {"probability": 0.3, "distribution": "uniform", "min": 1, "max": 2},
+    }}}
+    runs = []
+    for _ in range(2):
+        injector = FaultInjector(profile)
+        for _ in range(50):
+            injector._before_send(FakeRequest(), "before-send.s3.GetObject")
+        runs.append((injector.injected_seconds, injector.injected))
+    assert runs[0] == runs[1]
+    assert runs[0][0] > 0
+
+
+def test_fault_profiles_are_not_run_configs():
+    path = os.path.join(PARAMS_DIR, "faults", "degraded.yaml")
+    assert FaultInjector.from_yaml(path).rules_for("PutObject")
+    with pytest.raises(ValueError, match="unknown settings"):
+        TestParams.from_yaml(path)
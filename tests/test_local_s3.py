@@ -0,0 +1,82 @@
+import logging
+import time
+import boto3
+import pytest
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from utils.local_s3 import LocalS3Server, LocalS3Store, Replicated
+
+
+@pytest.fixture
+def server():
+    server = LocalS3Server(lag={"versioning": 0.3}).start()
+    yield server
+    server.stop()
+
+
+def client_for(server, access_key="key"):
+    return boto3.Session().client(
+        "s3", region_name="local", endpoint_url=server.endpoint_url,
+        aws_access_key_id=access_key, aws_secret_access_key="secret",
+        config=Config(retries={"max_attempts": 1, "mode": "standard"}),
+    )
+
+
+def test_objects_round_trip(server):
+    s3_client = client_for(server)
+    s3_client.create_bucket(Bucket="bucket")
+
+    s3_client.put_object(Bucket="bucket", Key="dir/key", Body=b"body")
+
+    assert s3_client.get_object(Bucket="bucket", Key="dir/key")["Body"].read() == b"body"
+    assert [obj["Key"] for obj in s3_client.list_objects_v2(Bucket="bucket")["Contents"]] == ["dir/key"]
+    s3_client.delete_object(Bucket="bucket", Key="dir/key")
+    with pytest.raises(ClientError, match="NoSuchKey"):
+        s3_client.get_object(Bucket="bucket", Key="dir/key")
+
+
+def test_access_keys_are_tenants(server):
+    client_for(server).create_bucket(Bucket="bucket")
+    other = client_for(server, access_key="other")
+
+    with pytest.raises(ClientError, match="AccessDenied"):
+        other.put_object(Bucket="bucket", Key="key", Body=b"body")
+    assert other.list_buckets()["Buckets"] == []
+
+
+def test_settings_reach_the_replicas_after_their_lag(server):
+    s3_client = client_for(server)
+    s3_client.create_bucket(Bucket="bucket")
+
+    s3_client.put_bucket_versioning(Bucket="bucket", VersioningConfiguration={"Status": "Enabled"})
+
+    assert "Status" not in s3_client.get_bucket_versioning(Bucket="bucket")
+    time.sleep(0.4)
+    assert s3_client.get_bucket_versioning(Bucket="bucket")["Status"] == "Enabled"
+
+
+def test_replicas_see_a_change_once_its_delay_passed():
+    lags = iter([0, 10])
+    value = Replicated("old", lambda: next(lags), replicas=2)
+
+    value.set("new")
+
+    assert (value.get(0), value.get(1), value.get()) == ("new", "old", "new")
+
+
+def test_unknown_lag_settings_are_rejected():
+    with pytest.raises(ValueError, match="Unknown lag settings"):
+        LocalS3Store(lag={"lifecycle": 1})
+
+
+def test_clients_hanging_up_are_not_server_errors(server, caplog):
+    for error in (ConnectionResetError(104, "reset"), BrokenPipeError(32, "broken pipe"), ValueError("bad state")):
+        try:
+            raise error
+        except Exception:
+            with caplog.at_level(logging.DEBUG):
+                server.httpd.handle_error(None, ("127.0.0.1", 50000))
+
+    errors = [record for record in caplog.records if record.levelno >= logging.ERROR]
+    assert [record.exc_info[1].args for record in errors] == [("bad state",)]
+    assert sum("closed the connection" in record.message for record in caplog.records) == 2
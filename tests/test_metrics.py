@@ -0,0 +1,148 @@
+import csv
+import json
+import threading
+import boto3
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from utils.metrics import OperationSamples, RequestRecorder, percentile
+from utils.metrics_report import MetricsReport
+
+
+class EndpointHandler(BaseHTTPRequestHandler):
+    """
+    Answers 200 with a small body, or a 404 NoSuchKey for keys named "missing"
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.endswith("/missing"):
+            return self._send(404, b"<Error><Code>NoSuchKey</Code></Error>")
+        self._send(200, b"0123456789")
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self._send(200, b"")
+
+
+@pytest.fixture
+def s3_client():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), EndpointHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield boto3.Session().client(
+        "s3", region_name="br-se1", endpoint_url=f"http://127.0.0.1:{server.server_address[1]}",
+        aws_access_key_id="key", aws_secret_access_key="secret",
+        config=Config(s3={"addressing_style": "path"}, retries={"max_attempts": 1, "mode": "standard"}),
+    )
+    server.shutdown()
+    server.server_close()
+
+
+def test_every_request_is_recorded_per_operation(s3_client, tmp_path):
+    recorder = RequestRecorder()
+    recorder.attach(s3_client)
+
+    s3_client.put_object(Bucket="bucket", Key="key", Body=b"abc")
+    mark = recorder.mark()
+    for _ in range(3):
+        s3_client.get_object(Bucket="bucket", Key="key")["Body"].read()
+    with pytest.raises(ClientError):
+        s3_client.get_object(Bucket="bucket", Key="missing")
+
+    assert recorder.summary()["PutObject"]["bytes_sent"] == 3
+    since = recorder.summary(since=mark)
+    assert list(since) == ["GetObject"]
+    assert since["GetObject"]["count"] == 4
+    assert since["GetObject"]["errors"] == 1
+    assert since["GetObject"]["bytes_received"] == 3 * 10 + len(b"<Error><Code>NoSuchKey</Code></Error>")
+    assert recorder.operations["GetObject"].error_codes == {"NoSuchKey": 1}
+    assert all(0 < ttfb <= latency for ttfb, latency in zip(recorder.operations["GetObject"].ttfb,
+                                                             recorder.operations["GetObject"].latency))
+
+    recorder.export_csv(tmp_path / "requests.csv")
+    with open(tmp_path / "requests.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["operation"] for row in rows] == ["GetObject"] * 4 + ["PutObject"]
+
+
+def test_percentiles_use_the_nearest_rank():
+    samples = list(range(1, 101))
+    assert percentile(samples, 0.5) == 50
+    assert percentile(samples, 0.99) == 99
+    assert percentile([0.3], 0.9) == 0.3
+    assert percentile([], 0.5) is None
+
+
+def test_histograms_are_cumulative():
+    samples = OperationSamples()
+    for latency in (0.001, 0.02, 0.02, 100):
+        samples.append(latency, latency, 200, 0, 0, 0)
+
+    histogram = dict(samples.histogram(buckets=(0.01, 0.05)))
+
+    assert histogram == {0.01: 1, 0.05: 3, float("inf"): 4}
+    assert dict(samples.histogram(start=3, buckets=(0.01, 0.05))) == {0.01: 0, 0.05: 0, float("inf"): 1}
+
+
+def test_the_run_report_writes_openmetrics_and_json(pytester, s3_client, tmp_path, monkeypatch):
+    monkeypatch.delenv("PYTEST_XDIST_WORKER", raising=False)
+    recorder = RequestRecorder()
+    recorder.attach(s3_client)
+    s3_client.get_object(Bucket="bucket", Key="key")["Body"].read()
+    with pytest.raises(ClientError):
+        s3_client.get_object(Bucket="bucket", Key="missing")
+    report = MetricsReport(str(tmp_path / "metrics"), {"profile": "br-se1", "region": "br-se1"}, lambda: recorder)
+    pytester.makepyfile("""
+        import pytest
+
+        def test_passes():
+            pass
+
+        def test_fails():
+            assert False
+
+        def test_skipped():
+            pytest.skip("not here")
+    """)
+
+    pytester.runpytest_inprocess(plugins=[report]).assert_outcomes(passed=1, failed=1, skipped=1)
+
+    with open(tmp_path / "metrics" / "br-se1.json") as f:
+        data = json.load(f)
+    assert {nodeid.split("::")[1]: test["outcome"] for nodeid, test in data["tests"].items()} == {
+        "test_passes": "passed", "test_fails": "failed", "test_skipped": "skipped"}
+    assert data["operations"]["GetObject"]["error_codes"] == {"NoSuchKey": 1}
+    prom = (tmp_path / "metrics" / "br-se1.prom").read_text()
+    assert 's3specs_request_duration_seconds_count{profile="br-se1",region="br-se1",operation="GetObject"} 2' in prom
+    assert 's3specs_request_errors_total{profile="br-se1",region="br-se1",operation="GetObject",code="NoSuchKey"} 1' in prom
+    assert 's3specs_request_duration_seconds_bucket{profile="br-se1",region="br-se1",operation="GetObject",le="+Inf"} 2' in prom
+    assert prom.endswith("# EOF\n")
+
+
+def test_each_xdist_worker_writes_its_own_series(s3_client, tmp_path, monkeypatch):
+    recorder = RequestRecorder()
+    recorder.attach(s3_client)
+    s3_client.get_object(Bucket="bucket", Key="key")["Body"].read()
+    files = {}
+
+    for worker in ("gw0", "gw1"):
+        monkeypatch.setenv("PYTEST_XDIST_WORKER", worker)
+        MetricsReport(str(tmp_path / "metrics"), {"profile": "br-se1", "region": "br-se1"},
+                      lambda: recorder).pytest_sessionfinish(None)
+        files[worker] = (tmp_path / "metrics" / f"br-se1.{worker}.prom").read_text()
+
+    assert 's3specs_request_duration_seconds_count{profile="br-se1",region="br-se1",worker="gw0",operation="GetObject"} 1' in files["gw0"]
+    assert 's3specs_request_duration_seconds_count{profile="br-se1",region="br-se1",worker="gw1",operation="GetObject"} 1' in files["gw1"]
+    samples = [set(line for line in prom.splitlines() if not line.startswith("#")) for prom in files.values()]
+    assert not samples[0] & samples[1]
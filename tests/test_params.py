@@ -0,0 +1,81 @@
+import dataclasses
+import os
+import pytest
+from utils.params import DEFAULT_LOCK_MODE, Profile, TestParams
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EXPLICIT = {"region_name": "br-se1", "aws_access_key_id": "key", "aws_secret_access_key": "secret"}
+
+
+def test_the_example_params_are_valid():
+    params = TestParams.from_yaml(os.path.join(ROOT_DIR, "params.example.yaml"))
+    assert params.default_profile is params.profiles[params.default_profile_index]
+
+
+def test_records_read_like_the_parsed_yaml():
+    params = TestParams.from_dict({"profiles": [
+        {"profile_name": "br-ne1", "waiters": {"delay": 2}},
+        dict(EXPLICIT, lock_mode="GOVERNANCE"),
+    ], "default_profile_index": 1})
+
+    first, second = params.profiles
+    assert first["profile_name"] == first.profile_name == first.name == "br-ne1"
+    assert "region_name" not in first
+    assert first.get("lock_mode") is None
+    assert first.effective_lock_mode == DEFAULT_LOCK_MODE
+    assert second.name == "br-se1"
+    assert dict(second) == dict(EXPLICIT, lock_mode="GOVERNANCE")
+    assert params.default_profile is second
+    assert params["default_profile_index"] == 1
+
+
+def test_records_are_immutable():
+    profile = Profile.from_dict({"profile_name": "br-ne1", "waiters": {"delay": 2}})
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        profile.region_name = "br-se1"
+    with pytest.raises(TypeError):
+        profile["waiters"]["delay"] = 5
+
+
+@pytest.mark.parametrize("record, message", [
+    ({"profile_name": "a", "regon_name": "br-se1"}, "unknown settings"),
+    ({"region_name": "br-se1", "aws_access_key_id": "key"}, "aws_secret_access_key"),
+    ({"profile_name": "a", "max_attempts": "3"}, "must be an integer"),
+    ({"profile_name": "a", "max_attempts": True}, "must be an integer"),
+    ({"profile_name": "a", "max_pool_connections": 0}, "must be positive"),
+    ({"profile_name": "a", "lock_mode": "governance"}, "lock_mode must be one of"),
+    ({"profile_name": "a", "retry_mode": "fast"}, "retry_mode must be one of"),
+    ({"profile_name": "a", "waiters": {"delays": 1}}, "unknown waiter settings"),
+    ({"profile_name": "a", "waiters": {"skip": "object_exists"}}, "list of waiter names"),
+    ({"profile_name": "a", "waiters": {"skip": [1]}}, "list of waiter names"),
+    ({"profile_name": "a", "waiters": {"skip": ["object_exist"]}}, "unknown waiters to skip"),
+    ({"profile_name": "a", "waiters": {"delay": "0.2"}}, "waiters.delay must be a number"),
+    ({"profile_name": "a", "waiters": {"backoff": True}}, "waiters.backoff must be a number"),
+    ({"profile_name": "a", "waiters": {"max_delay": -1}}, "must not be negative"),
+    ({"profile_name": "a", "waiters": {"initial_delay": [1]}}, "waiters.initial_delay must be a number"),
+    ({"profile_name": "a", "waiters": {"max_attempts": 2.5}}, "waiters.max_attempts must be an integer"),
+    ({"profile_name": "a", "waiters": {"max_attempts": 0}}, "must be positive"),
+    ("br-se1", "expected a mapping"),
+])
+def test_malformed_profiles_are_rejected(record, message):
+    with pytest.raises(ValueError, match=message):
+        TestParams.from_dict({"profiles": [record]})
+
+
+@pytest.mark.parametrize("params, message", [
+    ({"profiles": []}, "non-empty list"),
+    ({"profiles": [{"profile_name": "a"}], "default_profile_index": 1}, "out of the 1 profiles"),
+    ({"profiles": [{"profile_name": "a"}], "default_profile_index": "0"}, "must be an integer"),
+    ({"profiles": [{"profile_name": "a"}], "local_s3": "moto"}, "local_s3 must be a mapping"),
+    ({"profile": [{"profile_name": "a"}]}, "unknown settings"),
+    (None, "expected a mapping"),
+])
+def test_malformed_params_are_rejected(params, message):
+    with pytest.raises(ValueError, match=message):
+        TestParams.from_dict(params)
+
+
+def test_errors_name_the_profile_at_fault():
+    with pytest.raises(ValueError, match=r"profiles\[1\]: lock_mode"):
+        TestParams.from_dict({"profiles": [{"profile_name": "a"}, {"profile_name": "b", "lock_mode": "x"}]})
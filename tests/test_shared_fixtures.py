@@ -0,0 +1,111 @@
+import itertools
+from utils.shared_fixtures import ResettableFixture, group_by_reuse_key, reuse_key
+
+
+class Recorder:
+    """
+    Setup, reset and teardown callables counting numbered instances
+    """
+
+    def __init__(self):
+        self._numbers = itertools.count()
+        self.resets = []
+        self.teardowns = []
+
+    def fixture(self):
+        return ResettableFixture("bucket", lambda: next(self._numbers), self.resets.append, self.teardowns.append)
+
+
+def test_reuse_keys_come_from_the_marked_parameters(pytester):
+    marked, unmarked, unparametrized = pytester.getitems("""
+        import pytest
+
+        @pytest.mark.reuse_fixtures("acl_name")
+        @pytest.mark.parametrize("acl_name, method", [("private", "get")])
+        def test_acl(acl_name, method):
+            pass
+
+        @pytest.mark.parametrize("acl_name", ["private"])
+        def test_unmarked(acl_name):
+            pass
+
+        @pytest.mark.reuse_fixtures("acl_name")
+        def test_list():
+            pass
+    """)
+    assert reuse_key(marked) == (("acl_name", "'private'"),)
+    assert reuse_key(unmarked) is None
+    assert reuse_key(unparametrized) is None
+
+
+def test_tests_sharing_a_key_are_grouped_where_the_first_one_was(pytester):
+    items = pytester.getitems("""
+        import pytest
+
+        @pytest.mark.reuse_fixtures("acl_name")
+        @pytest.mark.parametrize("method", ["get", "put"])
+        @pytest.mark.parametrize("acl_name", ["private", "public"])
+        def test_acl(acl_name, method):
+            pass
+
+        def test_other():
+            pass
+    """)
+    by_name = {item.name: item for item in items}
+    # an order interleaving the acls, e.g. after another plugin sorted the tests by method
+    items = [by_name[name] for name in ("test_acl[private-get]", "test_acl[public-get]", "test_other",
+                                        "test_acl[private-put]", "test_acl[public-put]")]
+
+    assert [item.name for item in group_by_reuse_key(items)] == [
+        "test_acl[private-get]", "test_acl[private-put]",
+        "test_acl[public-get]", "test_acl[public-put]",
+        "test_other",
+    ]
+
+
+def test_instances_are_shared_per_key_and_reset_between_tests():
+    recorder = Recorder()
+    fixture = recorder.fixture()
+    private, public = (("acl_name", "'private'"),), (("acl_name", "'public'"),)
+
+    first = fixture.acquire(private)
+    fixture.release(private, first)
+    assert fixture.acquire(public) != first
+    assert fixture.acquire(private) == first
+
+    assert recorder.resets == [first]
+    assert recorder.teardowns == []
+    assert fixture.summary() == "bucket setups=2 reuses=1"
+
+    fixture.close()
+    assert sorted(recorder.teardowns) == [0, 1]
+
+
+def test_tests_without_a_key_get_an_instance_of_their_own():
+    recorder = Recorder()
+    fixture = recorder.fixture()
+
+    first = fixture.acquire(None)
+    fixture.release(None, first)
+    second = fixture.acquire(None)
+
+    assert first != second
+    assert recorder.teardowns == [first]
+    assert recorder.resets == []
+
+
+def test_close_tears_down_every_instance_despite_errors():
+    torn_down = []
+
+    def teardown(instance):
+        torn_down.append(instance)
+        raise RuntimeError("bucket not empty")
+
+    numbers = itertools.count()
+    fixture = ResettableFixture("bucket", lambda: next(numbers), lambda instance: None, teardown)
+    fixture.acquire(("key", "1"))
+    fixture.acquire(("key", "2"))
+
+    fixture.close()
+
+    assert sorted(torn_down) == [0, 1]
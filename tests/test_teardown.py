@@ -0,0 +1,84 @@
+import threading
+import pytest
+from utils import teardown
+from utils.teardown import DeferredTeardown, defer_or_run
+
+
+class FlakyStep:
+    """
+    Step failing its first failures calls
+    """
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError(f"call {self.calls} reset")
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    calls = []
+
+    def backoff_delay(attempt, base_delay, max_delay):
+        calls.append((attempt, base_delay, max_delay))
+        return 0
+
+    monkeypatch.setattr(teardown, "backoff_delay", backoff_delay)
+    return calls
+
+
+def test_failed_steps_are_retried_with_backoff(delays):
+    deferred = DeferredTeardown(workers=2, max_attempts=4, base_delay=0.5, max_delay=8)
+    first, second = FlakyStep(0), FlakyStep(2)
+
+    deferred.submit("bucket a", first, second)
+    failures = deferred.drain()
+
+    assert failures == []
+    # the step that succeeded is not run again when the next one is retried
+    assert (first.calls, second.calls) == (1, 3)
+    assert delays == [(1, 0.5, 8), (2, 0.5, 8)]
+    assert (deferred.submitted, deferred.done, deferred.retries, deferred.outstanding) == (1, 1, 2, 0)
+
+
+def test_a_step_failing_every_attempt_is_reported(delays):
+    deferred = DeferredTeardown(workers=2, max_attempts=3)
+    failing, after = FlakyStep(10), FlakyStep(0)
+
+    deferred.submit("bucket a", failing, after)
+    deferred.submit("bucket b", FlakyStep(0))
+    failures = deferred.drain()
+
+    assert failures == [("bucket a", "ConnectionError('call 3 reset')")]
+    assert (failing.calls, after.calls) == (3, 0)
+    assert len(delays) == 2
+    assert "submitted=2 done=1 failed=1 retries=2" in deferred.summary()
+
+
+def test_drain_waits_for_the_running_teardowns():
+    deferred = DeferredTeardown(workers=4)
+    release = threading.Event()
+    finished = []
+
+    def step(index):
+        release.wait(5)
+        finished.append(index)
+
+    for index in range(8):
+        deferred.submit(f"bucket {index}", lambda index=index: step(index))
+    assert deferred.outstanding == 8 and not finished
+    release.set()
+    deferred.drain()
+
+    assert sorted(finished) == list(range(8))
+    assert deferred.outstanding == 0
+
+
+def test_without_a_queue_the_steps_run_inline():
+    calls = []
+    defer_or_run(None, "bucket a", lambda: calls.append("objects"), lambda: calls.append("bucket"))
+    assert calls == ["objects", "bucket"]
@@ -0,0 +1,60 @@
+import sqlite3
+from botocore.stub import Stubber
+from utils.clients import ClientRegistry
+from utils.tenants import TenantCache, credentials_key
+
+PROFILE = {"region_name": "br-se1", "endpoint_url": "https://s3.example.com",
+           "aws_access_key_id": "AKIDEXAMPLE", "aws_secret_access_key": "secret"}
+
+
+def owner_listing(tenant):
+    return {"Owner": {"ID": tenant}, "Buckets": []}
+
+
+def test_a_tenant_is_listed_once_per_session():
+    client = ClientRegistry().client_for(PROFILE)
+    cache = TenantCache()
+
+    with Stubber(client) as stubber:
+        stubber.add_response("list_buckets", owner_listing("tenant-a"), {"MaxBuckets": 1})
+        assert [cache.tenant_of(client) for _ in range(3)] == ["tenant-a"] * 3
+        stubber.assert_no_pending_responses()
+
+    assert (cache.misses, cache.hits) == (1, 2)
+
+
+def test_the_file_shares_tenants_until_the_ttl_expires(tmp_path):
+    db_path = str(tmp_path / "tenants.sqlite")
+    client = ClientRegistry().client_for(PROFILE)
+
+    with Stubber(client) as stubber:
+        stubber.add_response("list_buckets", owner_listing("tenant-a"), {"MaxBuckets": 1})
+        TenantCache(db_path).tenant_of(client)
+        # another worker, or the next run
+        later = TenantCache(db_path)
+        assert later.tenant_of(client) == "tenant-a"
+        assert (later.misses, later.hits) == (0, 1)
+
+        stubber.add_response("list_buckets", owner_listing("tenant-b"), {"MaxBuckets": 1})
+        expired = TenantCache(db_path, ttl=0)
+        assert expired.tenant_of(client) == "tenant-b"
+        stubber.assert_no_pending_responses()
+
+
+def test_tenants_are_kept_per_account_without_their_keys(tmp_path):
+    db_path = str(tmp_path / "tenants.sqlite")
+    registry = ClientRegistry()
+    client = registry.client_for(PROFILE)
+    other = registry.client_for(dict(PROFILE, aws_access_key_id="AKIDOTHER"))
+    cache = TenantCache(db_path)
+
+    with Stubber(client) as stubber, Stubber(other) as other_stubber:
+        stubber.add_response("list_buckets", owner_listing("tenant-a"), {"MaxBuckets": 1})
+        other_stubber.add_response("list_buckets", owner_listing("tenant-b"), {"MaxBuckets": 1})
+        assert (cache.tenant_of(client), cache.tenant_of(other)) == ("tenant-a", "tenant-b")
+
+    assert credentials_key(client) != credentials_key(other)
+    with sqlite3.connect(db_path) as db:
+        rows = db.execute("SELECT key, tenant FROM tenants").fetchall()
+    assert sorted(tenant for _, tenant in rows) == ["tenant-a", "tenant-b"]
+    assert not any("AKID" in key for key, _ in rows)
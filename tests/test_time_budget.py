@@ -0,0 +1,152 @@
+from utils.time_budget import TimeBudget, shared_fixture_key
+
+
+def collect(pytester, **modules):
+    """
+    Write the spec modules and collect their tests
+    """
+    pytester.makepyfile(**modules)
+    items, _ = pytester.inline_genitems()
+    return items
+
+
+def nodeids(items):
+    return [item.nodeid for item in items]
+
+
+def test_every_feature_marker_is_covered_even_over_budget(pytester):
+    items = collect(
+        pytester,
+        acl_test="""
+            import pytest
+
+            @pytest.mark.acl
+            @pytest.mark.slow
+            def test_slow_acl():
+                pass
+
+            @pytest.mark.acl
+            @pytest.mark.rapid
+            def test_fast_acl():
+                pass
+        """,
+        locking_test="""
+            import pytest
+
+            @pytest.mark.locking
+            @pytest.mark.slow
+            def test_lock():
+                pass
+        """,
+        basic_test="""
+            import pytest
+
+            @pytest.mark.rapid
+            def test_list():
+                pass
+        """,
+    )
+    budget = TimeBudget(10)
+
+    selected, deselected = budget.select(items)
+
+    # the cheapest acl test, and the only locking one although it alone exceeds the budget
+    assert nodeids(selected) == ["acl_test.py::test_fast_acl", "locking_test.py::test_lock"]
+    assert nodeids(deselected) == ["acl_test.py::test_slow_acl", "basic_test.py::test_list"]
+    assert budget.covered == {"acl", "locking"}
+    assert "not collected: bucket_versioning, cold_storage, policy, presign" in budget.summary()
+
+
+def test_tests_covering_more_markers_per_second_are_preferred(pytester):
+    items = collect(pytester, presign_test="""
+        import pytest
+
+        @pytest.mark.acl
+        def test_acl():
+            pass
+
+        @pytest.mark.presign
+        def test_presign():
+            pass
+
+        @pytest.mark.acl
+        @pytest.mark.presign
+        def test_presigned_acl():
+            pass
+    """)
+
+    selected, _ = TimeBudget(0).select(items)
+
+    assert nodeids(selected) == ["presign_test.py::test_presigned_acl"]
+
+
+def test_the_remaining_budget_is_spread_over_the_specs(pytester):
+    source = """
+        import pytest
+
+        @pytest.mark.rapid
+        @pytest.mark.parametrize("index", range(5))
+        def test_rapid(index):
+            pass
+    """
+    items = collect(pytester, a_test=source, b_test=source)
+
+    selected, _ = TimeBudget(4).select(items)
+
+    assert nodeids(selected) == ["a_test.py::test_rapid[0]", "a_test.py::test_rapid[1]",
+                                 "b_test.py::test_rapid[0]", "b_test.py::test_rapid[1]"]
+
+
+def test_recorded_durations_and_workers_change_the_selection(pytester):
+    items = collect(pytester, a_test="""
+        import pytest
+
+        @pytest.mark.rapid
+        def test_long():
+            pass
+
+        @pytest.mark.slow
+        def test_short():
+            pass
+    """)
+    durations = {"a_test.py::test_long": 50.0, "a_test.py::test_short": 5.0}
+
+    budget = TimeBudget(20, workers=3)
+    selected, _ = budget.select(items, durations)
+
+    assert nodeids(selected) == ["a_test.py::test_long", "a_test.py::test_short"]
+    assert budget.estimated_seconds == 55.0
+    assert budget.with_history == 2
+    assert nodeids(TimeBudget(20).select(items, durations)[0]) == ["a_test.py::test_short"]
+
+
+def test_tests_sharing_module_fixtures_are_kept_together(pytester):
+    items = collect(pytester, a_test="""
+        import pytest
+
+        @pytest.fixture(scope="module", params=["b1", "b2"])
+        def bucket(request):
+            return request.param
+
+        @pytest.fixture
+        def key():
+            return "key"
+
+        @pytest.mark.rapid
+        def test_x(bucket, key):
+            pass
+
+        @pytest.mark.rapid
+        def test_y(bucket):
+            pass
+    """)
+    assert shared_fixture_key(items[0]) == (("bucket", 0),)
+    # interleave the buckets, as an order that does not follow the fixtures would
+    interleaved = sorted(items, key=lambda item: item.name.startswith("test_y"))
+    assert nodeids(interleaved) == ["a_test.py::test_x[b1]", "a_test.py::test_x[b2]",
+                                    "a_test.py::test_y[b1]", "a_test.py::test_y[b2]"]
+
+    selected, _ = TimeBudget(100).select(interleaved)
+
+    assert nodeids(selected) == ["a_test.py::test_x[b1]", "a_test.py::test_y[b1]",
+                                 "a_test.py::test_x[b2]", "a_test.py::test_y[b2]"]
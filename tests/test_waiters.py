@@ -0,0 +1,48 @@
+import pytest
+from botocore.exceptions import WaiterError
+from botocore.stub import Stubber
+from utils import consistency
+from utils.clients import ClientRegistry
+from utils.waiters import DEFAULT_WAITER_CONFIG, wait, waiter_config
+
+PROFILE = {"region_name": "br-se1", "endpoint_url": "https://s3.example.com",
+           "aws_access_key_id": "key", "aws_secret_access_key": "secret",
+           "waiters": {"delay": 0, "max_attempts": 3, "skip": ["object_exists"]}}
+
+
+@pytest.fixture
+def s3_client():
+    return ClientRegistry().client_for(PROFILE)
+
+
+def test_the_profile_sets_the_waiter_curve(s3_client):
+    assert waiter_config(s3_client) == {**DEFAULT_WAITER_CONFIG, **PROFILE["waiters"]}
+    assert waiter_config(ClientRegistry().client_for(dict(PROFILE, waiters={}))) == DEFAULT_WAITER_CONFIG
+
+
+def test_the_waiter_polls_until_the_expected_state(s3_client):
+    with Stubber(s3_client) as stubber:
+        stubber.add_client_error("head_bucket", service_error_code="404", http_status_code=404)
+        stubber.add_response("head_bucket", {})
+        wait(s3_client, "bucket_exists", Bucket="bucket")
+        stubber.assert_no_pending_responses()
+
+    recorded = consistency.convergence_history[-1]
+    assert (recorded.name, recorded.converged, recorded.probes) == ("waiter_bucket_exists", True, 2)
+
+
+def test_the_waiter_gives_up_after_max_attempts(s3_client):
+    with Stubber(s3_client) as stubber:
+        for _ in range(3):
+            stubber.add_response("head_object", {})
+        with pytest.raises(WaiterError, match="Max attempts exceeded"):
+            wait(s3_client, "object_not_exists", Bucket="bucket", Key="key")
+        stubber.assert_no_pending_responses()
+
+    assert consistency.convergence_history[-1].converged is False
+
+
+def test_skipped_waiters_make_no_request(s3_client):
+    with Stubber(s3_client) as stubber:
+        wait(s3_client, "object_exists", Bucket="bucket", Key="key")
+        stubber.assert_no_pending_responses()